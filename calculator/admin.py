@@ -1,11 +1,13 @@
 from django.contrib import admin
-from .models import EnergyProfile, PVSystem, BESSSystem, FinancialParameters, CalculationResult
+from .models import (EnergyProfile, PVSystem, BESSSystem, FinancialParameters, CalculationResult,
+                     PortfolioRun, PortfolioResult)
 
 
 @admin.register(EnergyProfile)
 class EnergyProfileAdmin(admin.ModelAdmin):
     list_display = ['name', 'user', 'annual_consumption', 'peak_demand', 'created_at']
     list_filter = ['created_at', 'user']
+    list_select_related = ['user']
     search_fields = ['name', 'user__username']
     readonly_fields = ['annual_consumption']
     
@@ -28,13 +30,14 @@ class EnergyProfileAdmin(admin.ModelAdmin):
 
 @admin.register(PVSystem)
 class PVSystemAdmin(admin.ModelAdmin):
-    list_display = ['name', 'system_size_kw', 'latitude', 'longitude', 'tilt_angle', 'created_at']
-    list_filter = ['created_at']
-    search_fields = ['name']
+    list_display = ['name', 'user', 'system_size_kw', 'latitude', 'longitude', 'tilt_angle', 'created_at']
+    list_filter = ['created_at', 'user']
+    list_select_related = ['user']
+    search_fields = ['name', 'user__username']
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('name', 'system_size_kw')
+            'fields': ('name', 'user', 'system_size_kw')
         }),
         ('Efficiency', {
             'fields': ('panel_efficiency', 'inverter_efficiency', 'system_efficiency')
@@ -50,13 +53,14 @@ class PVSystemAdmin(admin.ModelAdmin):
 
 @admin.register(BESSSystem)
 class BESSSystemAdmin(admin.ModelAdmin):
-    list_display = ['name', 'capacity_kwh', 'usable_capacity_kwh', 'control_strategy', 'created_at']
-    list_filter = ['control_strategy', 'created_at']
-    search_fields = ['name']
+    list_display = ['name', 'user', 'capacity_kwh', 'usable_capacity_kwh', 'control_strategy', 'created_at']
+    list_filter = ['control_strategy', 'created_at', 'user']
+    list_select_related = ['user']
+    search_fields = ['name', 'user__username']
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('name', 'capacity_kwh', 'usable_capacity_kwh')
+            'fields': ('name', 'user', 'capacity_kwh', 'usable_capacity_kwh')
         }),
         ('Power Ratings', {
             'fields': ('max_charge_rate_kw', 'max_discharge_rate_kw')
@@ -72,13 +76,14 @@ class BESSSystemAdmin(admin.ModelAdmin):
 
 @admin.register(FinancialParameters)
 class FinancialParametersAdmin(admin.ModelAdmin):
-    list_display = ['name', 'electricity_rate', 'pv_cost_per_kw', 'bess_cost_per_kwh', 'created_at']
-    list_filter = ['created_at']
-    search_fields = ['name']
+    list_display = ['name', 'user', 'electricity_rate', 'pv_cost_per_kw', 'bess_cost_per_kwh', 'created_at']
+    list_filter = ['created_at', 'user']
+    list_select_related = ['user']
+    search_fields = ['name', 'user__username']
     
     fieldsets = (
         ('Basic Information', {
-            'fields': ('name',)
+            'fields': ('name', 'user')
         }),
         ('System Costs', {
             'fields': ('pv_cost_per_kw', 'bess_cost_per_kwh', 'installation_cost_percent')
@@ -99,6 +104,7 @@ class FinancialParametersAdmin(admin.ModelAdmin):
 class CalculationResultAdmin(admin.ModelAdmin):
     list_display = ['name', 'user', 'payback_period_years', 'annual_savings', 'total_system_cost', 'created_at']
     list_filter = ['created_at', 'user']
+    list_select_related = ['user']
     search_fields = ['name', 'user__username']
     readonly_fields = ['created_at']
     
@@ -118,7 +124,39 @@ class CalculationResultAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        # The interval blob is only needed by chart/export endpoints
+        return super().get_queryset(request).defer('interval_results')
+    
     def get_readonly_fields(self, request, obj=None):
         if obj:  # Editing an existing object
             return self.readonly_fields + ('energy_profile', 'pv_system', 'bess_system', 'financial_params')
-        return self.readonly_fields 
\ No newline at end of file
+        return self.readonly_fields 
+
+
+class PortfolioResultInline(admin.TabularInline):
+    model = PortfolioResult
+    fields = ['rank', 'energy_profile', 'payback_period_years', 'npv_25_years', 'annual_savings']
+    readonly_fields = fields
+    ordering = ['rank']
+    extra = 0
+    max_num = 0
+    can_delete = False
+    show_change_link = False
+    
+    def get_queryset(self, request):
+        # Runs can hold tens of thousands of rows; show the best ones only
+        queryset = super().get_queryset(request).select_related('energy_profile')
+        return queryset.filter(rank__lte=100)
+
+
+@admin.register(PortfolioRun)
+class PortfolioRunAdmin(admin.ModelAdmin):
+    list_display = ['name', 'user', 'profile_count', 'qualifying_count', 'max_payback_years',
+                    'duration_seconds', 'created_at']
+    list_filter = ['created_at', 'user']
+    list_select_related = ['user']
+    search_fields = ['name', 'user__username']
+    readonly_fields = ['created_at', 'profile_count', 'qualifying_count', 'duration_seconds']
+    raw_id_fields = ['pv_system', 'bess_system', 'financial_params']
+    inlines = [PortfolioResultInline]
@@ -0,0 +1,226 @@
+"""
+Vectorized (NumPy) counterparts of the scalar engines in calculator.utils.
+
+Every argument may be a scalar or an array; arrays broadcast against each
+other and each output element matches what the scalar function returns
+for the corresponding inputs.
+
+The engines compute in float64 unless given ``dtype=np.float32``.
+batch_dtype() applies the CALCULATOR_BATCH_PRECISION policy: single
+interactive runs stay float64, while 'auto' moves batches of at least
+CALCULATOR_FLOAT32_MIN_ELEMENTS values to float32, halving their memory.
+``python manage.py precision`` measures what that costs in accuracy.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .weather import library, pv_profile
+
+
+# Same sentinel the scalar engines use for "never pays back"
+NO_PAYBACK = 999999
+
+PRECISIONS = {'float64': np.float64, 'float32': np.float32}
+DEFAULT_FLOAT32_MIN_ELEMENTS = 1_000_000
+
+
+def batch_dtype(elements: int = 0, precision: Optional[str] = None) -> np.dtype:
+    """
+    Float dtype for a batch holding ``elements`` values per array.
+    ``precision`` overrides CALCULATOR_BATCH_PRECISION ('auto', 'float64'
+    or 'float32').
+    """
+    if precision is None:
+        precision = getattr(settings, 'CALCULATOR_BATCH_PRECISION', 'auto')
+    if precision == 'auto':
+        threshold = getattr(settings, 'CALCULATOR_FLOAT32_MIN_ELEMENTS', DEFAULT_FLOAT32_MIN_ELEMENTS)
+        return np.dtype(np.float32 if elements >= threshold else np.float64)
+    if precision not in PRECISIONS:
+        raise ImproperlyConfigured(
+            f"CALCULATOR_BATCH_PRECISION must be 'auto' or one of {sorted(PRECISIONS)}")
+    return np.dtype(PRECISIONS[precision])
+
+
+def financial_metrics_batch(pv_size_kw, bess_capacity_kwh, annual_savings,
+                            pv_cost_per_kw=2000, bess_cost_per_kwh=500,
+                            installation_cost_percent=0.10, federal_tax_credit=0.30,
+                            state_incentive=0.0, discount_rate=0.05,
+                            electricity_inflation=0.03, system_lifetime=25,
+                            dtype=np.float64) -> Dict[str, np.ndarray]:
+    """Batch version of calculate_financial_metrics"""
+    pv_size_kw, bess_capacity_kwh, annual_savings, pv_cost_per_kw, bess_cost_per_kwh, \
+        installation_cost_percent, federal_tax_credit, state_incentive, discount_rate, \
+        electricity_inflation, system_lifetime = np.broadcast_arrays(
+            *[np.asarray(value, dtype=dtype) for value in (
+                pv_size_kw, bess_capacity_kwh, annual_savings, pv_cost_per_kw, bess_cost_per_kwh,
+                installation_cost_percent, federal_tax_credit, state_incentive, discount_rate,
+                electricity_inflation, system_lifetime)])
+    lifetime_years = system_lifetime
+    system_lifetime = system_lifetime.astype(np.int64)
+
+    total_hardware_cost = pv_size_kw * pv_cost_per_kw + bess_capacity_kwh * bess_cost_per_kwh
+    total_system_cost = total_hardware_cost + total_hardware_cost * installation_cost_percent
+
+    federal_credit = total_system_cost * federal_tax_credit
+    state_credit = bess_capacity_kwh * state_incentive
+    net_system_cost = total_system_cost - federal_credit - state_credit
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        payback = np.where(annual_savings > 0, net_system_cost / annual_savings, NO_PAYBACK)
+
+    # Discounted, inflated savings for years 1..lifetime; rows past a
+    # scenario's own lifetime are masked out
+    max_lifetime = int(system_lifetime.max()) if system_lifetime.size else 0
+    years = np.arange(1, max_lifetime + 1, dtype=dtype).reshape((-1,) + (1,) * system_lifetime.ndim)
+    factors = (1 + electricity_inflation) ** (years - 1) / (1 + discount_rate) ** years
+    factors = np.where(years <= system_lifetime, factors, 0.0)
+    npv = -net_system_cost + annual_savings * factors.sum(axis=0)
+
+    # Same simplified IRR approximation as the scalar engine
+    with np.errstate(divide='ignore', invalid='ignore'):
+        irr = (npv / net_system_cost) ** (1 / lifetime_years) - 1
+    irr_percent = np.where(npv > 0, irr * 100, -100.0)
+
+    return {
+        'total_system_cost': total_system_cost,
+        'net_system_cost': net_system_cost,
+        'annual_savings': annual_savings,
+        'payback_period_years': payback,
+        'npv_25_years': npv,
+        'irr_percent': irr_percent,
+        'federal_credit': federal_credit,
+        'state_credit': state_credit,
+    }
+
+
+# Monthly solar radiation (kWh/m²/day) per latitude band, as in calculate_pv_production
+SOLAR_RADIATION = np.array([
+    [4.5, 5.2, 5.8, 6.2, 6.5, 6.8, 6.9, 6.7, 6.2, 5.5, 4.8, 4.2],  # 0-30°
+    [3.8, 4.5, 5.2, 5.8, 6.2, 6.5, 6.6, 6.4, 5.8, 5.0, 4.2, 3.5],  # 30-45°
+    [2.8, 3.5, 4.2, 5.0, 5.8, 6.2, 6.3, 6.0, 5.2, 4.2, 3.2, 2.5],  # 45-60°
+])
+DAYS_PER_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.float64)
+STRATEGY_CODES = {'self_consumption': 0, 'time_of_use': 1, 'peak_shaving': 2}
+
+
+def pv_production_batch(pv_size_kw, latitude, tilt_angle=30, azimuth=180,
+                        system_efficiency=0.75, longitude=None, dtype=np.float64) -> np.ndarray:
+    """
+    Batch version of calculate_pv_production.
+    Returns monthly production with shape (..., 12) for the broadcast inputs.
+    Local weather stations are only looked up when ``longitude`` is given.
+    """
+    pv_size_kw, latitude, tilt_angle, azimuth, system_efficiency = np.broadcast_arrays(
+        *[np.asarray(value, dtype=dtype)
+          for value in (pv_size_kw, latitude, tilt_angle, azimuth, system_efficiency)])
+    weather = _weather_pv_per_kw(latitude, longitude, tilt_angle, azimuth) if longitude is not None else None
+
+    abs_lat = np.abs(latitude)
+    band = np.where(abs_lat <= 30, 0, np.where(abs_lat <= 45, 1, 2))
+    radiation = SOLAR_RADIATION.astype(dtype, copy=False)[band]  # (..., 12)
+
+    tilt_factor = 1.0 + 0.1 * (tilt_angle - 30) / 30
+    azimuth_factor = 1.0 - 0.1 * np.abs(azimuth - 180) / 180
+    daily_production = radiation * (tilt_factor * azimuth_factor * system_efficiency)[..., None]
+    production = daily_production * DAYS_PER_MONTH.astype(dtype, copy=False) * pv_size_kw[..., None]
+    if weather is not None:
+        weather = weather.astype(dtype, copy=False)
+        production = np.where(np.isnan(weather), production,
+                              weather * system_efficiency[..., None] * pv_size_kw[..., None])
+    return production
+
+
+def _weather_pv_per_kw(latitude, longitude, tilt_angle, azimuth):
+    """
+    (..., 12) per-kW monthly PV from local weather stations (see
+    calculator.weather), NaN where there is none; None if no station applies.
+    """
+    if not len(library()):
+        return None
+    latitude, longitude, tilt_angle, azimuth = np.broadcast_arrays(
+        latitude, np.asarray(longitude, dtype=np.float64), tilt_angle, azimuth)
+    sites = np.stack([latitude, longitude, tilt_angle, azimuth], axis=-1).reshape(-1, 4)
+    unique, inverse = np.unique(sites, axis=0, return_inverse=True)
+    per_kw = np.full((len(unique), 12), np.nan)
+    for i, site in enumerate(unique):
+        profile = pv_profile(*site)
+        if profile is not None:
+            per_kw[i] = profile.monthly_kwh
+    if np.isnan(per_kw).all():
+        return None
+    return per_kw[inverse.ravel()].reshape(latitude.shape + (12,))
+
+
+def bess_operation_batch(monthly_consumption, monthly_pv_production,
+                         bess_capacity_kwh, usable_capacity_kwh,
+                         max_charge_rate_kw, max_discharge_rate_kw,
+                         round_trip_efficiency=0.90,
+                         control_strategy='self_consumption',
+                         monthly_peak_demand=None, dtype=np.float64) -> Dict[str, np.ndarray]:
+    """
+    Batch version of calculate_bess_operation.
+    ``monthly_consumption``, ``monthly_pv_production`` and
+    ``monthly_peak_demand`` (0 where unknown) have shape (..., 12); the
+    scalar parameters (and ``control_strategy``, as names) broadcast over
+    the leading dimensions.
+    """
+    consumption = np.asarray(monthly_consumption, dtype=dtype)
+    pv_production = np.asarray(monthly_pv_production, dtype=dtype)
+    consumption, pv_production = np.broadcast_arrays(consumption, pv_production)
+    strategy = np.vectorize(STRATEGY_CODES.__getitem__, otypes=[np.int64])(
+        np.asarray(control_strategy, dtype=object))
+
+    def per_row(value):
+        return np.asarray(value, dtype=dtype)[..., None]
+
+    usable = per_row(usable_capacity_kwh)
+    max_charge = per_row(max_charge_rate_kw)
+    max_discharge = per_row(max_discharge_rate_kw)
+    efficiency = per_row(round_trip_efficiency)
+    strategy = strategy[..., None]
+
+    days = DAYS_PER_MONTH.astype(dtype, copy=False)
+    daily_consumption = consumption / days
+    daily_pv = pv_production / days
+
+    # self_consumption
+    sc_charge = np.minimum(np.minimum(np.maximum(0, daily_pv - daily_consumption),
+                                      max_charge * 24), usable)
+    sc_discharge = np.minimum(np.minimum(daily_consumption - daily_pv, max_discharge * 24),
+                              sc_charge * efficiency)
+    sc_grid = daily_consumption - daily_pv - sc_discharge
+
+    # time_of_use: 40% of consumption in 6 peak hours, charge over 18 off-peak hours
+    peak_consumption = daily_consumption * 0.4
+    off_peak_consumption = daily_consumption * 0.6
+    tou_charge = np.minimum(max_charge * 18, usable)
+    tou_discharge = np.minimum(np.minimum(peak_consumption, max_discharge * 6),
+                               tou_charge * efficiency)
+    tou_grid = off_peak_consumption + (peak_consumption - tou_discharge)
+
+    # peak_shaving
+    peak_demand = daily_consumption / 24
+    if monthly_peak_demand is not None:
+        measured = np.asarray(monthly_peak_demand, dtype=dtype)
+        peak_demand = np.where(measured > 0, measured, peak_demand)
+    target_peak = peak_demand * 0.8
+    ps_discharge = np.minimum(peak_demand - target_peak, max_discharge * 24)
+    ps_charge = np.minimum(np.minimum(daily_pv, max_charge * 24), usable)
+    ps_grid = daily_consumption - daily_pv - ps_discharge
+
+    choices = [strategy == 0, strategy == 1, strategy == 2]
+    bess_charge = np.select(choices, [sc_charge, tou_charge, ps_charge])
+    bess_discharge = np.select(choices, [sc_discharge, tou_discharge, ps_discharge])
+    grid_energy = np.select(choices, [sc_grid, tou_grid, ps_grid])
+    savings = daily_consumption - grid_energy
+
+    monthly_savings = savings * days
+    return {
+        'monthly_savings': monthly_savings,
+        'monthly_bess_energy': (bess_charge + bess_discharge) * days / 2,
+        'monthly_grid_energy': grid_energy * days,
+        'total_savings': monthly_savings.sum(axis=-1),
+    }
@@ -0,0 +1,228 @@
+"""
+Net-metering bills from interval import/export data.
+
+Two California-style tariffs are modelled on the same interval arrays:
+
+* NEM 2.0: exports are credited at the retail TOU rate of the interval they
+  happen in, less the non-bypassable charges (NBCs), and energy charges and
+  credits net over the 12-month true-up. The NBCs are part of every retail
+  import rate; exports just can't offset them.
+* NEM 3.0 (net billing): imports are billed at retail, exports are credited
+  at separate hourly export prices (by month and hour of day), and credits
+  roll forward to the true-up.
+
+Under both, a credit left at true-up is forfeited apart from the net
+surplus compensation paid on surplus kWh. Intervals are grouped into
+months and priced by hour with bincount and fancy indexing, so a year of
+15-minute data takes a few milliseconds. Weights let the same code bill
+the representative days from calculator.hourly.
+
+Without exports both tariffs produce the same bill: imports are billed
+at the same retail rates under each.
+
+When the upload has a Received column, the metered intervals themselves
+are billed too (bill_parsed), which prices the customer's history under
+each tariff.
+"""
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from .hourly import simulate_hourly
+from .loadshape import HOURS, MONTHS, to_minutes
+
+
+# Hours (start) billed at the peak rate
+TOU_PEAK_HOURS = range(16, 21)
+# Net surplus compensation, $/kWh paid for surplus energy at true-up
+DEFAULT_NSC_RATE = 0.04
+# Non-bypassable charges, $/kWh included in the retail rates; NEM 2.0 export
+# credits are the retail rate less this
+DEFAULT_NBC_RATE = 0.03
+
+
+def _default_export_rates() -> np.ndarray:
+    """
+    Illustrative NEM 3.0 export prices, $/kWh by month and hour: low midday
+    value, higher 4-9pm and highest on late-summer evenings. Pass real
+    avoided-cost values to Tariff where they are known.
+    """
+    rates = np.full((MONTHS, HOURS), 0.05)
+    rates[:, list(TOU_PEAK_HOURS)] = 0.10
+    rates[6:9, list(TOU_PEAK_HOURS)] = 0.30  # Jul-Sep
+    return rates
+
+
+DEFAULT_EXPORT_RATES = _default_export_rates()
+
+
+class Tariff:
+    """
+    import_rates: (12, 24) retail $/kWh by month and hour of day
+    export_rates: (12, 24) NEM 3.0 export credit $/kWh
+    """
+
+    def __init__(self, import_rates, export_rates=None, nsc_rate: float = DEFAULT_NSC_RATE,
+                 nbc_rate: float = DEFAULT_NBC_RATE, fixed_monthly: float = 0.0):
+        self.import_rates = np.broadcast_to(np.asarray(import_rates, dtype=np.float64), (MONTHS, HOURS))
+        if export_rates is None:
+            export_rates = DEFAULT_EXPORT_RATES
+        self.export_rates = np.broadcast_to(np.asarray(export_rates, dtype=np.float64), (MONTHS, HOURS))
+        self.nsc_rate = nsc_rate
+        self.nbc_rate = nbc_rate
+        self.fixed_monthly = fixed_monthly
+
+    @classmethod
+    def flat(cls, rate: float, **kwargs) -> 'Tariff':
+        return cls(np.full((MONTHS, HOURS), rate), **kwargs)
+
+    @classmethod
+    def time_of_use(cls, peak_rate: float, off_peak_rate: float,
+                    peak_hours: Sequence[int] = TOU_PEAK_HOURS, **kwargs) -> 'Tariff':
+        rates = np.full((MONTHS, HOURS), off_peak_rate)
+        rates[:, list(peak_hours)] = peak_rate
+        return cls(rates, **kwargs)
+
+    @classmethod
+    def from_financial_params(cls, financial_params, **kwargs) -> 'Tariff':
+        """TOU tariff from the peak/off-peak rates on FinancialParameters"""
+        return cls.time_of_use(financial_params.peak_rate, financial_params.off_peak_rate, **kwargs)
+
+
+def interval_index(timestamps):
+    """(month 0-11, hour 0-23) arrays for interval start datetimes"""
+    minutes = to_minutes(timestamps)
+    month = minutes.astype('datetime64[M]').astype(np.int64) % 12
+    hour = (minutes - minutes.astype('datetime64[D]')).astype(np.int64) // 60
+    return month, hour
+
+
+def _month_sums(month: np.ndarray, values: np.ndarray) -> np.ndarray:
+    return np.bincount(month, weights=values, minlength=MONTHS)
+
+
+def _bill(month, hour, grid_import, grid_export, tariff: Tariff, export_prices: np.ndarray,
+          weights) -> Dict:
+    grid_import = np.asarray(grid_import, dtype=np.float64)
+    grid_export = np.asarray(grid_export, dtype=np.float64)
+    if weights is not None:
+        grid_import = grid_import * weights
+        grid_export = grid_export * weights
+
+    import_kwh = _month_sums(month, grid_import)
+    export_kwh = _month_sums(month, grid_export)
+    charges = _month_sums(month, grid_import * tariff.import_rates[month, hour])
+    credits = _month_sums(month, grid_export * export_prices[month, hour])
+    fixed = np.full(MONTHS, tariff.fixed_monthly)
+
+    # Monthly statements carry the energy balance forward; fixed charges are
+    # due every month regardless of credits
+    energy_balance = np.cumsum(charges - credits)
+    net_energy = float(energy_balance[-1])
+    surplus_kwh = max(float(export_kwh.sum() - import_kwh.sum()), 0.0)
+    true_up = max(net_energy, 0.0)
+    nsc_credit = surplus_kwh * tariff.nsc_rate
+
+    return {
+        'monthly_import_kwh': import_kwh.tolist(),
+        'monthly_export_kwh': export_kwh.tolist(),
+        'monthly_energy_charges': charges.tolist(),
+        'monthly_export_credits': credits.tolist(),
+        'monthly_fixed': fixed.tolist(),
+        'running_energy_balance': energy_balance.tolist(),
+        'true_up': true_up,
+        'forfeited_credit': max(-net_energy, 0.0),
+        'nsc_credit': nsc_credit,
+        'annual_bill': float(fixed.sum()) + true_up - nsc_credit,
+    }
+
+
+def bill_nem2(month, hour, grid_import, grid_export, tariff: Tariff,
+              weights: Optional[np.ndarray] = None) -> Dict:
+    """NEM 2.0 bill; exports valued at the interval's retail rate less the NBCs"""
+    export_prices = np.maximum(tariff.import_rates - tariff.nbc_rate, 0.0)
+    return _bill(month, hour, grid_import, grid_export, tariff, export_prices, weights)
+
+
+def bill_nem3(month, hour, grid_import, grid_export, tariff: Tariff,
+              weights: Optional[np.ndarray] = None) -> Dict:
+    """NEM 3.0 net-billing bill; exports valued at the tariff's export prices"""
+    return _bill(month, hour, grid_import, grid_export, tariff, tariff.export_rates, weights)
+
+
+def bill_intervals(timestamps, grid_import, grid_export, tariff: Tariff) -> Dict[str, Dict]:
+    """Both bills for metered or simulated interval data (kWh per interval)"""
+    month, hour = interval_index(timestamps)
+    return {
+        'nem2': bill_nem2(month, hour, grid_import, grid_export, tariff),
+        'nem3': bill_nem3(month, hour, grid_import, grid_export, tariff),
+    }
+
+
+def bill_parsed(parsed_data: Dict, tariff: Tariff) -> Optional[Dict[str, Dict]]:
+    """
+    Both bills for a parse_energy_data_file result, using its Delivered and
+    Received columns. None without interval times.
+    """
+    timestamps = parsed_data.get('timestamps')
+    delivered = parsed_data.get('values')
+    if timestamps is None or delivered is None or len(timestamps) == 0 or len(timestamps) != len(delivered):
+        return None
+    received = parsed_data.get('received')
+    if received is None or len(received) != len(delivered):
+        received = np.zeros(len(delivered))
+    return bill_intervals(timestamps, delivered, received, tariff)
+
+
+def bill_representative_days(hourly: Dict[str, np.ndarray], day_weights: np.ndarray,
+                             tariff: Tariff) -> Dict[str, Dict]:
+    """
+    Both bills for the (12, 2, 24) kW arrays of calculator.hourly.simulate_hourly,
+    each hour weighted by the days its representative day stands for.
+    """
+    shape = hourly['grid_import_kw'].shape
+    month = np.broadcast_to(np.arange(MONTHS)[:, None, None], shape).ravel()
+    hour = np.broadcast_to(np.arange(HOURS), shape).ravel()
+    weights = np.broadcast_to(day_weights[:, :, None], shape).ravel()
+    grid_import = hourly['grid_import_kw'].ravel()
+    grid_export = hourly['grid_export_kw'].ravel()
+    return {
+        'nem2': bill_nem2(month, hour, grid_import, grid_export, tariff, weights),
+        'nem3': bill_nem3(month, hour, grid_import, grid_export, tariff, weights),
+    }
+
+
+def net_billing_savings(load_shape, pv_system, bess_system, financial_params,
+                        parsed_data: Optional[Dict] = None) -> Optional[Dict[str, Dict]]:
+    """
+    Annual bill before and after the system under each tariff, simulated
+    hourly from the profile's load shape. None without a load shape.
+    With ``parsed_data`` that has a Received column, each tariff also gets
+    'metered_bill': the uploaded intervals billed as they are.
+    """
+    if load_shape is None:
+        return None
+    tariff = Tariff.from_financial_params(financial_params)
+    weights = load_shape.day_weights()
+    baseline = {'grid_import_kw': load_shape.mean_kw,
+                'grid_export_kw': np.zeros_like(load_shape.mean_kw)}
+    before = bill_representative_days(baseline, weights, tariff)
+    after = bill_representative_days(simulate_hourly(load_shape, pv_system, bess_system)['hourly'],
+                                     weights, tariff)
+    metered = None
+    if parsed_data is not None and parsed_data.get('received') is not None \
+            and len(parsed_data['received']):
+        metered = bill_parsed(parsed_data, tariff)
+    results = {
+        name: {
+            'bill_before': before[name]['annual_bill'],
+            'bill_after': after[name]['annual_bill'],
+            'annual_savings': before[name]['annual_bill'] - after[name]['annual_bill'],
+            'bill': after[name],
+        }
+        for name in ('nem2', 'nem3')
+    }
+    if metered is not None:
+        for name in results:
+            results[name]['metered_bill'] = metered[name]['annual_bill']
+    return results
@@ -0,0 +1,104 @@
+"""
+The detailed calculation behind the results page.
+
+run_complete_calculation runs the memoized monthly stages
+(calculator.pipeline) and, on request, the analyses built on them: NEM
+2.0 vs 3.0 bills, battery wear, the strategy comparison, the weather
+ensemble and, for storing, the hourly year. The analyses cost many times
+the monthly stages, so callers that only need the headline figures
+(bench, quick checks) leave them off; the results page asks for all of
+them.
+"""
+from typing import Iterable
+
+from .billing import net_billing_savings
+from .degradation import battery_wear
+from .ensemble import run_ensemble
+from .hourly import year_series
+from .loadshape import LoadShape
+from .memprofile import profiled
+from .pipeline import run_pipeline
+from .strategies import compare_strategies
+
+
+# Optional analyses, named by their key in the results
+ANALYSES = ('net_billing', 'battery_wear', 'strategy_comparison', 'weather_ensemble')
+
+
+@profiled('run_complete_calculation')
+def run_complete_calculation(energy_profile, pv_system, bess_system, financial_params,
+                             interval_series=False, analyses: Iterable[str] = ()):
+    """
+    Run complete calculation for PV + BESS system.
+    Returns detailed results including monthly breakdowns, plus each of
+    ``analyses`` (names from ANALYSES) under its own key, and with
+    ``interval_series`` the hourly year as (start, series) for storing on
+    the CalculationResult.
+    """
+    analyses = set(analyses)
+    unknown = sorted(analyses - set(ANALYSES))
+    if unknown:
+        raise ValueError(f"Unknown analyses: {', '.join(unknown)}")
+
+    # Stages (load -> pv -> dispatch -> billing -> finance) are memoized on
+    # their inputs, so an edit only re-runs the stages downstream of it
+    stages = run_pipeline(energy_profile, pv_system, bess_system, financial_params)
+    monthly_consumption = stages['load']
+    monthly_pv_production = stages['pv']
+    bess_results = stages['dispatch']
+    financial_results = stages['finance']
+    
+    # Prepare detailed monthly results
+    monthly_results = []
+    for i in range(12):
+        monthly_results.append({
+            'month': i + 1,
+            'consumption': monthly_consumption[i],
+            'pv_production': monthly_pv_production[i],
+            'bess_energy': bess_results['monthly_bess_energy'][i],
+            'grid_energy': bess_results['monthly_grid_energy'][i],
+            'savings': bess_results['monthly_savings'][i]
+        })
+    
+    results = {
+        'monthly_results': monthly_results,
+        'financial_results': financial_results,
+        'bess_results': bess_results,
+        'total_consumption': sum(monthly_consumption),
+        'total_pv_production': sum(monthly_pv_production),
+        'annual_savings': stages['billing'],
+    }
+    load_shape = energy_profile.get_load_shape()
+    
+    # NEM 2.0 vs 3.0 bills need intraday data, so only uploaded profiles get them
+    if 'net_billing' in analyses:
+        with profiled('net_billing'):
+            # Metered bills too when the upload's interval columns are stored
+            interval_data = energy_profile.get_interval_data()
+            results['net_billing'] = net_billing_savings(
+                load_shape, pv_system, bess_system, financial_params,
+                interval_data.to_parsed() if interval_data is not None else None)
+    
+    # Cycle counting works on a flat day too, so every profile gets wear figures
+    if 'battery_wear' in analyses:
+        with profiled('battery_wear'):
+            results['battery_wear'] = battery_wear(load_shape or LoadShape.flat(monthly_consumption),
+                                                   pv_system, bess_system)
+    
+    # Every control strategy side by side, dispatched hourly together
+    if 'strategy_comparison' in analyses:
+        with profiled('strategy_comparison'):
+            results['strategy_comparison'] = compare_strategies(energy_profile, pv_system, bess_system,
+                                                                financial_params, stages)
+    
+    # Savings range over several weather years, sharing the same load arrays
+    if 'weather_ensemble' in analyses:
+        with profiled('weather_ensemble'):
+            results['weather_ensemble'] = run_ensemble(energy_profile, pv_system, bess_system,
+                                                       financial_params, stages)
+    
+    if interval_series:
+        with profiled('interval_series'):
+            results['interval_series'] = year_series(load_shape or LoadShape.flat(monthly_consumption),
+                                                     pv_system, bess_system)
+    return results
@@ -0,0 +1,146 @@
+"""
+Server-side downsampling of result series for charts.
+"""
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.core.cache import cache
+
+
+# Full-range downsampled tiers are cached per result; requested widths are
+# rounded up to the next tier so nearby widths share one cache entry
+MIN_TIER = 64
+MAX_WIDTH = 4096
+CACHE_TIMEOUT = 60 * 60
+
+
+def lttb(y: np.ndarray, threshold: int, x: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+    Returns the indices of the ``threshold`` points of ``y`` that best keep its
+    visual shape; first and last points are always kept.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = y.size
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=np.float64) if x is None else np.asarray(x, dtype=np.float64)
+
+    # threshold - 2 buckets over the interior points [1, n - 1)
+    every = (n - 2) / (threshold - 2)
+    bounds = (np.arange(threshold - 1) * every).astype(np.intp) + 1
+    bounds[-1] = n - 1
+    counts = np.diff(bounds)
+    mean_x = np.add.reduceat(x[:n - 1], bounds[:-1]) / counts
+    mean_y = np.add.reduceat(y[:n - 1], bounds[:-1]) / counts
+
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = bounds[i], bounds[i + 1]
+        if i + 1 < threshold - 2:
+            next_x, next_y = mean_x[i + 1], mean_y[i + 1]
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        # Twice the triangle area between the last pick, each candidate and
+        # the next bucket's average
+        area = np.abs((x[a] - next_x) * (y[lo:hi] - y[a])
+                      - (x[a] - x[lo:hi]) * (next_y - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def _tier(width: int) -> int:
+    tier = MIN_TIER
+    while tier < width and tier < MAX_WIDTH:
+        tier *= 2
+    return tier
+
+
+def _downsample(values: np.ndarray, width: int, offset: int = 0) -> Dict[str, List[float]]:
+    indices = lttb(values, width)
+    return {
+        'x': (indices + offset).tolist(),
+        'y': np.round(values[indices].astype(np.float64), 3).tolist(),
+    }
+
+
+def _thin(data: Dict[str, List[float]], width: int) -> Dict[str, List[float]]:
+    """Downsample an already downsampled tier to the exact requested width"""
+    if len(data['x']) <= width:
+        return data
+    x = np.asarray(data['x'])
+    indices = lttb(np.asarray(data['y']), width, x=x)
+    return {'x': x[indices].tolist(), 'y': [data['y'][i] for i in indices]}
+
+
+def _monthly_chart_data(result, names: Optional[List[str]]) -> Dict:
+    # No interval data: the monthly table is already chart-sized
+    monthly = result.get_monthly_results()
+    available = [k for k in monthly[0] if k != 'month'] if monthly else []
+    return {
+        'interval_minutes': None,
+        'start': None,
+        'series': {
+            key: {'x': [row['month'] for row in monthly], 'y': [row[key] for row in monthly]}
+            for key in (names or available) if key in available
+        },
+    }
+
+
+def _full_range_tier(result, tier: int) -> Optional[Dict]:
+    key = f'chart:{result.pk}:{tier}'
+    data = cache.get(key)
+    if data is None:
+        packed = result.get_interval_results()
+        if packed is None:
+            return None
+        data = {
+            'interval_minutes': packed.interval_minutes,
+            'start': packed.start,
+            'series': {name: _downsample(packed[name], tier) for name in packed},
+        }
+        cache.set(key, data, CACHE_TIMEOUT)
+    return data
+
+
+def get_chart_series(result, names: Optional[List[str]] = None, width: int = 800,
+                     start: Optional[int] = None, end: Optional[int] = None) -> Dict:
+    """
+    Downsampled chart data for a CalculationResult.
+    ``start``/``end`` select a zoomed interval-index range and are computed
+    from the raw series; full-range requests come from the per-result tier
+    cache and don't load the interval blob at all on a hit.
+    """
+    width = max(3, min(int(width), MAX_WIDTH))
+
+    if start is None and end is None:
+        data = _full_range_tier(result, _tier(width))
+        if data is None:
+            return _monthly_chart_data(result, names)
+        return {
+            'interval_minutes': data['interval_minutes'],
+            'start': data['start'],
+            'series': {name: _thin(series, width) for name, series in data['series'].items()
+                       if not names or name in names},
+        }
+
+    packed = result.get_interval_results()
+    if packed is None:
+        return _monthly_chart_data(result, names)
+    series = {}
+    for name in names or list(packed):
+        if name not in packed:
+            continue
+        length = packed.length(name)
+        lo = max(0, start or 0)
+        hi = min(length, end if end is not None else length)
+        series[name] = _downsample(packed[name][lo:hi], width, offset=lo)
+    return {
+        'interval_minutes': packed.interval_minutes,
+        'start': packed.start,
+        'series': series,
+    }
@@ -0,0 +1,230 @@
+"""
+Process pool for running calculations off the request thread.
+
+Views hand CPU-heavy work (run_complete_calculation and friends) to
+``run()``. With ``CALCULATOR_COMPUTE_POOL['WORKERS'] = 0`` - the default,
+and what tests use - the work simply runs inline in the calling thread.
+Otherwise each web worker process owns a small pool of compute
+processes. The pool starts on the first task, all of its processes at
+once with Django set up and numpy imported, so later tasks don't pay for
+it. Processes are spawned rather than forked: a fork of a threaded web
+worker can inherit locks held by other threads.
+
+A task that overruns its timeout can't be stopped inside its process, so
+the pool is replaced: new tasks go to a fresh one, and the old one's
+processes are killed once its other tasks have had RETIRE_GRACE seconds
+to finish.
+
+Tasks must be picklable and must not touch the database: pass model
+instances and plain values in, get plain values back.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import weakref
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Callable, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+
+DEFAULTS = {
+    'WORKERS': 0,        # 0 runs every task inline
+    'MAX_PENDING': None,  # running + queued tasks allowed; defaults to 2x workers
+    'QUEUE_WAIT': 0.0,    # seconds to wait for a free slot before rejecting
+    'TIMEOUT': 30.0,      # default per-task timeout in seconds
+    'RETIRE_GRACE': 30.0,  # seconds a replaced pool's other tasks get before it is killed
+}
+
+
+class ComputePoolBusy(Exception):
+    """Raised when the pool is saturated and the task could not be queued."""
+
+
+class ComputeTimeout(Exception):
+    """Raised when a task did not finish within its timeout."""
+
+
+def get_config() -> dict:
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'CALCULATOR_COMPUTE_POOL', {}))
+    if config['MAX_PENDING'] is None:
+        config['MAX_PENDING'] = max(1, config['WORKERS'] * 2)
+    return config
+
+
+def _initialize_worker():
+    """Runs once in each compute process, before it takes any task"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pv_bess_calculator.settings')
+    import django
+    django.setup()  # needed for unpickling model instances
+
+    import numpy  # noqa: F401  (pre-import so the first task doesn't pay for it)
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _terminate(processes):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+class ComputePool:
+    """A process pool with bounded admission and per-task timeouts"""
+
+    def __init__(self, workers: int, max_pending: int, queue_wait: float = 0.0,
+                 timeout: Optional[float] = None, retire_grace: float = 30.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_wait = queue_wait
+        self.timeout = timeout
+        self.retire_grace = retire_grace
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+        # The executor each pending task went to, for retiring it on a timeout
+        self._executors = weakref.WeakKeyDictionary()
+
+    @property
+    def inline(self) -> bool:
+        return self.workers <= 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_initialize_worker,
+                )
+                # Start every process now rather than on demand
+                warm_up = [self._executor.submit(_warm_up) for _ in range(self.workers)]
+                for future in warm_up:
+                    future.result()
+            return self._executor
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """
+        Queue ``fn(*args)`` and return its Future.
+        Raises ComputePoolBusy if no slot frees up within QUEUE_WAIT seconds.
+        """
+        if self.inline:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        if self.queue_wait > 0:
+            acquired = self._slots.acquire(timeout=self.queue_wait)
+        else:
+            acquired = self._slots.acquire(blocking=False)
+        if not acquired:
+            raise ComputePoolBusy("All compute workers are busy.")
+
+        try:
+            executor = self._get_executor()
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._executors[future] = executor
+        return future
+
+    def _timed_out(self, future: Future, timeout: float):
+        """Cancel a queued task, or retire the executor running it"""
+        if not future.cancel():
+            executor = self._executors.get(future)
+            if executor is not None:
+                self.retire(executor)
+        return ComputeTimeout(f"Calculation did not finish within {timeout:g} seconds.")
+
+    def retire(self, executor: ProcessPoolExecutor):
+        """
+        Stop sending tasks to ``executor`` and kill its processes after
+        RETIRE_GRACE seconds, which ends a task stuck in one of them.
+        """
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        # shutdown() drops the executor's references to its processes
+        processes = list((executor._processes or {}).values())
+        executor.shutdown(wait=False)
+        timer = threading.Timer(self.retire_grace, _terminate, args=(processes,))
+        timer.daemon = True
+        timer.start()
+
+    def run(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """Run ``fn(*args)`` on the pool and wait for its result"""
+        future = self.submit(fn, *args)
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise self._timed_out(future, timeout)
+
+    async def arun(self, fn: Callable, *args, timeout: Optional[float] = None):
+        """
+        Async counterpart of run() for coroutine views.
+        Inline mode runs ``fn`` on a worker thread instead of the event loop.
+        """
+        if self.inline:
+            return await sync_to_async(fn, thread_sensitive=False)(*args)
+
+        # Waiting for a slot (and starting the pool) must not block the loop
+        future = await sync_to_async(self.submit, thread_sensitive=False)(fn, *args)
+        if timeout is None:
+            timeout = self.timeout
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out(future, timeout)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ComputePool:
+    """Return this process's pool, creating it from settings on first use"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        # A pool inherited across fork (e.g. gunicorn --preload) is unusable
+        if _pool is None or _pool_pid != os.getpid():
+            config = get_config()
+            _pool = ComputePool(
+                workers=config['WORKERS'],
+                max_pending=config['MAX_PENDING'],
+                queue_wait=config['QUEUE_WAIT'],
+                timeout=config['TIMEOUT'],
+                retire_grace=config['RETIRE_GRACE'],
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def submit(fn: Callable, *args) -> Future:
+    return get_pool().submit(fn, *args)
+
+
+def run(fn: Callable, *args, timeout: Optional[float] = None):
+    return get_pool().run(fn, *args, timeout=timeout)
+
+
+async def arun(fn: Callable, *args, timeout: Optional[float] = None):
+    return await get_pool().arun(fn, *args, timeout=timeout)
@@ -0,0 +1,133 @@
+"""
+Battery wear from state-of-charge traces.
+
+Cycles are counted with the rainflow method (ASTM E1049). The trace is
+first cut down to its turning points with vectorized np.diff tests; one
+stack pass over those then extracts the full cycles, and what is left on
+the stack counts as half cycles. Every point is pushed and popped at most
+once, so counting is linear in the length of the trace: a year of
+15-minute SOC takes a few milliseconds.
+
+Wear follows a depth-of-discharge (Wöhler) curve: a cycle of depth d uses
+1 / N(d) of the battery's life, N(d) = N_ref * (d / d_ref) ** -k, and the
+fractions add up over the counted cycles (Miner's rule). That gives the
+share of cycle life used per year, the capacity fade and the years until
+the battery reaches its end-of-life capacity. Calendar ageing is not
+modelled.
+"""
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from .hourly import simulate_hourly
+from .loadshape import DAY_TYPES, WEEKDAY, WEEKEND, LoadShape
+
+
+# Typical LFP home battery: 6000 cycles at 80% depth of discharge
+REFERENCE_DOD = 0.8
+CYCLES_AT_REFERENCE_DOD = 6000
+# Shallower cycles wear less than proportionally
+DOD_EXPONENT = 1.5
+# Capacity left when the battery counts as worn out
+END_OF_LIFE_CAPACITY = 0.8
+# Ranges below this (fraction of capacity) are numerical noise, not cycles
+MIN_CYCLE_DEPTH = 1e-3
+DEPTH_BINS = np.linspace(0.0, 1.0, 11)
+# Calendar used to lay out representative days when the profile has no dates
+REFERENCE_YEAR = 2023
+
+
+def turning_points(series) -> np.ndarray:
+    """Local extremes of ``series``, plus its first and last values"""
+    values = np.asarray(series, dtype=np.float64).ravel()
+    if values.size:
+        # Drop repeats so a flat stretch can't hide a reversal
+        values = values[np.concatenate(([True], np.diff(values) != 0))]
+    if values.size < 3:
+        return values
+    slope = np.diff(values)
+    reversal = slope[:-1] * slope[1:] < 0
+    return values[np.concatenate(([True], reversal, [True]))]
+
+
+def rainflow(series) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Rainflow-count ``series``. Returns (ranges, means, counts), one entry
+    per cycle found, counts being 1.0 for full and 0.5 for half cycles.
+    """
+    ranges, means, counts = [], [], []
+    stack = []
+    for point in turning_points(series).tolist():
+        stack.append(point)
+        while len(stack) >= 3:
+            latest = abs(stack[-1] - stack[-2])
+            previous = abs(stack[-2] - stack[-3])
+            if latest < previous:
+                break
+            ranges.append(previous)
+            means.append((stack[-2] + stack[-3]) / 2)
+            if len(stack) == 3:
+                # The range includes the starting point: half a cycle
+                counts.append(0.5)
+                del stack[0]
+            else:
+                counts.append(1.0)
+                del stack[-3:-1]
+
+    # Unclosed residue
+    for start, end in zip(stack, stack[1:]):
+        ranges.append(abs(end - start))
+        means.append((start + end) / 2)
+        counts.append(0.5)
+    return np.array(ranges), np.array(means), np.array(counts)
+
+
+def cycle_life(depth) -> np.ndarray:
+    """Cycles of the given depth(s) of discharge the battery lasts"""
+    depth = np.maximum(np.asarray(depth, dtype=np.float64), MIN_CYCLE_DEPTH)
+    return CYCLES_AT_REFERENCE_DOD * (depth / REFERENCE_DOD) ** -DOD_EXPONENT
+
+
+def wear_from_soc(soc, years: float = 1.0) -> Dict:
+    """
+    Cycle statistics and wear for an SOC trace (fractions of nameplate
+    capacity) covering ``years`` years.
+    """
+    ranges, _, counts = rainflow(soc)
+    cycling = ranges >= MIN_CYCLE_DEPTH
+    ranges, counts = ranges[cycling], counts[cycling]
+
+    life_used = float((counts / cycle_life(ranges)).sum()) / years
+    throughput = float((counts * ranges).sum()) / years
+    histogram, _ = np.histogram(ranges, bins=DEPTH_BINS, weights=counts)
+    return {
+        'cycles_per_year': float(counts.sum()) / years,
+        'equivalent_full_cycles_per_year': throughput,
+        'mean_depth': float((counts * ranges).sum() / counts.sum()) if counts.size else 0.0,
+        'max_depth': float(ranges.max()) if ranges.size else 0.0,
+        'depth_histogram': (histogram / years).tolist(),
+        'cycle_life_used_per_year': life_used,
+        'capacity_fade_percent_per_year': life_used * (1 - END_OF_LIFE_CAPACITY) * 100,
+        'years_to_end_of_life': 1 / life_used if life_used > 0 else None,
+    }
+
+
+def year_soc_trace(soc_by_day: np.ndarray, year: int = REFERENCE_YEAR) -> np.ndarray:
+    """
+    Hourly SOC for every day of ``year`` from (12, 2, 24) representative
+    days, each calendar day taking its month and weekday/weekend day.
+    """
+    days = np.arange(np.datetime64(f'{year}-01-01'), np.datetime64(f'{year + 1}-01-01'))
+    month = days.astype('datetime64[M]').astype(np.int64) % 12
+    # 1970-01-01 was a Thursday, so +3 makes Monday 0
+    day_type = np.where((days.astype(np.int64) + 3) % 7 >= 5, WEEKEND, WEEKDAY)
+    return soc_by_day.reshape(-1, soc_by_day.shape[-1])[month * DAY_TYPES + day_type].ravel()
+
+
+def battery_wear(load_shape: Optional[LoadShape], pv_system, bess_system) -> Optional[Dict]:
+    """Wear over a simulated year of hourly SOC; None without a load shape"""
+    if load_shape is None:
+        return None
+    soc = simulate_hourly(load_shape, pv_system, bess_system)['hourly']['soc']
+    year = int(str(load_shape.start)[:4]) if load_shape.start else REFERENCE_YEAR
+    return wear_from_soc(year_soc_trace(soc, year))
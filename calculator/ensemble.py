@@ -0,0 +1,150 @@
+"""
+One design evaluated across an ensemble of weather years.
+
+A single weather year hides how much payback moves with the weather. The
+ensemble takes every weather file of the nearest site (calculator.weather
+groups same-coordinate files as years of one site); with fewer than two
+it perturbs the one year it has, drawing independent mean-one lognormal
+factors for each month of ENSEMBLE_YEARS synthetic years from a fixed
+seed, so the same design always gets the same ensemble.
+
+Per-kW PV, the load arrays, the tariff and the no-system baseline bill are
+built once. The years then form the leading axis of one
+bess_operation_batch and one financial_metrics_batch call, and for
+uploaded profiles of one hourly dispatch (hourly.dispatch_pv_scenarios).
+Only the per-year bills are computed one year at a time. A 10-year
+ensemble costs a few times a single-year calculation.
+"""
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from .batch import (DAYS_PER_MONTH, bess_operation_batch, financial_metrics_batch,
+                    pv_production_batch)
+from .billing import Tariff, bill_representative_days
+from .hourly import SOLAR_CURVE, dispatch_pv_scenarios
+from .pipeline import run_pipeline
+from .weather import pv_profile, pv_profiles
+
+
+ENSEMBLE_YEARS = 10
+# Year-to-year spread (coefficient of variation) of monthly insolation
+MONTHLY_VARIABILITY = 0.08
+ENSEMBLE_SEED = 2023
+
+
+class WeatherYears(NamedTuple):
+    source: str  # 'weather_files' or 'synthetic'
+    labels: List[str]
+    monthly_kwh: np.ndarray  # (years, 12) per kW of panels, before system losses
+    month_hour_kw: np.ndarray  # (years, 12, 24) typical-day output per kW, same basis
+
+
+def weather_years(pv_system, years: int = ENSEMBLE_YEARS, seed: int = ENSEMBLE_SEED) -> WeatherYears:
+    """The weather years the ensemble for ``pv_system`` runs over"""
+    site = (pv_system.latitude, pv_system.longitude, pv_system.tilt_angle, pv_system.azimuth)
+    profiles = pv_profiles(*site)
+    if len(profiles) >= 2:
+        return WeatherYears('weather_files', [profile.label for profile in profiles],
+                            np.stack([profile.monthly_kwh for profile in profiles]),
+                            np.stack([profile.month_hour_kw for profile in profiles]))
+
+    profile = pv_profile(*site)
+    if profile is not None:
+        monthly, month_hour = profile.monthly_kwh, profile.month_hour_kw
+    else:
+        monthly = pv_production_batch(1.0, pv_system.latitude, pv_system.tilt_angle,
+                                      pv_system.azimuth, 1.0)
+        month_hour = (monthly / DAYS_PER_MONTH)[:, None] * SOLAR_CURVE
+
+    rng = np.random.default_rng(seed)
+    factors = rng.lognormal(-MONTHLY_VARIABILITY ** 2 / 2, MONTHLY_VARIABILITY, (years, 12))
+    return WeatherYears('synthetic', [f'Year {i + 1}' for i in range(years)],
+                        monthly * factors, month_hour * factors[:, :, None])
+
+
+def _spread(values: np.ndarray) -> Dict[str, float]:
+    return {'min': float(values.min()), 'mean': float(values.mean()), 'max': float(values.max())}
+
+
+def run_ensemble(energy_profile, pv_system, bess_system, financial_params,
+                 stages: Optional[Dict] = None, years: int = ENSEMBLE_YEARS,
+                 seed: int = ENSEMBLE_SEED) -> Dict:
+    """
+    Savings, payback and NPV of one design in every weather year, with
+    their min/mean/max. ``stages`` is a run_pipeline result to reuse; only
+    its load and peaks outputs are read.
+    """
+    if stages is None:
+        stages = run_pipeline(energy_profile, pv_system, bess_system, financial_params)
+    ensemble = weather_years(pv_system, years, seed)
+    scale = pv_system.system_efficiency * pv_system.system_size_kw
+    monthly_pv = ensemble.monthly_kwh * scale
+
+    operation = bess_operation_batch(
+        np.asarray(stages['load'], dtype=np.float64), monthly_pv,
+        bess_system.capacity_kwh, bess_system.usable_capacity_kwh,
+        bess_system.max_charge_rate_kw, bess_system.max_discharge_rate_kw,
+        bess_system.round_trip_efficiency, bess_system.control_strategy,
+        stages['peaks'],
+    )
+    annual_savings = operation['total_savings'] * financial_params.electricity_rate
+    metrics = financial_metrics_batch(
+        pv_system.system_size_kw, bess_system.capacity_kwh, annual_savings,
+        financial_params.pv_cost_per_kw, financial_params.bess_cost_per_kwh,
+        financial_params.installation_cost_percent, financial_params.federal_tax_credit,
+        financial_params.state_incentive, financial_params.discount_rate,
+        financial_params.electricity_inflation, financial_params.system_lifetime,
+    )
+    pv_production = monthly_pv.sum(axis=1)
+
+    net_billing = _net_billing_by_year(energy_profile.get_load_shape(),
+                                       ensemble.month_hour_kw * scale, bess_system,
+                                       financial_params)
+
+    per_year = []
+    for i, label in enumerate(ensemble.labels):
+        row = {
+            'label': label,
+            'pv_production': float(pv_production[i]),
+            'annual_savings': float(annual_savings[i]),
+            'payback_period_years': float(metrics['payback_period_years'][i]),
+            'npv_25_years': float(metrics['npv_25_years'][i]),
+        }
+        if net_billing is not None:
+            row['net_billing'] = {name: float(savings[i]) for name, savings in net_billing.items()}
+        per_year.append(row)
+
+    result = {
+        'source': ensemble.source,
+        'years': len(ensemble.labels),
+        'total_pv_production': _spread(pv_production),
+        'annual_savings': _spread(annual_savings),
+        'payback_period_years': _spread(metrics['payback_period_years']),
+        'npv_25_years': _spread(metrics['npv_25_years']),
+        'per_year': per_year,
+    }
+    if net_billing is not None:
+        result['net_billing'] = {name: _spread(savings) for name, savings in net_billing.items()}
+    return result
+
+
+def _net_billing_by_year(load_shape, month_hour_kw: np.ndarray, bess_system, financial_params
+                         ) -> Optional[Dict[str, np.ndarray]]:
+    """{'nem2': savings, 'nem3': savings}, each (years,) in $/year; None without a load shape"""
+    if load_shape is None:
+        return None
+    tariff = Tariff.from_financial_params(financial_params)
+    weights = load_shape.day_weights()
+    before = bill_representative_days(
+        {'grid_import_kw': load_shape.mean_kw, 'grid_export_kw': np.zeros_like(load_shape.mean_kw)},
+        weights, tariff)
+
+    hourly = dispatch_pv_scenarios(load_shape, month_hour_kw[:, :, None, :], bess_system)
+    savings = {'nem2': np.empty(len(month_hour_kw)), 'nem3': np.empty(len(month_hour_kw))}
+    for i in range(len(month_hour_kw)):
+        after = bill_representative_days({name: flows[i] for name, flows in hourly.items()},
+                                         weights, tariff)
+        for name in savings:
+            savings[name][i] = before[name]['annual_bill'] - after[name]['annual_bill']
+    return savings
@@ -30,6 +30,14 @@ class EnergyProfileForm(forms.ModelForm):
             'peak_demand': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.01'}),
         }
     
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Measured from the upload when interval data is provided
+        self.fields['peak_demand'].required = False
+    
+    def clean_peak_demand(self):
+        return self.cleaned_data.get('peak_demand') or 0
+    
     def clean(self):
         """Validate that monthly data is provided"""
         cleaned_data = super().clean()
@@ -0,0 +1,311 @@
+"""
+Incremental parsers for energy data uploads.
+
+Both parsers are fed the file as byte chunks and return the same dict as
+parse_energy_data_file from finish(), so an upload is parsed in the one
+pass Django makes over it (see calculator.uploads) rather than read again
+afterwards. Each parser decides from the first bytes whether it
+understands the file; once it doesn't, ``rejected`` holds the reason and
+feed() returns False so the caller can stop reading.
+
+calculator.utils keeps the original whole-file parse_csv_energy_data and
+parse_xml_energy_data as the reference these are checked against
+(manage.py oracle csv_chunks).
+"""
+import codecs
+import csv
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from typing import Dict, Optional
+
+
+# A recognizable header has to turn up within this many bytes. SCE puts
+# about a dozen lines of account details above the column names.
+HEADER_SEARCH_BYTES = 64 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+
+# Characters str.splitlines() breaks on
+_LINE_BREAKS = frozenset('\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029')
+
+ATOM_NS = 'http://www.w3.org/2005/Atom'
+ESPI_NS = 'http://naesb.org/espi'
+_NAMESPACES = {'atom': ATOM_NS, 'espi': ESPI_NS}
+_INTERVAL_BLOCK = f'{{{ESPI_NS}}}IntervalBlock'
+_INTERVAL_READING = f'{{{ESPI_NS}}}IntervalReading'
+
+
+class EnergyDataParser:
+    """Base class: feed() byte chunks, then finish()"""
+
+    def __init__(self):
+        self.rejected: Optional[str] = None
+        self.bytes_read = 0
+
+    def reject(self, reason: str) -> bool:
+        self.rejected = reason
+        return False
+
+    def feed(self, chunk: bytes) -> bool:
+        """Consume a chunk; False once the file has been rejected"""
+        raise NotImplementedError
+
+    def finish(self) -> Optional[Dict]:
+        """The parsed data, or None if the file was rejected or held no usage"""
+        raise NotImplementedError
+
+    def _result(self, data: Dict) -> Optional[Dict]:
+        if self.rejected is None and sum(data['consumption']) > 0:
+            return data
+        return None
+
+
+class CSVEnergyParser(EnergyDataParser):
+    """
+    SCE-style CSV: free-form account lines, then a header row with Date and
+    Delivered (optionally Start and Received) columns, then one row per interval.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._pending = ''
+        self._columns = None
+        # Interval start times repeat every day ("06/27/2022 12:15AM"), so
+        # parse each distinct time of day once
+        self._time_offsets = {}
+        self.data = {
+            'consumption': [0.0] * 12,
+            'dates': [],
+            'values': [],
+            'timestamps': [],  # interval start datetimes, when the file has them
+            'received': []  # exported energy per interval, when the file has it
+        }
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.rejected is not None:
+            return False
+        self.bytes_read += len(chunk)
+        try:
+            text = self._pending + self._decoder.decode(chunk)
+        except UnicodeDecodeError:
+            return self.reject('The file is not UTF-8 text.')
+
+        lines = text.splitlines()
+        # Keep a trailing partial line, and a trailing \r that may be half of \r\n
+        if lines and (text[-1] not in _LINE_BREAKS or text[-1] == '\r'):
+            self._pending = lines.pop() + ('\r' if text[-1] == '\r' else '')
+        else:
+            self._pending = ''
+        for line in lines:
+            if not self._line(line):
+                return False
+
+        if self._columns is None and self.bytes_read > HEADER_SEARCH_BYTES:
+            return self.reject('No Date/Delivered header row found; not an interval data CSV.')
+        return True
+
+    def finish(self) -> Optional[Dict]:
+        if self.rejected is None:
+            try:
+                text = self._pending + self._decoder.decode(b'', final=True)
+            except UnicodeDecodeError:
+                return None
+            self._pending = ''
+            for line in text.splitlines():
+                if not self._line(line):
+                    break
+        if self._columns is None:
+            return None
+        return self._result(self.data)
+
+    def _line(self, line: str) -> bool:
+        if self._columns is None:
+            if 'Date' in line and ('Delivered' in line or 'Energy' in line):
+                return self._header(line)
+            return True
+        if line.strip():
+            try:
+                self._row(line)
+            except Exception:
+                pass
+        return True
+
+    def _header(self, line: str) -> bool:
+        headers = next(csv.reader([line]))
+        date_col = delivered_col = start_col = received_col = None
+        for i, header in enumerate(headers):
+            header_lower = header.lower().strip()
+            if 'date' in header_lower:
+                date_col = i
+            elif 'delivered' in header_lower:
+                delivered_col = i
+            elif 'start' in header_lower:
+                start_col = i
+            elif 'received' in header_lower:
+                received_col = i
+
+        if date_col is None or delivered_col is None:
+            return self.reject('The header row has no Date and Delivered columns.')
+        self._columns = (date_col, delivered_col, start_col, received_col)
+        return True
+
+    def _row(self, line: str):
+        date_col, delivered_col, start_col, received_col = self._columns
+        row = next(csv.reader([line]))
+        if len(row) <= max(date_col, delivered_col):
+            return
+
+        date_str = row[date_col].strip().strip('"')
+        delivered_str = row[delivered_col].strip().strip('"')
+
+        # Parse date (handle SCE format: "06/27/2022")
+        try:
+            date_obj = datetime.strptime(date_str, '%m/%d/%Y')
+        except ValueError:
+            return
+        month = date_obj.month - 1
+
+        # SCE's CSV export is already in kWh per interval (e.g. "0.100")
+        try:
+            delivered_value = float(delivered_str.replace(',', ''))
+        except ValueError:
+            return
+
+        timestamp = None
+        if start_col is not None and start_col < len(row):
+            time_str = row[start_col].strip().strip('"').rpartition(' ')[2]
+            offset = self._time_offsets.get(time_str)
+            if offset is None:
+                try:
+                    offset = datetime.strptime(time_str, '%I:%M%p') - datetime(1900, 1, 1)
+                except ValueError:
+                    offset = False
+                self._time_offsets[time_str] = offset
+            if offset is not False:
+                timestamp = date_obj + offset
+
+        received_value = 0.0
+        if received_col is not None and received_col < len(row):
+            try:
+                received_value = float(row[received_col].strip().strip('"').replace(',', ''))
+            except ValueError:
+                pass
+
+        # Every per-interval list gets an entry for every row, so they stay
+        # aligned; a None time is dropped with its row by the quality pass
+        data = self.data
+        data['consumption'][month] += delivered_value
+        data['dates'].append(date_str)
+        data['values'].append(delivered_value)
+        if start_col is not None:
+            data['timestamps'].append(timestamp)
+        if received_col is not None:
+            data['received'].append(received_value)
+
+
+class GreenButtonParser(EnergyDataParser):
+    """
+    Green Button (ESPI) XML. IntervalReadings are handled as each one
+    closes and their IntervalBlock is cleared afterwards, so the document
+    tree is never held in full.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._parser = ET.XMLPullParser(events=('start', 'end'))
+        self._root_seen = False
+        self._block_depth = 0
+        self.data = {
+            'consumption': [0.0] * 12,
+            'dates': [],
+            'values': [],
+            'timestamps': []  # interval start datetimes, when the file has them
+        }
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.rejected is not None:
+            return False
+        self.bytes_read += len(chunk)
+        try:
+            self._parser.feed(chunk)
+            self._events()
+        except ET.ParseError:
+            return self.reject('The file is not well-formed XML.')
+        if self.rejected is not None:
+            return False
+        if not self._root_seen and self.bytes_read > HEADER_SEARCH_BYTES:
+            return self.reject('No XML root element found; not a Green Button file.')
+        return True
+
+    def finish(self) -> Optional[Dict]:
+        if self.rejected is None:
+            try:
+                self._parser.close()
+                self._events()
+            except ET.ParseError:
+                return None
+        if not self._root_seen:
+            return None
+        return self._result(self.data)
+
+    def _events(self):
+        for event, elem in self._parser.read_events():
+            if not self._root_seen:
+                self._root_seen = True
+                if not elem.tag.startswith((f'{{{ATOM_NS}}}', f'{{{ESPI_NS}}}')):
+                    self.reject('The XML is not a Green Button (Atom/ESPI) document.')
+                    return
+            if elem.tag == _INTERVAL_BLOCK:
+                if event == 'start':
+                    self._block_depth += 1
+                else:
+                    self._block_depth -= 1
+                    elem.clear()
+            elif event == 'end' and elem.tag == _INTERVAL_READING and self._block_depth:
+                self._reading(elem)
+
+    def _reading(self, interval):
+        time_period = interval.find('.//espi:timePeriod', _NAMESPACES)
+        if time_period is None:
+            return
+        start_time = time_period.find('.//espi:start', _NAMESPACES)
+        if start_time is None or start_time.text is None:
+            return
+
+        # Parse start time (Unix timestamp)
+        try:
+            date_obj = datetime.fromtimestamp(int(start_time.text))
+        except (ValueError, TypeError, OverflowError, OSError):
+            return
+
+        value_elem = interval.find('.//espi:value', _NAMESPACES)
+        if value_elem is None or value_elem.text is None:
+            return
+        try:
+            value = float(value_elem.text) / 1000.0  # Wh to kWh
+        except ValueError:
+            return
+
+        data = self.data
+        data['consumption'][date_obj.month - 1] += value
+        data['dates'].append(date_obj.strftime('%Y-%m-%d'))
+        data['values'].append(value)
+        data['timestamps'].append(date_obj)
+
+
+def parser_for(file_name: str) -> Optional[EnergyDataParser]:
+    """A fresh parser for the file's extension, or None if it isn't supported"""
+    name = (file_name or '').lower()
+    if name.endswith('.csv'):
+        return CSVEnergyParser()
+    if name.endswith('.xml'):
+        return GreenButtonParser()
+    return None
+
+
+def parse_stream(parser: EnergyDataParser, file) -> Optional[Dict]:
+    """Feed an open binary file to ``parser`` chunk by chunk"""
+    for chunk in iter(lambda: file.read(READ_CHUNK_SIZE), b''):
+        if not parser.feed(chunk):
+            break
+    return parser.finish()
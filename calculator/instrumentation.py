@@ -0,0 +1,182 @@
+"""
+Lightweight per-stage timing.
+
+``timed('pv')`` records how long a block took into a process-wide latency
+histogram (exported in Prometheus text format by the metrics view) and,
+when inside a request, into the list that ServerTimingMiddleware turns
+into a ``Server-Timing`` header.
+
+Stages run on the compute pool (calculator.compute) are timed in the
+compute process and never reach these histograms; the view records the
+whole pool round trip as the ``compute`` stage instead.
+
+The histograms are per process. Under a multi-worker server each /metrics
+scrape reports only the worker that served it, so scrape a single-worker
+deployment or each worker directly. The header and /metrics are public
+only with CALCULATOR_TIMING_PUBLIC (defaults to DEBUG); otherwise there is
+no header and /metrics is staff-only.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+
+# Seconds; tuned for stages that range from microseconds to a few seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram keyed by a single label value"""
+
+    def __init__(self, name: str, documentation: str, label: str,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = buckets
+        self._series: Dict[str, List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, seconds: float):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                # [per-bucket counts (+Inf last), sum, count]
+                series = self._series[label_value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += seconds
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            snapshot = [(value, list(series[0]), series[1], series[2])
+                        for value, series in sorted(self._series.items())]
+        for value, counts, total, count in snapshot:
+            label = f'{self.label}="{value}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{label}}} {total:.6f}')
+            lines.append(f'{self.name}_count{{{label}}} {count}')
+        return lines
+
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values"""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], int] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: int = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values: str) -> int:
+        return self._values.get(label_values, 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} counter']
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for label_values, value in snapshot:
+            label = ','.join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            lines.append(f'{self.name}_total{{{label}}} {value}')
+        return lines
+
+
+STAGE_DURATION = Histogram(
+    'calculator_stage_duration_seconds',
+    'Time spent in each parsing, simulation, ORM and rendering stage.',
+    'stage',
+)
+REQUEST_DURATION = Histogram(
+    'calculator_request_duration_seconds',
+    'End-to-end request latency by view.',
+    'view',
+)
+STAGE_CACHE = Counter(
+    'calculator_stage_cache',
+    'Memoized calculation stage lookups by outcome (hit or miss).',
+    ('stage', 'result'),
+)
+
+_request_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = \
+    contextvars.ContextVar('calculator_request_timings', default=None)
+
+
+def is_enabled() -> bool:
+    return getattr(settings, 'CALCULATOR_TIMING_ENABLED', True)
+
+
+def is_public() -> bool:
+    """Whether Server-Timing headers are sent and /metrics is open to everyone"""
+    return getattr(settings, 'CALCULATOR_TIMING_PUBLIC', settings.DEBUG)
+
+
+@contextmanager
+def timed(stage: str):
+    """Time the enclosed block as ``stage``"""
+    if not is_enabled():
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(stage, elapsed)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def begin_request():
+    """Start collecting stage timings for the current request"""
+    return _request_timings.set([])
+
+
+def end_request(token) -> List[Tuple[str, float]]:
+    """Stop collecting and return the (stage, seconds) pairs recorded"""
+    timings = _request_timings.get() or []
+    _request_timings.reset(token)
+    return timings
+
+
+def server_timing_header(timings: List[Tuple[str, float]], total: float) -> str:
+    """Format timings as a Server-Timing header value (durations in ms)"""
+    durations: Dict[str, float] = {}
+    for stage, seconds in timings:
+        durations[stage] = durations.get(stage, 0.0) + seconds
+    entries = [f'{stage};dur={seconds * 1000:.2f}' for stage, seconds in durations.items()]
+    entries.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(entries)
+
+
+def render_prometheus() -> str:
+    lines = STAGE_DURATION.render() + REQUEST_DURATION.render() + STAGE_CACHE.render()
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,176 @@
+"""
+Columnar, memory-mapped storage of parsed uploads.
+
+Each upload is parsed once and its interval data written as plain ``.npy``
+columns under ``MEDIA_ROOT/<CALCULATOR_INTERVAL_STORE_DIR>/<hash>/``,
+keyed by the SHA-256 of the file's bytes:
+
+    minutes.npy      interval start times, datetime64[m] (NaT if the file has none)
+    delivered.npy    imported kWh per interval
+    received.npy     exported kWh per interval (empty if the file has none)
+    consumption.npy  the 12 monthly totals
+    quality.json     the data-quality report (see calculator.quality)
+
+Columns are stored after the data-quality pass, so they are in time
+order on a regular grid with gaps filled.
+
+Uploading the same file again, or any later analysis of a profile that
+records the hash, opens the columns with ``mmap_mode='r'``, so even a
+multi-year history loads in about a millisecond without being parsed or
+copied. run_complete_calculation bills the metered intervals straight
+from these columns (EnergyProfile.get_interval_data).
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .loadshape import to_minutes
+from .memprofile import profiled
+from .quality import clean_parsed
+from .utils import parse_energy_data_file
+
+
+COLUMNS = ('minutes', 'delivered', 'received', 'consumption')
+QUALITY_FILE = 'quality.json'
+
+
+def store_root() -> Path:
+    return Path(settings.MEDIA_ROOT) / getattr(settings, 'CALCULATOR_INTERVAL_STORE_DIR', 'intervals')
+
+
+def store_path(digest: str) -> Path:
+    return store_root() / digest[:2] / digest
+
+
+def content_hash(file) -> str:
+    """SHA-256 of an uploaded (or open binary) file; leaves it rewound"""
+    digest = hashlib.sha256()
+    file.seek(0)
+    if hasattr(file, 'chunks'):
+        for chunk in file.chunks():
+            digest.update(chunk)
+    else:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+class IntervalData:
+    """Interval columns of one upload; arrays may be read-only memory maps"""
+
+    def __init__(self, minutes, delivered, received, consumption, digest: Optional[str] = None,
+                 quality: Optional[Dict] = None):
+        self.minutes = minutes
+        self.delivered = delivered
+        self.received = received
+        self.consumption = consumption
+        self.digest = digest
+        self.quality = quality
+
+    def __len__(self):
+        return len(self.delivered)
+
+    @property
+    def timed(self) -> bool:
+        """Whether every interval has a start time (files without them store NaT)"""
+        return not bool(np.isnat(self.minutes).any())
+
+    def to_parsed(self) -> Dict:
+        """
+        The same keys parse_energy_data_file returns, with arrays in place of
+        lists. 'dates' is the datetime64[D] day of each interval and
+        'timestamps' is empty for a file without interval times; the other
+        columns are the stored (possibly memory-mapped) arrays themselves.
+        """
+        return {
+            'consumption': [float(value) for value in self.consumption],
+            'dates': self.minutes.astype('datetime64[D]'),
+            'values': self.delivered,
+            'timestamps': self.minutes if self.timed else self.minutes[:0],
+            'received': self.received,
+            'quality': self.quality,
+        }
+
+
+def save_parsed(digest: str, parsed: Dict) -> IntervalData:
+    """Write a parse_energy_data_file result as columns and return it memory-mapped"""
+    path = store_path(digest)
+
+    def column(name):
+        values = parsed.get(name)
+        return values if values is not None else []
+
+    delivered = np.asarray(column('values'), dtype=np.float64)
+    timestamps = column('timestamps')
+    if len(timestamps) == len(delivered):
+        minutes = to_minutes(timestamps)
+    else:
+        # A file without interval times; keep the columns the same length
+        minutes = np.full(delivered.size, np.datetime64('NaT'), dtype='datetime64[m]')
+    columns = {
+        'minutes': minutes,
+        'delivered': delivered,
+        'received': np.asarray(column('received'), dtype=np.float64),
+        'consumption': np.asarray(parsed['consumption'], dtype=np.float64),
+    }
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(dir=path.parent, prefix='.tmp-'))
+    try:
+        for name, values in columns.items():
+            np.save(staging / f'{name}.npy', values, allow_pickle=False)
+        (staging / QUALITY_FILE).write_text(json.dumps(parsed.get('quality')))
+        try:
+            os.rename(staging, path)
+        except OSError:
+            if not path.exists():
+                raise
+            # Someone stored the same content first; theirs is identical
+    finally:
+        if staging.exists():
+            shutil.rmtree(staging, ignore_errors=True)
+    return load(digest)
+
+
+def load(digest: str, mmap: bool = True) -> Optional[IntervalData]:
+    """Open stored columns, or None if this content was never stored"""
+    path = store_path(digest)
+    if not path.is_dir():
+        return None
+    mode = 'r' if mmap else None
+    try:
+        columns = {name: np.load(path / f'{name}.npy', mmap_mode=mode, allow_pickle=False)
+                   for name in COLUMNS}
+        quality = json.loads((path / QUALITY_FILE).read_text())
+    except (OSError, ValueError):
+        return None
+    return IntervalData(digest=digest, quality=quality, **columns)
+
+
+def parse_upload(file, streamed=None) -> Tuple[Optional[str], Optional[Dict]]:
+    """
+    (content hash, parsed data) for an uploaded energy data file. Content
+    seen before is loaded from the store instead of being parsed again.
+    ``streamed`` is the file's calculator.uploads.StreamedUpload, when it
+    was already hashed and parsed on the way in. New content goes through
+    the data-quality pass before it is stored.
+    """
+    digest = streamed.digest if streamed is not None else content_hash(file)
+    stored = load(digest)
+    if stored is not None:
+        return digest, stored.to_parsed()
+
+    parsed = streamed.parsed if streamed is not None else parse_energy_data_file(file)
+    if not parsed:
+        return digest, None
+    with profiled('clean_intervals'):
+        cleaned = clean_parsed(parsed)
+    return digest, save_parsed(digest, cleaned).to_parsed()
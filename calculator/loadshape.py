@@ -0,0 +1,247 @@
+"""
+Month x day-type x hour load shape derived from interval data.
+
+An upload's intraday detail is reduced to a 12 x 2 x 24 matrix of mean
+demand (kW) by month, weekday/weekend and hour of day, plus demand
+statistics: per-month interval and rolling-hour peaks, the top-N peak
+intervals and a load-duration curve. Everything comes from the one set of
+arrays built while ingesting the file: peaks use np.maximum.at and a
+cumulative-sum rolling window, the top intervals argpartition and the
+duration curve np.percentile (a partial sort), so nothing is fully sorted
+or scanned twice.
+
+The result is stored on the EnergyProfile as a small packed blob (see
+calculator.series) and is enough for the hourly engine in
+calculator.hourly to simulate a year without the original file.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .series import PackedSeries, pack_series
+
+
+MONTHS, DAY_TYPES, HOURS = 12, 2, 24
+SHAPE = (MONTHS, DAY_TYPES, HOURS)
+WEEKDAY, WEEKEND = 0, 1
+DAYS_PER_MONTH = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31], dtype=np.float64)
+# Used for months without data, where the observed split is unknown
+DEFAULT_DAY_SPLIT = np.array([5 / 7, 2 / 7])
+TOP_PEAKS = 10
+# Load-duration curve points: demand exceeded 0%, 1%, ... 100% of the time
+DURATION_CURVE_POINTS = 101
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+
+def to_minutes(timestamps) -> np.ndarray:
+    """datetime64[m] array from naive datetimes (much faster than np.asarray on a list)"""
+    if isinstance(timestamps, np.ndarray):
+        return timestamps.astype('datetime64[m]')
+    minutes = np.fromiter(
+        ((t.toordinal() - _EPOCH_ORDINAL) * 1440 + t.hour * 60 + t.minute for t in timestamps),
+        dtype=np.int64, count=len(timestamps),
+    )
+    return minutes.astype('datetime64[m]')
+
+
+class LoadShape:
+    """
+    mean_kw:           (12, 2, 24) mean demand by month, day type and hour
+    day_counts:        (12, 2) days observed per month and day type
+    peak_kw:           (12,) highest single-interval (e.g. 15-minute) demand per month
+    peak_hour:         (12,) hour of day that peak started in
+    hourly_peak_kw:    (12,) highest rolling 60-minute mean demand per month
+    top_peak_kw:       (<=10,) highest interval demands, descending
+    top_peak_minutes:  minutes after ``start`` each top interval began
+    duration_curve_kw: (101,) demand exceeded 0%, 1%, ... 100% of the time
+    start:             first interval as an ISO timestamp, or None
+    """
+
+    def __init__(self, mean_kw, day_counts, peak_kw, peak_hour, interval_minutes: int = 60,
+                 hourly_peak_kw=None, top_peak_kw=(), top_peak_minutes=(),
+                 duration_curve_kw=None, start: Optional[str] = None):
+        self.mean_kw = np.asarray(mean_kw, dtype=np.float64).reshape(SHAPE)
+        self.day_counts = np.asarray(day_counts, dtype=np.float64).reshape(MONTHS, DAY_TYPES)
+        self.peak_kw = np.asarray(peak_kw, dtype=np.float64).reshape(MONTHS)
+        self.peak_hour = np.asarray(peak_hour, dtype=np.float64).reshape(MONTHS)
+        self.interval_minutes = interval_minutes
+        self.hourly_peak_kw = (np.asarray(hourly_peak_kw, dtype=np.float64).reshape(MONTHS)
+                               if hourly_peak_kw is not None else self.peak_kw.copy())
+        self.top_peak_kw = np.asarray(top_peak_kw, dtype=np.float64)
+        self.top_peak_minutes = np.asarray(top_peak_minutes, dtype=np.float64)
+        self.duration_curve_kw = (np.asarray(duration_curve_kw, dtype=np.float64)
+                                  if duration_curve_kw is not None else np.zeros(DURATION_CURVE_POINTS))
+        self.start = start
+
+    @classmethod
+    def from_intervals(cls, timestamps: Sequence[datetime], values_kwh: Sequence[float],
+                       interval_minutes: Optional[int] = None) -> Optional['LoadShape']:
+        """
+        Build from interval start times and energy per interval (kWh).
+        The interval length is inferred from the timestamps unless given.
+        Returns None if there are no intervals.
+        """
+        if len(timestamps) == 0:
+            return None
+        minutes = to_minutes(timestamps)
+        energy = np.asarray(values_kwh, dtype=np.float64)
+
+        if interval_minutes is None:
+            steps = np.diff(np.unique(minutes)).astype(np.int64)
+            interval_minutes = int(np.median(steps)) if steps.size else 60
+        demand_kw = energy * (60.0 / interval_minutes)
+
+        days = minutes.astype('datetime64[D]')
+        month = minutes.astype('datetime64[M]').astype(np.int64) % 12
+        hour = (minutes - days).astype(np.int64) // 60
+        # 1970-01-01 was a Thursday, so +3 makes Monday 0
+        day_type = np.where((days.astype(np.int64) + 3) % 7 >= 5, WEEKEND, WEEKDAY)
+
+        # Mean over every interval that falls in a (month, day type, hour) cell
+        cell = (month * DAY_TYPES + day_type) * HOURS + hour
+        size = MONTHS * DAY_TYPES * HOURS
+        sums = np.bincount(cell, weights=demand_kw, minlength=size)
+        counts = np.bincount(cell, minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_kw = np.where(counts > 0, sums / counts, 0.0)
+
+        # Distinct observed days per (month, day type)
+        _, first = np.unique(days, return_index=True)
+        day_cell = month[first] * DAY_TYPES + day_type[first]
+        day_counts = np.bincount(day_cell, minlength=MONTHS * DAY_TYPES)
+
+        peak_kw = np.zeros(MONTHS)
+        np.maximum.at(peak_kw, month, demand_kw)
+        # Hour of each month's peak: the first interval reaching it
+        at_peak = demand_kw >= peak_kw[month]
+        peak_hour = np.zeros(MONTHS)
+        peak_months, peak_index = np.unique(month[at_peak], return_index=True)
+        peak_hour[peak_months] = hour[at_peak][peak_index]
+
+        hourly_peak_kw = _rolling_hour_peaks(minutes, month, demand_kw, interval_minutes)
+
+        # Top-N intervals without sorting the whole year
+        top = min(TOP_PEAKS, demand_kw.size)
+        top_index = np.argpartition(demand_kw, demand_kw.size - top)[-top:]
+        top_index = top_index[np.argsort(-demand_kw[top_index], kind='stable')]
+        first_minute = minutes.min()
+        top_peak_minutes = (minutes[top_index] - first_minute).astype(np.int64)
+
+        exceeded = np.linspace(0, 100, DURATION_CURVE_POINTS)
+        duration_curve_kw = np.percentile(demand_kw, 100 - exceeded)
+
+        return cls(mean_kw, day_counts, peak_kw, peak_hour, interval_minutes,
+                   hourly_peak_kw=hourly_peak_kw,
+                   top_peak_kw=demand_kw[top_index], top_peak_minutes=top_peak_minutes,
+                   duration_curve_kw=duration_curve_kw, start=str(first_minute))
+
+    @classmethod
+    def flat(cls, monthly_consumption: Sequence[float]) -> 'LoadShape':
+        """Constant demand that reproduces the monthly totals; for manual entries"""
+        monthly = np.asarray(monthly_consumption, dtype=np.float64)
+        mean_kw = np.broadcast_to((monthly / DAYS_PER_MONTH / HOURS)[:, None, None], SHAPE)
+        day_counts = DAYS_PER_MONTH[:, None] * DEFAULT_DAY_SPLIT
+        return cls(mean_kw, day_counts, monthly / DAYS_PER_MONTH / HOURS, np.zeros(MONTHS))
+
+    def top_peaks(self) -> List[Dict]:
+        """Top peak intervals as [{'start': ISO timestamp, 'kw': demand}], highest first"""
+        if self.start is None:
+            return []
+        first = np.datetime64(self.start, 'm')
+        return [{'start': str(first + np.timedelta64(int(offset), 'm')), 'kw': float(kw)}
+                for offset, kw in zip(self.top_peak_minutes, self.top_peak_kw)]
+
+    def day_weights(self) -> np.ndarray:
+        """(12, 2) days in a calendar month represented by each day type"""
+        observed = self.day_counts.sum(axis=1, keepdims=True)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            split = np.where(observed > 0, self.day_counts / observed, DEFAULT_DAY_SPLIT)
+        return split * DAYS_PER_MONTH[:, None]
+
+    def monthly_energy(self) -> np.ndarray:
+        """(12,) kWh for a typical calendar month"""
+        return (self.mean_kw.sum(axis=2) * self.day_weights()).sum(axis=1)
+
+    def to_dict(self) -> Dict[str, List]:
+        return {
+            'mean_kw': self.mean_kw.tolist(),
+            'day_counts': self.day_counts.tolist(),
+            'peak_kw': self.peak_kw.tolist(),
+            'peak_hour': self.peak_hour.tolist(),
+            'hourly_peak_kw': self.hourly_peak_kw.tolist(),
+            'top_peaks': self.top_peaks(),
+            'duration_curve_kw': self.duration_curve_kw.tolist(),
+            'interval_minutes': self.interval_minutes,
+        }
+
+    def pack(self) -> bytes:
+        return pack_series({
+            'mean_kw': self.mean_kw.ravel(),
+            'day_counts': self.day_counts.ravel(),
+            'peak_kw': self.peak_kw,
+            'peak_hour': self.peak_hour,
+            'hourly_peak_kw': self.hourly_peak_kw,
+            'top_peak_kw': self.top_peak_kw,
+            'top_peak_minutes': self.top_peak_minutes,
+            'duration_curve_kw': self.duration_curve_kw,
+        }, interval_minutes=self.interval_minutes, start=self.start)
+
+    @classmethod
+    def unpack(cls, blob: bytes) -> 'LoadShape':
+        packed = PackedSeries(blob)
+        return cls(packed['mean_kw'], packed['day_counts'], packed['peak_kw'],
+                   packed['peak_hour'], packed.interval_minutes,
+                   hourly_peak_kw=packed.get('hourly_peak_kw'),
+                   top_peak_kw=packed.get('top_peak_kw', ()),
+                   top_peak_minutes=packed.get('top_peak_minutes', ()),
+                   duration_curve_kw=packed.get('duration_curve_kw'),
+                   start=packed.start)
+
+
+def _rolling_hour_peaks(minutes, month, demand_kw, interval_minutes) -> np.ndarray:
+    """
+    Highest 60-minute rolling mean demand per month (by the window's last
+    interval). Windows spanning a gap in the data are skipped.
+    """
+    peaks = np.zeros(MONTHS)
+    window = max(1, 60 // interval_minutes)
+    if demand_kw.size < window:
+        return peaks
+
+    order = np.argsort(minutes, kind='stable')
+    if np.all(order == np.arange(order.size)):
+        order = slice(None)  # already in time order, the usual case
+    minutes, month, demand_kw = minutes[order], month[order], demand_kw[order]
+
+    totals = np.cumsum(np.concatenate(([0.0], demand_kw)))
+    means = (totals[window:] - totals[:-window]) / window
+    span = (minutes[window - 1:] - minutes[:minutes.size - window + 1]).astype(np.int64)
+    contiguous = span == (window - 1) * interval_minutes
+    np.maximum.at(peaks, month[window - 1:][contiguous], means[contiguous])
+    return peaks
+
+
+def monthly_peak_demand(load_shape_blob, peak_demand: float = 0) -> Optional[List[float]]:
+    """
+    Measured interval peak per month from a stored load-shape blob, else the
+    profile's single peak_demand for every month, else None. Only the peak
+    series is decoded.
+    """
+    if load_shape_blob:
+        return PackedSeries(load_shape_blob)['peak_kw'].astype(np.float64).tolist()
+    if peak_demand and peak_demand > 0:
+        return [float(peak_demand)] * MONTHS
+    return None
+
+
+def load_shape_from_parsed(parsed_data: Optional[Dict]) -> Optional[LoadShape]:
+    """LoadShape for a parse_energy_data_file result, if it has a time for every interval"""
+    if not parsed_data:
+        return None
+    timestamps = parsed_data.get('timestamps')
+    values = parsed_data.get('values')
+    # Lists from the parser or arrays from calculator.intervalstore
+    if timestamps is None or values is None or len(timestamps) == 0 or len(timestamps) != len(values):
+        return None
+    return LoadShape.from_intervals(timestamps, values)
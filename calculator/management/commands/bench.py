@@ -0,0 +1,253 @@
+"""
+Benchmark the calculation engine.
+
+    python manage.py bench
+    python manage.py bench --scales 1,1000 --output bench.json
+    python manage.py bench --baseline calculator/bench_baseline.json --tolerance 0.25
+
+Each benchmark runs its function over N fixed-seed scenarios (N from
+--scales) --repeat times and records the median and p95 wall time of one
+pass, plus the peak traced allocation of a single call. The defaults finish
+in a few seconds; pass larger --scales for throughput numbers. With
+--baseline the command fails when any median is more than --tolerance
+slower than the stored one; passes faster than --noise-floor are too noisy
+to compare.
+
+calculator/bench_baseline.json holds the default run's results. Timings
+depend on the machine, so refresh it with --output on the machine that
+compares against it.
+"""
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from calculator.calculation import ANALYSES, run_complete_calculation
+from calculator.models import BESSSystem, EnergyProfile, FinancialParameters, PVSystem
+from calculator.pipeline import clear_stage_cache
+from calculator.utils import (calculate_bess_operation, calculate_financial_metrics,
+                              calculate_pv_production, parse_energy_data_file,
+                              quick_calculation)
+
+
+MONTH_FIELDS = [
+    'jan_consumption', 'feb_consumption', 'mar_consumption', 'apr_consumption',
+    'may_consumption', 'jun_consumption', 'jul_consumption', 'aug_consumption',
+    'sep_consumption', 'oct_consumption', 'nov_consumption', 'dec_consumption',
+]
+BUNDLED_FILE = 'SCE_Usage_8012047060_06-27-22_to_06-30-23.csv'
+STRATEGIES = ['self_consumption', 'time_of_use', 'peak_shaving']
+# Distinct scenarios generated per benchmark; larger scales cycle through them
+MAX_DISTINCT = 1000
+
+
+def _load_bundled_consumption():
+    path = Path(settings.BASE_DIR) / 'data' / BUNDLED_FILE
+    if not path.exists():
+        return None
+    with open(path, 'rb') as f:
+        parsed = parse_energy_data_file(f)
+    return parsed['consumption'] if parsed else None
+
+
+def _monthly(rng, base=None):
+    if base is not None:
+        scale = rng.uniform(0.5, 2.0)
+        return [value * scale for value in base]
+    annual = rng.uniform(3000, 20000)
+    return [annual / 12 * rng.uniform(0.7, 1.3) for _ in range(12)]
+
+
+def _scenario(rng, base=None):
+    """One (energy_profile, pv_system, bess_system, financial_params) tuple, unsaved"""
+    monthly = _monthly(rng, base)
+    capacity = rng.choice([0, 5, 10, 13.5, 20])
+    energy_profile = EnergyProfile(name='bench', **dict(zip(MONTH_FIELDS, monthly)))
+    pv_system = PVSystem(
+        name='bench', system_size_kw=rng.uniform(2, 15),
+        latitude=rng.uniform(20, 55), longitude=rng.uniform(-125, -70),
+        tilt_angle=rng.uniform(10, 40), azimuth=rng.uniform(120, 240),
+    )
+    bess_system = BESSSystem(
+        name='bench', capacity_kwh=capacity, usable_capacity_kwh=capacity * 0.9,
+        max_charge_rate_kw=5, max_discharge_rate_kw=5,
+        control_strategy=rng.choice(STRATEGIES),
+    )
+    financial_params = FinancialParameters(
+        name='bench', electricity_rate=rng.uniform(0.1, 0.45),
+        discount_rate=rng.uniform(0.02, 0.08),
+    )
+    return energy_profile, pv_system, bess_system, financial_params
+
+
+def _run_complete_calculation_cold(*args):
+    # Measure the engine itself, not the stage memo cache
+    clear_stage_cache()
+    return run_complete_calculation(*args)
+
+
+def _detailed_calculation_cold(*args):
+    # Everything the results page asks for
+    clear_stage_cache()
+    return run_complete_calculation(*args, analyses=ANALYSES)
+
+
+def _build_cases(base):
+    """Map benchmark name -> (function, argument builder)"""
+    def quick(r):
+        return (r.uniform(3000, 20000), r.uniform(2, 15), r.choice([0, 5, 13.5]), r.uniform(0.1, 0.45))
+
+    def pv(r):
+        return (_monthly(r, base), r.uniform(2, 15), r.uniform(20, 55), r.uniform(-125, -70),
+                r.uniform(10, 40), r.uniform(120, 240), 0.75)
+
+    def bess(r):
+        monthly = _monthly(r, base)
+        production = calculate_pv_production(monthly, r.uniform(2, 15), 34.0, -118.0)
+        capacity = r.choice([5, 10, 13.5, 20])
+        return (monthly, production, capacity, capacity * 0.9, 5, 5, 0.9, r.choice(STRATEGIES))
+
+    def finance(r):
+        return (r.uniform(2, 15), r.choice([0, 5, 13.5]), r.uniform(500, 5000), 2000, 500, 0.1,
+                0.3, 0.0, r.uniform(0.02, 0.08), 0.03, 25)
+
+    return {
+        'quick_calculation': (quick_calculation, quick),
+        'calculate_pv_production': (calculate_pv_production, pv),
+        'calculate_bess_operation': (calculate_bess_operation, bess),
+        'calculate_financial_metrics': (calculate_financial_metrics, finance),
+        'run_complete_calculation': (_run_complete_calculation_cold, lambda r: _scenario(r, base)),
+        'detailed_calculation': (_detailed_calculation_cold, lambda r: _scenario(r, base)),
+    }
+
+
+def _environment():
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'machine': platform.machine(), 'processor': platform.processor()}
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_benchmark(fn, build_args, scale, repeat, seed):
+    rng = random.Random(seed)
+    distinct = [build_args(rng) for _ in range(min(scale, MAX_DISTINCT))]
+    scenarios = [distinct[i % len(distinct)] for i in range(scale)]
+
+    fn(*scenarios[0])  # warm-up
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for args in scenarios:
+            fn(*args)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        fn(*scenarios[0])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return {
+        'scale': scale,
+        'repeat': repeat,
+        'median_s': median,
+        'p95_s': _percentile(timings, 0.95),
+        'per_scenario_us': median / scale * 1e6,
+        'peak_alloc_bytes': peak,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the calculation engine and compare against a stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='1,100',
+                            help='Comma-separated scenario counts per pass')
+        parser.add_argument('--repeat', type=int, default=3, help='Timed passes per benchmark')
+        parser.add_argument('--only', default='', help='Comma-separated benchmark names to run')
+        parser.add_argument('--inputs', choices=['synthetic', 'bundled', 'both'], default='both',
+                            help='Random synthetic consumption, the bundled SCE file, or both')
+        parser.add_argument('--seed', type=int, default=1234)
+        parser.add_argument('--output', help='Write results as JSON to this path')
+        parser.add_argument('--baseline', help='Baseline JSON to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.20,
+                            help='Allowed slowdown vs. baseline median (0.20 = 20%%)')
+        parser.add_argument('--noise-floor', type=float, default=0.001,
+                            help='Skip comparing benchmarks whose baseline median is below this many seconds')
+
+    def handle(self, *args, **options):
+        scales = [int(value) for value in options['scales'].split(',') if value]
+        only = {name for name in options['only'].split(',') if name}
+
+        input_sets = []
+        if options['inputs'] in ('synthetic', 'both'):
+            input_sets.append(('synthetic', None))
+        if options['inputs'] in ('bundled', 'both'):
+            bundled = _load_bundled_consumption()
+            if bundled is None:
+                self.stderr.write(f"Bundled data file {BUNDLED_FILE} not found, skipping bundled inputs.")
+            else:
+                input_sets.append(('bundled', bundled))
+
+        results = {}
+        for input_name, base in input_sets:
+            cases = _build_cases(base)
+            for name, (fn, build_args) in cases.items():
+                if only and name not in only:
+                    continue
+                for scale in scales:
+                    key = f'{name}[{input_name},{scale}]'
+                    result = run_benchmark(fn, build_args, scale, options['repeat'], options['seed'])
+                    results[key] = result
+                    self.stdout.write(
+                        f"{key:<55} median {result['median_s'] * 1000:10.3f} ms"
+                        f"  p95 {result['p95_s'] * 1000:10.3f} ms"
+                        f"  {result['per_scenario_us']:9.2f} us/scenario"
+                        f"  peak {result['peak_alloc_bytes']:>8} B"
+                    )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'environment': _environment(), 'benchmarks': results}, f, indent=2)
+            self.stdout.write(f"Wrote {len(results)} results to {options['output']}")
+
+        if options['baseline']:
+            self._compare(results, options['baseline'], options['tolerance'], options['noise_floor'])
+
+    def _compare(self, results, baseline_path, tolerance, noise_floor):
+        try:
+            with open(baseline_path) as f:
+                baseline = json.load(f)['benchmarks']
+        except (OSError, ValueError, KeyError) as e:
+            raise CommandError(f"Could not read baseline {baseline_path}: {e}")
+
+        regressions = []
+        for key, result in results.items():
+            if key not in baseline:
+                continue
+            previous = baseline[key]['median_s']
+            if previous < noise_floor:
+                continue
+            ratio = result['median_s'] / previous
+            if ratio > 1 + tolerance:
+                regressions.append(f"{key}: {previous * 1000:.3f} ms -> "
+                                   f"{result['median_s'] * 1000:.3f} ms ({ratio:.2f}x)")
+
+        if regressions:
+            raise CommandError("Benchmarks slower than baseline by more than "
+                               f"{tolerance:.0%}:\n  " + "\n  ".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No regressions beyond {tolerance:.0%} of {baseline_path}"))
@@ -0,0 +1,102 @@
+"""
+Replay a stored calculation under the memory profiler.
+
+    python manage.py memprofile 42
+    python manage.py memprofile 42 --top 10 --output memprofile.json
+    python manage.py memprofile 42 --warm --skip-ingest
+
+Loads CalculationResult 42's inputs, replays the energy profile's ingest
+and runs run_complete_calculation on them with every analysis the
+results page asks for. Each profiled stage (calculator.memprofile)
+records its peak traced memory and its top allocation sites. Ingest
+re-parses the uploaded file if it was kept, otherwise loads the stored
+interval columns (calculator.intervalstore); either way the intervals
+are then cleaned and turned into a load shape again. The stage cache is
+cleared first so every stage really runs; --warm keeps it. The replayed
+annual savings are checked against the stored ones.
+"""
+import json
+import math
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from calculator.calculation import ANALYSES, run_complete_calculation
+from calculator.loadshape import load_shape_from_parsed
+from calculator.memprofile import begin_profile, end_profile, format_profile, profiled
+from calculator.models import CalculationResult
+from calculator.pipeline import clear_stage_cache
+from calculator.quality import clean_parsed
+from calculator.utils import parse_energy_data_file
+
+
+class Command(BaseCommand):
+    help = "Profile memory use of a stored calculation's ingest and calculation stages"
+
+    def add_arguments(self, parser):
+        parser.add_argument('result', type=int, help='CalculationResult id')
+        parser.add_argument('--top', type=int, default=5, help='Allocation sites listed per stage')
+        parser.add_argument('--warm', action='store_true',
+                            help='Keep memoized stage outputs instead of clearing them first')
+        parser.add_argument('--skip-ingest', action='store_true',
+                            help="Don't re-parse the energy profile's uploaded file")
+        parser.add_argument('--output', help='Write the profile as JSON to this path')
+
+    def handle(self, *args, **options):
+        try:
+            result = CalculationResult.objects.select_related(
+                'energy_profile', 'pv_system', 'bess_system', 'financial_params'
+            ).get(pk=options['result'])
+        except CalculationResult.DoesNotExist:
+            raise CommandError(f"CalculationResult {options['result']} does not exist")
+        energy_profile = result.energy_profile
+
+        if not options['warm']:
+            clear_stage_cache()
+        token = begin_profile(options['top'])
+        try:
+            if not options['skip_ingest']:
+                self._ingest(energy_profile)
+            results = run_complete_calculation(energy_profile, result.pv_system,
+                                               result.bess_system, result.financial_params,
+                                               analyses=ANALYSES)
+        finally:
+            stages = end_profile(token)
+
+        self.stdout.write(format_profile(stages))
+        peak = max((entry['peak_bytes'] for entry in stages if entry['depth'] == 0), default=0)
+        self.stdout.write(f'Peak traced memory: {peak / 1024 / 1024:.2f} MiB')
+
+        replayed = results['financial_results']['annual_savings']
+        if not math.isclose(replayed, result.annual_savings, rel_tol=1e-6, abs_tol=1e-6):
+            self.stderr.write(f'Replayed annual savings {replayed:.2f} differ from the stored '
+                              f'{result.annual_savings:.2f}; the inputs or engines have changed.')
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps({
+                'result': result.pk,
+                'warm': options['warm'],
+                'peak_bytes': peak,
+                'stages': stages,
+            }, indent=2))
+            self.stdout.write(f"Wrote {options['output']}")
+
+    def _ingest(self, energy_profile):
+        upload = energy_profile.energy_data_file
+        if upload and upload.storage.exists(upload.name):
+            with upload.open('rb') as f:
+                parsed = parse_energy_data_file(f)
+        elif energy_profile.data_hash:
+            with profiled('interval_store_load'):
+                stored = energy_profile.get_interval_data()
+                parsed = stored.to_parsed() if stored is not None else None
+        else:
+            self.stderr.write('Energy profile has no interval data, profiling the calculation only.')
+            return
+        if not parsed:
+            self.stderr.write('Interval data could not be read, profiling the calculation only.')
+            return
+        with profiled('clean_intervals'):
+            parsed = clean_parsed(parsed)
+        with profiled('load_shape'):
+            load_shape_from_parsed(parsed)
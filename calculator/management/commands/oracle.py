@@ -0,0 +1,496 @@
+"""
+Check the optimized engines against the scalar reference implementations.
+
+    python manage.py oracle
+    python manage.py oracle --cases 10000 --only bess,finance
+    python manage.py oracle --seed 3141592653 --only csv_chunks,xml_chunks
+
+The scalar functions and the whole-file parsers in calculator.utils are
+kept as reference oracles.
+Each check draws random inputs, runs the reference and the fast path on
+the same inputs, and compares every output within --rtol/--atol:
+
+    pv          calculate_pv_production      vs pv_production_batch
+    bess        calculate_bess_operation     vs bess_operation_batch
+    finance     calculate_financial_metrics  vs financial_metrics_batch
+    pipeline    the scalar functions chained by hand
+                                             vs run_pipeline, memoized, shuffled
+    csv_chunks  parse_csv_energy_data        vs CSVEnergyParser fed random-sized
+                                                chunks, as the upload handler does
+    xml_chunks  parse_xml_energy_data        vs GreenButtonParser, the same way
+
+Inputs cover the range the forms accept and include edge values: no
+battery, idle months, latitudes on band boundaries, savings at or below
+zero, one-year lifetimes, CRLF line endings, files without start times,
+readings with an unreadable start, no value or no Received column, and
+chunks that split a multi-byte character. The parsers only agree on what
+the reference reads (dates, values and monthly totals), so that is what
+is compared, plus a check that the fast parser's timestamps and received
+columns stay row-aligned with its values. The pipeline check runs --cases / 10 cases and
+the parser checks --cases / 20, because each case costs more.
+
+calculator/tests/test_oracle.py runs every check with a fixed seed.
+
+Without --seed a fresh one is drawn, and it is always printed. Each check
+draws from its own stream of that seed, so rerunning with --seed and
+--only gives the same cases. Mismatches are listed with the failing
+case's inputs, and the command fails if there are any. Both sides are
+timed; the speedup is reference time / fast time.
+"""
+import codecs
+import io
+import json
+import secrets
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from calculator.batch import bess_operation_batch, financial_metrics_batch, pv_production_batch
+from calculator.ingest import CSVEnergyParser, EnergyDataParser, GreenButtonParser
+from calculator.models import BESSSystem, EnergyProfile, FinancialParameters, PVSystem
+from calculator.pipeline import MONTHLY_FIELDS, clear_stage_cache, run_pipeline
+from calculator.utils import (calculate_bess_operation, calculate_financial_metrics,
+                              calculate_pv_production, parse_csv_energy_data,
+                              parse_xml_energy_data)
+
+
+STRATEGIES = ['self_consumption', 'time_of_use', 'peak_shaving']
+LATITUDE_EDGES = [0.0, 30.0, -30.0, 45.0, -45.0, 60.0]
+# Mismatching cases listed per check
+MAX_REPORTED = 5
+
+
+class Outcome(NamedTuple):
+    cases: int
+    reference_seconds: float
+    fast_seconds: float
+    mismatches: List[Dict]
+
+
+def _with_edges(rng, values: np.ndarray, edges, probability: float = 0.1) -> np.ndarray:
+    """``values`` with about ``probability`` of them replaced by edge values"""
+    mask = rng.random(values.shape) < probability
+    return np.where(mask, rng.choice(np.asarray(edges, dtype=np.float64), values.shape), values)
+
+
+def _compare(case: int, reference: Dict, fast: Dict, rtol: float, atol: float) -> List[Dict]:
+    """One entry per output that differs"""
+    mismatches = []
+    for key, expected in reference.items():
+        expected = np.asarray(expected, dtype=np.float64)
+        actual = np.asarray(fast[key], dtype=np.float64)
+        if expected.shape != actual.shape:
+            mismatches.append({'case': case, 'output': key,
+                               'reference': list(expected.shape), 'fast': list(actual.shape)})
+        elif not np.allclose(actual, expected, rtol=rtol, atol=atol, equal_nan=True):
+            worst = int(np.argmax(np.abs(actual - expected).ravel()))
+            mismatches.append({'case': case, 'output': key,
+                               'reference': float(expected.ravel()[worst]),
+                               'fast': float(actual.ravel()[worst])})
+    return mismatches
+
+
+def _check_pv(rng, cases: int, rtol: float, atol: float) -> Outcome:
+    inputs = {
+        'pv_size_kw': _with_edges(rng, rng.uniform(0.5, 20, cases), [0.0]),
+        'latitude': _with_edges(rng, rng.uniform(-60, 60, cases), LATITUDE_EDGES, 0.2),
+        'longitude': rng.uniform(-180, 180, cases),
+        'tilt_angle': _with_edges(rng, rng.uniform(0, 60, cases), [0.0, 30.0]),
+        'azimuth': _with_edges(rng, rng.uniform(90, 270, cases), [180.0]),
+        'system_efficiency': rng.uniform(0.5, 0.95, cases),
+    }
+    started = time.perf_counter()
+    reference = [calculate_pv_production([0.0] * 12, *(float(inputs[name][i]) for name in inputs))
+                 for i in range(cases)]
+    reference_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fast = pv_production_batch(inputs['pv_size_kw'], inputs['latitude'], inputs['tilt_angle'],
+                               inputs['azimuth'], inputs['system_efficiency'],
+                               longitude=inputs['longitude'])
+    fast_seconds = time.perf_counter() - started
+
+    mismatches = []
+    for i in range(cases):
+        for mismatch in _compare(i, {'monthly_production': reference[i]},
+                                 {'monthly_production': fast[i]}, rtol, atol):
+            mismatch['inputs'] = {name: float(values[i]) for name, values in inputs.items()}
+            mismatches.append(mismatch)
+    return Outcome(cases, reference_seconds, fast_seconds, mismatches)
+
+
+def _check_bess(rng, cases: int, rtol: float, atol: float) -> Outcome:
+    capacity = _with_edges(rng, rng.uniform(2, 30, cases), [0.0], 0.15)
+    consumption = rng.uniform(100, 3000, (cases, 12)) * (rng.random((cases, 12)) > 0.05)
+    peaks = rng.uniform(2, 15, (cases, 12)) * (rng.random((cases, 12)) > 0.3)
+    inputs = {
+        'monthly_consumption': consumption,
+        'monthly_pv_production': rng.uniform(0, 3000, (cases, 12)) * (rng.random((cases, 12)) > 0.05),
+        'bess_capacity_kwh': capacity,
+        'usable_capacity_kwh': capacity * rng.uniform(0.8, 1.0, cases),
+        'max_charge_rate_kw': _with_edges(rng, rng.uniform(1, 10, cases), [0.0]),
+        'max_discharge_rate_kw': _with_edges(rng, rng.uniform(1, 10, cases), [0.0]),
+        'round_trip_efficiency': rng.uniform(0.8, 0.98, cases),
+        'control_strategy': rng.choice(np.array(STRATEGIES, dtype=object), cases),
+        # Rows without measured peaks fall back to the average load
+        'monthly_peak_demand': np.where((rng.random(cases) < 0.5)[:, None], peaks, 0.0),
+    }
+    started = time.perf_counter()
+    reference = []
+    for i in range(cases):
+        peak = inputs['monthly_peak_demand'][i]
+        reference.append(calculate_bess_operation(
+            inputs['monthly_consumption'][i].tolist(), inputs['monthly_pv_production'][i].tolist(),
+            *(float(inputs[name][i]) for name in ('bess_capacity_kwh', 'usable_capacity_kwh',
+                                                  'max_charge_rate_kw', 'max_discharge_rate_kw',
+                                                  'round_trip_efficiency')),
+            inputs['control_strategy'][i], peak.tolist() if peak.any() else None))
+    reference_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fast = bess_operation_batch(**inputs)
+    fast_seconds = time.perf_counter() - started
+
+    mismatches = []
+    for i in range(cases):
+        for mismatch in _compare(i, reference[i], {key: values[i] for key, values in fast.items()},
+                                 rtol, atol):
+            mismatch['inputs'] = {name: (values[i].tolist() if isinstance(values[i], np.ndarray)
+                                         else values[i] if isinstance(values[i], str) else float(values[i]))
+                                  for name, values in inputs.items()}
+            mismatches.append(mismatch)
+    return Outcome(cases, reference_seconds, fast_seconds, mismatches)
+
+
+def _check_finance(rng, cases: int, rtol: float, atol: float) -> Outcome:
+    pv_size = _with_edges(rng, rng.uniform(1, 20, cases), [0.0])
+    capacity = _with_edges(rng, rng.uniform(2, 30, cases), [0.0], 0.2)
+    # A system with neither PV nor battery has no cost to pay back
+    capacity = np.where((pv_size == 0) & (capacity == 0), 10.0, capacity)
+    inputs = {
+        'pv_size_kw': pv_size,
+        'bess_capacity_kwh': capacity,
+        'annual_savings': _with_edges(rng, rng.uniform(-500, 6000, cases), [0.0, -1.0]),
+        'pv_cost_per_kw': rng.uniform(1000, 4000, cases),
+        'bess_cost_per_kwh': rng.uniform(300, 1200, cases),
+        'installation_cost_percent': rng.uniform(0, 0.3, cases),
+        'federal_tax_credit': _with_edges(rng, rng.uniform(0, 0.4, cases), [0.0, 0.3]),
+        # Kept below the battery's cost after the federal credit: the IRR
+        # approximation is undefined for a negative net cost
+        'state_incentive': _with_edges(rng, rng.uniform(0, 100, cases), [0.0]),
+        'discount_rate': _with_edges(rng, rng.uniform(0.0, 0.12, cases), [0.0]),
+        'electricity_inflation': _with_edges(rng, rng.uniform(0.0, 0.06, cases), [0.0]),
+        'system_lifetime': _with_edges(rng, rng.integers(5, 40, cases).astype(np.float64), [1.0, 25.0]),
+    }
+    started = time.perf_counter()
+    reference = []
+    for i in range(cases):
+        args = [float(values[i]) for values in inputs.values()]
+        # The scalar engine counts years with range(), so it needs an int lifetime
+        args[-1] = int(args[-1])
+        reference.append(calculate_financial_metrics(*args))
+    reference_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fast = financial_metrics_batch(**inputs)
+    fast_seconds = time.perf_counter() - started
+
+    mismatches = []
+    for i in range(cases):
+        for mismatch in _compare(i, reference[i], {key: values[i] for key, values in fast.items()},
+                                 rtol, atol):
+            mismatch['inputs'] = {name: float(values[i]) for name, values in inputs.items()}
+            mismatches.append(mismatch)
+    return Outcome(cases, reference_seconds, fast_seconds, mismatches)
+
+
+def _pipeline_scenarios(rng, cases: int) -> List[tuple]:
+    """Unsaved model instances whose fields come from small pools, so stages share cache keys"""
+    def pool(draw, size=3):
+        values = [draw() for _ in range(size)]
+        return lambda: values[rng.integers(size)]
+
+    monthly = pool(lambda: (rng.uniform(200, 2000, 12) * (rng.random(12) > 0.05)).tolist())
+    peak = pool(lambda: float(rng.choice([0.0, rng.uniform(2, 12)])))
+    site = pool(lambda: (float(rng.choice([rng.uniform(-60, 60), *LATITUDE_EDGES])),
+                         float(rng.uniform(-180, 180)), float(rng.uniform(0, 60)),
+                         float(rng.uniform(90, 270))))
+    size = pool(lambda: float(rng.uniform(1, 15)))
+    capacity = pool(lambda: float(rng.choice([0.0, rng.uniform(2, 30)])))
+    strategy = pool(lambda: str(rng.choice(STRATEGIES)))
+    rate = pool(lambda: float(rng.uniform(0.1, 0.45)))
+    discount = pool(lambda: float(rng.uniform(0.0, 0.1)))
+
+    scenarios = []
+    for _ in range(cases):
+        latitude, longitude, tilt, azimuth = site()
+        usable = capacity()
+        scenarios.append((
+            EnergyProfile(name='oracle', peak_demand=peak(), **dict(zip(MONTHLY_FIELDS, monthly()))),
+            PVSystem(name='oracle', system_size_kw=size(), latitude=latitude, longitude=longitude,
+                     tilt_angle=tilt, azimuth=azimuth),
+            BESSSystem(name='oracle', capacity_kwh=usable / 0.9, usable_capacity_kwh=usable,
+                       max_charge_rate_kw=5, max_discharge_rate_kw=5, control_strategy=strategy()),
+            FinancialParameters(name='oracle', electricity_rate=rate(), discount_rate=discount()),
+        ))
+    return scenarios
+
+
+def _scalar_chain(energy_profile, pv_system, bess_system, financial_params) -> Dict:
+    """What run_pipeline computes, without stages or memoization"""
+    load = energy_profile.get_monthly_consumption()
+    pv = calculate_pv_production(load, pv_system.system_size_kw, pv_system.latitude,
+                                 pv_system.longitude, pv_system.tilt_angle, pv_system.azimuth,
+                                 pv_system.system_efficiency)
+    dispatch = calculate_bess_operation(
+        load, pv, bess_system.capacity_kwh, bess_system.usable_capacity_kwh,
+        bess_system.max_charge_rate_kw, bess_system.max_discharge_rate_kw,
+        bess_system.round_trip_efficiency, bess_system.control_strategy,
+        energy_profile.get_monthly_peak_demand())
+    billing = dispatch['total_savings'] * financial_params.electricity_rate
+    finance = calculate_financial_metrics(
+        pv_system.system_size_kw, bess_system.capacity_kwh, billing,
+        financial_params.pv_cost_per_kw, financial_params.bess_cost_per_kwh,
+        financial_params.installation_cost_percent, financial_params.federal_tax_credit,
+        financial_params.state_incentive, financial_params.discount_rate,
+        financial_params.electricity_inflation, financial_params.system_lifetime)
+    return {'pv': pv, 'dispatch': dispatch, 'billing': billing, 'finance': finance}
+
+
+def _flatten(outputs: Dict) -> Dict:
+    flat = {}
+    for stage, output in outputs.items():
+        if isinstance(output, dict):
+            flat.update({f'{stage}.{key}': value for key, value in output.items()})
+        else:
+            flat[stage] = output
+    return flat
+
+
+def _check_pipeline(rng, cases: int, rtol: float, atol: float) -> Outcome:
+    scenarios = _pipeline_scenarios(rng, cases)
+    started = time.perf_counter()
+    reference = [_flatten(_scalar_chain(*scenario)) for scenario in scenarios]
+    reference_seconds = time.perf_counter() - started
+
+    # Shuffled, so later cases hit stages cached by unrelated earlier ones
+    order = rng.permutation(cases)
+    fast = [None] * cases
+    clear_stage_cache()
+    started = time.perf_counter()
+    for i in order:
+        fast[i] = run_pipeline(*scenarios[i])
+    fast_seconds = time.perf_counter() - started
+    clear_stage_cache()
+
+    mismatches = []
+    for i in range(cases):
+        outputs = _flatten({stage: fast[i][stage] for stage in ('pv', 'dispatch', 'billing', 'finance')})
+        for mismatch in _compare(i, reference[i], outputs, rtol, atol):
+            energy_profile, pv_system, bess_system, financial_params = scenarios[i]
+            mismatch['inputs'] = {
+                'monthly_consumption': energy_profile.get_monthly_consumption(),
+                'peak_demand': energy_profile.peak_demand,
+                'pv_system': {field: getattr(pv_system, field) for field in (
+                    'system_size_kw', 'latitude', 'longitude', 'tilt_angle', 'azimuth')},
+                'bess_system': {field: getattr(bess_system, field) for field in (
+                    'capacity_kwh', 'usable_capacity_kwh', 'control_strategy')},
+                'financial_params': {field: getattr(financial_params, field) for field in (
+                    'electricity_rate', 'discount_rate')},
+            }
+            mismatches.append(mismatch)
+    return Outcome(cases, reference_seconds, fast_seconds, mismatches)
+
+
+def _sce_csv(rng) -> bytes:
+    """A random SCE-style interval export, with the defects real ones have"""
+    newline = '\r\n' if rng.random() < 0.5 else '\n'
+    interval = int(rng.choice([15, 60]))
+    start = np.datetime64('2022-01-01') + np.timedelta64(int(rng.integers(0, 900)), 'D')
+    # Some exports have no interval start/end columns
+    with_times = rng.random() < 0.8
+    lines = ['Energy Usage Information', '"For location: 12 AVENIDA DEL AÑO, SAN JOSÉ CA"', '',
+             f'"Start date: {start} 00:00:00  for 3 days"',
+             'Date,Energy Consumption time Period Start,Energy Consumption time Period End,Delivered,Received'
+             if with_times else 'Date,Delivered,Received']
+    minutes = np.arange(0, int(rng.integers(1, 6)) * 1440, interval)
+    for minute in minutes:
+        moment = (start + np.timedelta64(int(minute), 'm')).astype(object)
+        end = moment + np.timedelta64(interval, 'm').astype(object)
+        roll = rng.random()
+        if roll < 0.01:
+            lines.append('')
+        elif roll < 0.02:
+            lines.append('"not a date ","","","x",""' if with_times else '"not a date ","x",""')
+            continue
+        delivered = f'{rng.uniform(0, 2500):.3f}'
+        if roll > 0.99:
+            delivered = f'{rng.uniform(1000, 9000):,.1f}'
+        times = f'"{moment:%m/%d/%Y %I:%M%p} ","{end:%m/%d/%Y %I:%M%p} ",' if with_times else ''
+        if with_times and roll < 0.03:
+            times = '"sometime ","",'
+        received = f',"{rng.uniform(0, 500):.3f}"' if roll >= 0.04 or roll < 0.03 else ''
+        lines.append(f'"{moment:%m/%d/%Y} ",{times}"{delivered}"{received}')
+    text = newline.join(lines) + (newline if rng.random() < 0.5 else '')
+    return (codecs.BOM_UTF8 if rng.random() < 0.5 else b'') + text.encode('utf-8')
+
+
+def _green_button_xml(rng) -> bytes:
+    """A random Green Button export, with readings the parsers have to skip"""
+    newline = '\r\n' if rng.random() < 0.5 else '\n'
+    interval = int(rng.choice([900, 3600]))
+    start = 1640995200 + int(rng.integers(0, 900)) * 86400  # 2022-01-01 UTC onwards
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>',
+             '<feed xmlns="http://www.w3.org/2005/Atom" xmlns:espi="http://naesb.org/espi">',
+             '<title>Uso de energía – 12 AVENIDA DEL AÑO</title>']
+    readings = int(rng.integers(1, 6)) * 86400 // interval
+    # Readings are split over a few IntervalBlocks
+    block_starts = set(rng.integers(1, readings, size=2).tolist())
+    lines.append('<entry><content><espi:IntervalBlock>')
+    for i in range(readings):
+        if i in block_starts:
+            lines.append('</espi:IntervalBlock></content></entry>')
+            lines.append('<entry><content><espi:IntervalBlock>')
+        roll = rng.random()
+        moment = str(start + i * interval)
+        value = str(int(rng.integers(0, 2500)))
+        if roll < 0.01:
+            moment = ''
+        elif roll < 0.02:
+            value = 'x'
+        elif roll < 0.03:
+            lines.append(f'<espi:IntervalReading><espi:timePeriod><espi:start>{moment}</espi:start>'
+                         f'</espi:timePeriod></espi:IntervalReading>')
+            continue
+        lines.append(f'<espi:IntervalReading><espi:timePeriod><espi:duration>{interval}</espi:duration>'
+                     f'<espi:start>{moment}</espi:start></espi:timePeriod>'
+                     f'<espi:value>{value}</espi:value></espi:IntervalReading>')
+    lines += ['</espi:IntervalBlock></content></entry>', '</feed>']
+    return newline.join(lines).encode('utf-8')
+
+
+def _parse_chunked(parser: EnergyDataParser, data: bytes, rng) -> Dict:
+    position = 0
+    while position < len(data):
+        size = int(rng.integers(1, 512))
+        if not parser.feed(data[position:position + size]):
+            break
+        position += size
+    return parser.finish()
+
+
+def _check_chunks(rng, cases: int, rtol: float, atol: float, make_file: Callable[..., bytes],
+                  reference_parser: Callable, parser_class: type) -> Outcome:
+    """``reference_parser`` on whole files vs ``parser_class`` fed random-sized chunks"""
+    files = [make_file(rng) for _ in range(cases)]
+    started = time.perf_counter()
+    reference = [reference_parser(io.BytesIO(data)) for data in files]
+    reference_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fast = [_parse_chunked(parser_class(), data, rng) for data in files]
+    fast_seconds = time.perf_counter() - started
+
+    mismatches = []
+    for i in range(cases):
+        found = []
+        if (reference[i] is None) != (fast[i] is None):
+            found.append({'case': i, 'output': 'result', 'reference': reference[i] is None and 'None',
+                          'fast': fast[i] is None and 'None'})
+        elif reference[i] is not None:
+            # The reference only reads dates and values
+            if reference[i]['dates'] != fast[i]['dates']:
+                found.append({'case': i, 'output': 'dates', 'reference': len(reference[i]['dates']),
+                              'fast': len(fast[i]['dates'])})
+            found += _compare(i, {key: reference[i][key] for key in ('consumption', 'values')},
+                              fast[i], rtol, atol)
+            # Per-interval columns the reference doesn't read must stay row-aligned
+            for key in ('timestamps', 'received'):
+                if len(fast[i].get(key) or []) not in (0, len(fast[i]['values'])):
+                    found.append({'case': i, 'output': key, 'reference': len(fast[i]['values']),
+                                  'fast': len(fast[i][key])})
+        for mismatch in found:
+            mismatch['inputs'] = {'file': files[i].decode('utf-8', 'replace')[:2000]}
+            mismatches.append(mismatch)
+    return Outcome(cases, reference_seconds, fast_seconds, mismatches)
+
+
+def _check_csv_chunks(rng, cases: int, rtol: float, atol: float) -> Outcome:
+    return _check_chunks(rng, cases, rtol, atol, _sce_csv, parse_csv_energy_data, CSVEnergyParser)
+
+
+def _check_xml_chunks(rng, cases: int, rtol: float, atol: float) -> Outcome:
+    return _check_chunks(rng, cases, rtol, atol, _green_button_xml, parse_xml_energy_data,
+                         GreenButtonParser)
+
+
+# name -> (check, share of --cases it runs)
+CHECKS: Dict[str, Tuple[Callable[..., Outcome], int]] = {
+    'pv': (_check_pv, 1),
+    'bess': (_check_bess, 1),
+    'finance': (_check_finance, 1),
+    'pipeline': (_check_pipeline, 10),
+    'csv_chunks': (_check_csv_chunks, 20),
+    'xml_chunks': (_check_xml_chunks, 20),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare the batch, memoized and streaming engines with the scalar reference implementations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cases', type=int, default=2000, help='Random cases per check')
+        parser.add_argument('--seed', type=int, help='Seed to reproduce a run; drawn at random if omitted')
+        parser.add_argument('--only', default='', help=f"Comma-separated checks: {', '.join(CHECKS)}")
+        parser.add_argument('--rtol', type=float, default=1e-9)
+        parser.add_argument('--atol', type=float, default=1e-9)
+        parser.add_argument('--output', help='Write the report as JSON to this path')
+
+    def handle(self, *args, **options):
+        names = [name for name in options['only'].split(',') if name] or list(CHECKS)
+        unknown = sorted(set(names) - set(CHECKS))
+        if unknown:
+            raise CommandError(f"Unknown checks: {', '.join(unknown)}")
+        seed = options['seed'] if options['seed'] is not None else secrets.randbits(32)
+        self.stdout.write(f'Seed: {seed}')
+
+        report = {'seed': seed, 'rtol': options['rtol'], 'atol': options['atol'], 'checks': {}}
+        failed = []
+        for index, name in enumerate(CHECKS):
+            if name not in names:
+                continue
+            check, share = CHECKS[name]
+            # One stream per check, so --only reproduces the same cases
+            rng = np.random.default_rng([seed, index])
+            outcome = check(rng, max(1, options['cases'] // share), options['rtol'], options['atol'])
+            speedup = outcome.reference_seconds / outcome.fast_seconds if outcome.fast_seconds else None
+            report['checks'][name] = {
+                'cases': outcome.cases,
+                'reference_seconds': outcome.reference_seconds,
+                'fast_seconds': outcome.fast_seconds,
+                'speedup': speedup,
+                'mismatches': len(outcome.mismatches),
+                'examples': outcome.mismatches[:MAX_REPORTED],
+            }
+            status = 'ok' if not outcome.mismatches else f'{len(outcome.mismatches)} MISMATCHES'
+            self.stdout.write(
+                f"{name:<11} {outcome.cases:>7} cases  reference {outcome.reference_seconds * 1000:9.1f} ms"
+                f"  fast {outcome.fast_seconds * 1000:9.1f} ms  speedup {speedup or 0:7.1f}x  {status}"
+            )
+            for mismatch in outcome.mismatches[:MAX_REPORTED]:
+                self.stdout.write(f"    case {mismatch['case']} {mismatch['output']}: reference "
+                                  f"{mismatch['reference']} fast {mismatch['fast']}")
+                self.stdout.write(f"      inputs {json.dumps(mismatch['inputs'], default=str)[:500]}")
+            if outcome.mismatches:
+                failed.append(name)
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2, default=str))
+            self.stdout.write(f"Wrote {options['output']}")
+
+        if failed:
+            raise CommandError(f"Engines disagree with the reference in {', '.join(failed)}; "
+                               f"reproduce with --seed {seed} --only {','.join(failed)}")
@@ -0,0 +1,108 @@
+"""
+Evaluate one system design across every stored energy profile.
+
+    python manage.py portfolio --max-payback 8
+    python manage.py portfolio --pv-kw 7 --bess-kwh 13.5 --rate 0.30 --workers 8
+    python manage.py portfolio --pv-system 12 --bess-system 7 --financial-params 3
+    python manage.py portfolio --precision float32
+
+Without saved design ids the PV/BESS/financial rows matching the
+options (defaults: 7 kW + 13.5 kWh) are reused, or created the first
+time. Results are stored as a ranked PortfolioRun; the best --top
+profiles are printed. There is no profile limit here, unlike the
+/api/portfolio/ endpoint.
+"""
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from calculator.compute import ComputePool
+from calculator.models import BESSSystem, FinancialParameters, PVSystem
+from calculator.portfolio import DEFAULT_CHUNK_SIZE, run_portfolio
+
+
+def _get_or_create(model, **fields):
+    """The first unowned row with exactly these fields, created if there is none"""
+    fields['user'] = None
+    return model.objects.filter(**fields).order_by('pk').first() or model.objects.create(**fields)
+
+
+class Command(BaseCommand):
+    help = 'Evaluate one PV + BESS design across every stored energy profile and rank the results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--name', default='', help='Name for the portfolio run')
+        parser.add_argument('--pv-system', type=int, help='Existing PVSystem id')
+        parser.add_argument('--bess-system', type=int, help='Existing BESSSystem id')
+        parser.add_argument('--financial-params', type=int, help='Existing FinancialParameters id')
+        parser.add_argument('--pv-kw', type=float, default=7.0)
+        parser.add_argument('--latitude', type=float, default=34.1)
+        parser.add_argument('--longitude', type=float, default=-118.1)
+        parser.add_argument('--bess-kwh', type=float, default=13.5)
+        parser.add_argument('--bess-kw', type=float, default=5.0, help='Max charge/discharge rate')
+        parser.add_argument('--strategy', default='self_consumption',
+                            choices=[choice for choice, _ in BESSSystem.CONTROL_STRATEGIES])
+        parser.add_argument('--rate', type=float, default=0.15, help='Electricity rate per kWh')
+        parser.add_argument('--max-payback', type=float, default=8.0, help='Payback target in years')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Compute processes (0 evaluates inline)')
+        parser.add_argument('--top', type=int, default=10, help='Ranked profiles to print')
+        parser.add_argument('--precision', choices=['auto', 'float64', 'float32'],
+                            help='Batch precision (default: CALCULATOR_BATCH_PRECISION)')
+
+    def _design(self, options):
+        try:
+            if options['pv_system']:
+                pv_system = PVSystem.objects.get(pk=options['pv_system'])
+            else:
+                pv_system = _get_or_create(
+                    PVSystem,
+                    name=f"Portfolio {options['pv_kw']:g} kW", system_size_kw=options['pv_kw'],
+                    latitude=options['latitude'], longitude=options['longitude'],
+                )
+            if options['bess_system']:
+                bess_system = BESSSystem.objects.get(pk=options['bess_system'])
+            else:
+                bess_system = _get_or_create(
+                    BESSSystem,
+                    name=f"Portfolio {options['bess_kwh']:g} kWh", capacity_kwh=options['bess_kwh'],
+                    usable_capacity_kwh=options['bess_kwh'],
+                    max_charge_rate_kw=options['bess_kw'], max_discharge_rate_kw=options['bess_kw'],
+                    control_strategy=options['strategy'],
+                )
+            if options['financial_params']:
+                financial_params = FinancialParameters.objects.get(pk=options['financial_params'])
+            else:
+                financial_params = _get_or_create(
+                    FinancialParameters,
+                    name='Portfolio', electricity_rate=options['rate'],
+                )
+        except (PVSystem.DoesNotExist, BESSSystem.DoesNotExist, FinancialParameters.DoesNotExist) as e:
+            raise CommandError(str(e))
+        return pv_system, bess_system, financial_params
+
+    def handle(self, *args, **options):
+        pv_system, bess_system, financial_params = self._design(options)
+        name = options['name'] or f"{pv_system.system_size_kw:g} kW + {bess_system.capacity_kwh:g} kWh"
+
+        workers = max(0, options['workers'])
+        pool = ComputePool(workers=workers, max_pending=max(1, workers * 2), queue_wait=3600)
+        try:
+            run = run_portfolio(pv_system, bess_system, financial_params, name,
+                                max_payback_years=options['max_payback'],
+                                chunk_size=options['chunk_size'], pool=pool,
+                                precision=options['precision'])
+        finally:
+            pool.shutdown()
+
+        self.stdout.write(
+            f"Portfolio run {run.pk} '{run.name}': {run.profile_count} profiles in "
+            f"{run.duration_seconds:.2f} s, {run.qualifying_count} with payback <= "
+            f"{options['max_payback']:g} years"
+        )
+        for result in run.results.select_related('energy_profile')[:options['top']]:
+            self.stdout.write(
+                f"  #{result.rank:<5} {result.energy_profile.name:<30} "
+                f"payback {result.payback_period_years:6.1f} y  NPV ${result.npv_25_years:>10,.0f}"
+            )
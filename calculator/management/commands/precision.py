@@ -0,0 +1,195 @@
+"""
+Measure what float32 batch runs cost in accuracy against float64.
+
+    python manage.py precision
+    python manage.py precision --scenarios 1000000 --bills 5000 --output precision.json
+    python manage.py precision --tolerance 1e-5
+
+Random fixed-seed designs go through the batch engines once per dtype:
+pv_production_batch -> bess_operation_batch -> financial_metrics_batch for
+annual savings, payback and NPV, and the hourly engine plus NEM 2.0/3.0
+billing (on the bundled SCE load shape when available) for bill totals.
+For each output the command reports the largest and 99th-percentile
+difference, absolute and relative, along with time and array memory per
+dtype. Relative differences are taken against max(|float64 value|, median
+|float64 value|), so results that cross zero (an NPV near break-even) are
+judged against the quantity's typical size rather than against ~0. It fails when a relative difference
+exceeds --tolerance, or when a scenario pays back in one dtype but not
+the other.
+"""
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from calculator.batch import (NO_PAYBACK, STRATEGY_CODES, bess_operation_batch,
+                              financial_metrics_batch, pv_production_batch)
+from calculator.billing import Tariff, bill_representative_days
+from calculator.hourly import dispatch_pv_scenarios, hourly_pv_kw
+from calculator.loadshape import LoadShape, load_shape_from_parsed
+from calculator.models import BESSSystem, PVSystem
+from calculator.utils import parse_energy_data_file
+
+
+BUNDLED_FILE = 'SCE_Usage_8012047060_06-27-22_to_06-30-23.csv'
+DTYPES = {'float64': np.float64, 'float32': np.float32}
+
+
+def _scenarios(rng, count):
+    """Column arrays for ``count`` random designs"""
+    annual = rng.uniform(3000, 20000, count)
+    capacity = rng.choice([0.0, 5.0, 10.0, 13.5, 20.0], count)
+    return {
+        'consumption': annual[:, None] / 12 * rng.uniform(0.7, 1.3, (count, 12)),
+        'pv_kw': rng.uniform(2, 15, count),
+        'latitude': rng.uniform(20, 55, count),
+        'tilt': rng.uniform(10, 40, count),
+        'azimuth': rng.uniform(120, 240, count),
+        'capacity': capacity,
+        'usable': capacity * 0.9,
+        'strategy': rng.choice(np.array(list(STRATEGY_CODES), dtype=object), count),
+        'peak_kw': rng.uniform(3, 12, (count, 12)),
+        'rate': rng.uniform(0.1, 0.45, count),
+        'discount_rate': rng.uniform(0.02, 0.08, count),
+        'inflation': rng.uniform(0.0, 0.05, count),
+    }
+
+
+def _monthly_engines(columns, dtype):
+    production = pv_production_batch(columns['pv_kw'], columns['latitude'], columns['tilt'],
+                                     columns['azimuth'], 0.75, dtype=dtype)
+    operation = bess_operation_batch(columns['consumption'], production,
+                                     columns['capacity'], columns['usable'], 5, 5, 0.9,
+                                     columns['strategy'], columns['peak_kw'], dtype=dtype)
+    annual_savings = operation['total_savings'] * columns['rate'].astype(dtype)
+    metrics = financial_metrics_batch(columns['pv_kw'], columns['capacity'], annual_savings,
+                                      discount_rate=columns['discount_rate'],
+                                      electricity_inflation=columns['inflation'], dtype=dtype)
+    arrays = (production, operation['monthly_savings'], operation['monthly_bess_energy'],
+              operation['monthly_grid_energy'], metrics['npv_25_years'])
+    return {
+        'annual_savings': annual_savings,
+        'payback_period_years': metrics['payback_period_years'],
+        'npv_25_years': metrics['npv_25_years'],
+    }, sum(array.nbytes for array in arrays)
+
+
+def _bills(load_shape, pv_kw, capacity, dtype):
+    """(scenarios,) NEM 2.0 and 3.0 annual bills, with one battery loop per BESS size"""
+    per_kw = hourly_pv_kw(PVSystem(system_size_kw=1.0, latitude=34.1, longitude=-118.1))
+    tariff = Tariff.time_of_use(0.45, 0.25)
+    weights = load_shape.day_weights()
+    bills = {'nem2': np.empty(len(pv_kw)), 'nem3': np.empty(len(pv_kw))}
+    size = 0
+    for value in np.unique(capacity):
+        rows = np.flatnonzero(capacity == value)
+        bess = BESSSystem(capacity_kwh=value, usable_capacity_kwh=value * 0.9,
+                          max_charge_rate_kw=5, max_discharge_rate_kw=5)
+        pv = (pv_kw[rows, None, None, None] * per_kw).astype(dtype)
+        hourly = dispatch_pv_scenarios(load_shape, pv, bess)
+        size += sum(array.nbytes for array in hourly.values())
+        for i, row in enumerate(rows):
+            bill = bill_representative_days({name: flows[i] for name, flows in hourly.items()},
+                                            weights, tariff)
+            for name in bills:
+                bills[name][row] = bill[name]['annual_bill']
+    return bills, size
+
+
+def _bundled_load_shape():
+    path = Path(settings.BASE_DIR) / 'data' / BUNDLED_FILE
+    if not path.exists():
+        return None
+    with open(path, 'rb') as f:
+        return load_shape_from_parsed(parse_energy_data_file(f))
+
+
+def _difference(reference, candidate):
+    reference = np.asarray(reference, dtype=np.float64)
+    absolute = np.abs(np.asarray(candidate, dtype=np.float64) - reference)
+    if not absolute.size:
+        return {'max_abs': 0.0, 'p99_abs': 0.0, 'max_rel': 0.0, 'p99_rel': 0.0}
+    magnitude = np.abs(reference)
+    relative = absolute / np.maximum(magnitude, max(float(np.median(magnitude)), 1e-12))
+    return {
+        'max_abs': float(absolute.max()),
+        'p99_abs': float(np.percentile(absolute, 99)),
+        'max_rel': float(relative.max()),
+        'p99_rel': float(np.percentile(relative, 99)),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Compare float32 batch results with float64 for payback, NPV and bill totals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', type=int, default=100000,
+                            help='Designs run through the monthly engines')
+        parser.add_argument('--bills', type=int, default=1000,
+                            help='Designs run through the hourly engine and billed')
+        parser.add_argument('--seed', type=int, default=1234)
+        parser.add_argument('--tolerance', type=float, default=1e-4,
+                            help='Largest allowed relative difference')
+        parser.add_argument('--output', help='Write the report as JSON to this path')
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        columns = _scenarios(rng, options['scenarios'])
+
+        results, report = {}, {'scenarios': options['scenarios'], 'bills': options['bills'],
+                               'timing_s': {}, 'array_bytes': {}, 'differences': {}}
+        for name, dtype in DTYPES.items():
+            started = time.perf_counter()
+            results[name], report['array_bytes'][name] = _monthly_engines(columns, dtype)
+            report['timing_s'][name] = time.perf_counter() - started
+
+        load_shape = _bundled_load_shape()
+        if load_shape is None:
+            self.stderr.write(f'Bundled data file {BUNDLED_FILE} not found, billing a flat load.')
+            load_shape = LoadShape.flat(columns['consumption'][0])
+        billed = min(options['bills'], options['scenarios'])
+        for name, dtype in DTYPES.items():
+            started = time.perf_counter()
+            bills, size = _bills(load_shape, columns['pv_kw'][:billed], columns['capacity'][:billed], dtype)
+            results[name].update({f'{tariff}_annual_bill': bill for tariff, bill in bills.items()})
+            report['timing_s'][f'{name}_bills'] = time.perf_counter() - started
+            report['array_bytes'][f'{name}_bills'] = size
+
+        reference, candidate = results['float64'], results['float32']
+        pays_back = (reference['payback_period_years'] < NO_PAYBACK,
+                     candidate['payback_period_years'] < NO_PAYBACK)
+        report['payback_flips'] = int((pays_back[0] != pays_back[1]).sum())
+        for key in reference:
+            if key == 'payback_period_years':
+                both = pays_back[0] & pays_back[1]
+                report['differences'][key] = _difference(reference[key][both], candidate[key][both])
+            else:
+                report['differences'][key] = _difference(reference[key], candidate[key])
+
+        for key, difference in report['differences'].items():
+            self.stdout.write(
+                f"{key:<22} max {difference['max_abs']:12.6g} ({difference['max_rel']:9.2e} rel)"
+                f"  p99 {difference['p99_abs']:12.6g} ({difference['p99_rel']:9.2e} rel)"
+            )
+        for name in DTYPES:
+            self.stdout.write(
+                f"{name}: monthly engines {report['timing_s'][name] * 1000:.1f} ms, "
+                f"{report['array_bytes'][name] / 1e6:.1f} MB; hourly + bills "
+                f"{report['timing_s'][f'{name}_bills'] * 1000:.1f} ms, "
+                f"{report['array_bytes'][f'{name}_bills'] / 1e6:.1f} MB"
+            )
+        self.stdout.write(f"Payback flips: {report['payback_flips']}")
+
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+            self.stdout.write(f"Wrote {options['output']}")
+
+        failures = [key for key, difference in report['differences'].items()
+                    if difference['max_rel'] > options['tolerance']]
+        if report['payback_flips']:
+            failures.append('payback_flips')
+        if failures:
+            raise CommandError(f"float32 outside tolerance {options['tolerance']:g}: {', '.join(failures)}")
@@ -0,0 +1,150 @@
+"""
+Opt-in memory profiling of ingest and calculation stages.
+
+``profiled('pv')`` is a no-op unless a profile is being collected, which
+happens when:
+
+- CALCULATOR_MEMORY_PROFILING is True (every request), or
+- it is 'header' and the request sends ``X-Profile-Memory: 1``
+  (MemoryProfileMiddleware), or
+- code calls begin_profile() itself, as the memprofile management
+  command does.
+
+While a profile is collected, each profiled stage records the peak traced
+memory above what was allocated when it started, what it still held when
+it finished, and the source lines behind the largest net allocations (a
+tracemalloc snapshot diff). Nested stages are handled: a parent's peak
+includes its children's.
+
+tracemalloc runs while at least one profile is being collected. It
+traces every thread in the process, so other requests running at the
+same time are slower and show up in the numbers. Stages run on the
+compute pool (calculator.compute) with WORKERS > 0 run in another
+process and are not profiled; use the inline pool or the management
+command.
+"""
+import contextvars
+import linecache
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+
+HEADER = 'HTTP_X_PROFILE_MEMORY'
+TOP_SITES = 5
+# Frames of the profiler itself, left out of the allocation sites
+_IGNORED = (tracemalloc.__file__, linecache.__file__, __file__)
+
+_profile: contextvars.ContextVar[Optional[Dict]] = contextvars.ContextVar(
+    'calculator_memory_profile', default=None)
+# Profiles being collected; tracemalloc stops when the last one ends
+_active = 0
+_owns_tracing = False
+_active_lock = threading.Lock()
+
+
+def is_requested(request) -> bool:
+    """Whether ``request`` should be profiled under the current settings"""
+    mode = getattr(settings, 'CALCULATOR_MEMORY_PROFILING', False)
+    if mode == 'header':
+        return request.META.get(HEADER) == '1'
+    return mode is True
+
+
+def begin_profile(top: int = TOP_SITES):
+    """Start collecting stage profiles in the current context"""
+    global _active, _owns_tracing
+    with _active_lock:
+        if _active == 0:
+            # Leave tracing someone else started (e.g. the bench command) running
+            _owns_tracing = not tracemalloc.is_tracing()
+            if _owns_tracing:
+                tracemalloc.start()
+        _active += 1
+    return _profile.set({'stages': [], 'stack': [], 'started': 0, 'top': top})
+
+
+def end_profile(token) -> List[Dict]:
+    """Stop collecting and return one entry per profiled stage, in starting order"""
+    profile = _profile.get()
+    _profile.reset(token)
+    if profile is None:
+        return []
+    global _active
+    with _active_lock:
+        _active -= 1
+        if _active == 0 and _owns_tracing:
+            tracemalloc.stop()
+    return sorted(profile['stages'], key=lambda entry: entry.pop('order'))
+
+
+def _sites(before, after, top: int) -> List[Dict]:
+    filters = [tracemalloc.Filter(False, filename) for filename in _IGNORED]
+    differences = after.filter_traces(filters).compare_to(before.filter_traces(filters), 'lineno')
+    sites = []
+    for difference in sorted(differences, key=lambda d: d.size_diff, reverse=True)[:top]:
+        if difference.size_diff <= 0:
+            break
+        frame = difference.traceback[0]
+        sites.append({'file': frame.filename, 'line': frame.lineno,
+                      'bytes': difference.size_diff, 'blocks': difference.count_diff})
+    return sites
+
+
+@contextmanager
+def profiled(stage: str):
+    """Profile the enclosed block as ``stage`` when a profile is being collected"""
+    profile = _profile.get()
+    if profile is None or not tracemalloc.is_tracing():
+        yield
+        return
+
+    stack = profile['stack']
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        # reset_peak() below would lose the parent's peak so far
+        stack[-1]['peak'] = max(stack[-1]['peak'], peak)
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    frame = {'start': current, 'peak': current, 'order': profile['started']}
+    profile['started'] += 1
+    stack.append(frame)
+    try:
+        yield
+    finally:
+        stack.pop()
+        current, peak = tracemalloc.get_traced_memory()
+        frame['peak'] = max(frame['peak'], peak)
+        if stack:
+            stack[-1]['peak'] = max(stack[-1]['peak'], frame['peak'])
+        profile['stages'].append({
+            'stage': stage,
+            'order': frame['order'],
+            'depth': len(stack),
+            'peak_bytes': frame['peak'] - frame['start'],
+            'retained_bytes': current - frame['start'],
+            'top_sites': _sites(before, tracemalloc.take_snapshot(), profile['top']),
+        })
+
+
+def profile_header(stages: List[Dict]) -> str:
+    """Peak bytes per stage, for the X-Memory-Profile response header"""
+    peaks: Dict[str, int] = {}
+    for entry in stages:
+        peaks[entry['stage']] = max(peaks.get(entry['stage'], 0), entry['peak_bytes'])
+    return ', '.join(f'{stage};peak={peak}' for stage, peak in peaks.items())
+
+
+def format_profile(stages: List[Dict]) -> str:
+    """Stages indented by nesting, each followed by its top allocation sites"""
+    lines = []
+    for entry in stages:
+        indent = '  ' * entry['depth']
+        lines.append(f"{indent}{entry['stage']}: peak {entry['peak_bytes'] / 1024:.1f} KiB, "
+                     f"retained {entry['retained_bytes'] / 1024:.1f} KiB")
+        for site in entry['top_sites']:
+            lines.append(f"{indent}    {site['bytes'] / 1024:9.1f} KiB  {site['file']}:{site['line']}")
+    return '\n'.join(lines)
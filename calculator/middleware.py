@@ -0,0 +1,202 @@
+import asyncio
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .instrumentation import (REQUEST_DURATION, begin_request, end_request,
+                              is_enabled, is_public, server_timing_header)
+from .memprofile import begin_profile, end_profile, format_profile, is_requested, profile_header
+
+
+logger = logging.getLogger('calculator.memory')
+
+
+class ServerTimingMiddleware:
+    """
+    Collect per-stage timings for each request, expose them in a
+    Server-Timing header when CALCULATOR_TIMING_PUBLIC is set and record
+    the request latency histogram.
+    Works under both WSGI and ASGI without a thread hop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not is_enabled():
+            return self.get_response(request)
+
+        token = begin_request()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            timings = end_request(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not is_enabled():
+            return await self.get_response(request)
+
+        token = begin_request()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timings = end_request(token)
+        return self._finish(request, response, timings, time.perf_counter() - start)
+
+    def _finish(self, request, response, timings, total):
+        match = getattr(request, 'resolver_match', None)
+        REQUEST_DURATION.observe(match.view_name if match else 'unmatched', total)
+        if is_public():
+            response['Server-Timing'] = server_timing_header(timings, total)
+        return response
+
+
+class MemoryProfileMiddleware:
+    """
+    Collect a memory profile (calculator.memprofile) for requests that ask
+    for one, log it with its top allocation sites and put the per-stage
+    peaks in an X-Memory-Profile header. Off unless
+    CALCULATOR_MEMORY_PROFILING is set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not is_requested(request):
+            return self.get_response(request)
+
+        token = begin_profile()
+        try:
+            response = self.get_response(request)
+        finally:
+            stages = end_profile(token)
+        return self._finish(request, response, stages)
+
+    async def __acall__(self, request):
+        if not is_requested(request):
+            return await self.get_response(request)
+
+        token = begin_profile()
+        try:
+            response = await self.get_response(request)
+        finally:
+            stages = end_profile(token)
+        return self._finish(request, response, stages)
+
+    def _finish(self, request, response, stages):
+        if stages:
+            logger.info('Memory profile of %s %s:\n%s', request.method, request.path,
+                        format_profile(stages))
+            response['X-Memory-Profile'] = profile_header(stages)
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that also runs natively under ASGI. WhiteNoise
+    6.6 is sync-only, and one sync middleware makes Django run the whole
+    chain, async views included, through a thread for every request. Here
+    only static files leave the event loop: the file is opened and read on
+    a worker thread and its bytes are sent from the loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            # Looks the path up on disk
+            static_file = await sync_to_async(self.find_file, thread_sensitive=False)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is None:
+            return await self.get_response(request)
+        return await sync_to_async(self._serve_read, thread_sensitive=False)(static_file, request)
+
+    def _serve_read(self, static_file, request):
+        response = self.serve(static_file, request)
+        # Django consumes a sync file iterator under ASGI with a warning
+        # (and another thread hop); static files are small enough to read whole
+        body = b''.join(response.streaming_content)
+        response.streaming_content = _single_chunk(body)
+        return response
+
+
+async def _single_chunk(body):
+    yield body
+
+
+DISCONNECT_SCOPE_KEY = 'calculator.disconnected'
+
+
+class DisconnectMiddleware:
+    """
+    ASGI wrapper that sets an asyncio.Event in ``scope`` when the client
+    disconnects, so streaming views can stop work nobody will read.
+    Django 4.2 stops reading ``receive`` once it has the request body,
+    and uvicorn silently drops writes to a closed connection, so without
+    this a stream runs to the end after the client is gone. Views read the
+    event as ``request.scope[DISCONNECT_SCOPE_KEY]``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        disconnected = asyncio.Event()
+        scope = dict(scope, **{DISCONNECT_SCOPE_KEY: disconnected})
+        watcher = None
+
+        async def watch():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            disconnected.set()
+
+        async def wrapped_receive():
+            nonlocal watcher
+            if watcher is not None:
+                # The watcher owns receive now; anyone else reading waits for the disconnect
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                disconnected.set()
+            elif not message.get('more_body', False):
+                watcher = asyncio.ensure_future(watch())
+            return message
+
+        try:
+            await self.app(scope, wrapped_receive, send)
+        finally:
+            if watcher is not None:
+                watcher.cancel()
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('calculator', '0001_add_file_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='besssystem',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='financialparameters',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='pvsystem',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='besssystem',
+            index=models.Index(fields=['user', 'created_at'], name='calculator__user_id_878a11_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='calculationresult',
+            index=models.Index(fields=['user', 'created_at'], name='calculator__user_id_9adf1f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='energyprofile',
+            index=models.Index(fields=['user', 'created_at'], name='calculator__user_id_e8649a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='financialparameters',
+            index=models.Index(fields=['user', 'created_at'], name='calculator__user_id_104e00_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pvsystem',
+            index=models.Index(fields=['user', 'created_at'], name='calculator__user_id_d48b3c_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0002_user_fks_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='calculationresult',
+            name='interval_results',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
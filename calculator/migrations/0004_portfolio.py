@@ -0,0 +1,55 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:22
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('calculator', '0003_calculationresult_interval_results'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('max_payback_years', models.FloatField(blank=True, help_text='Payback target in years', null=True)),
+                ('profile_count', models.IntegerField(default=0)),
+                ('qualifying_count', models.IntegerField(default=0, help_text='Profiles meeting the payback target')),
+                ('duration_seconds', models.FloatField(default=0)),
+                ('bess_system', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='calculator.besssystem')),
+                ('financial_params', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='calculator.financialparameters')),
+                ('pv_system', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='calculator.pvsystem')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PortfolioResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.IntegerField(help_text='1 = shortest payback')),
+                ('annual_savings', models.FloatField()),
+                ('payback_period_years', models.FloatField()),
+                ('npv_25_years', models.FloatField()),
+                ('energy_profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='calculator.energyprofile')),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='calculator.portfoliorun')),
+            ],
+            options={
+                'ordering': ['run', 'rank'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='portfoliorun',
+            index=models.Index(fields=['user', 'created_at'], name='calculator__user_id_64184f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='portfolioresult',
+            index=models.Index(fields=['run', 'rank'], name='calculator__run_id_160cbf_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0004_portfolio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='energyprofile',
+            name='load_shape',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 14:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calculator', '0005_energyprofile_load_shape'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='energyprofile',
+            name='data_hash',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+    ]
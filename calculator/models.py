@@ -1,7 +1,16 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import JSONObject
 from django.contrib.auth.models import User
+from django.utils import timezone
+import datetime
 import json
 
+from . import intervalstore
+from .loadshape import LoadShape, monthly_peak_demand
+from .series import PackedSeries, pack_series
+
 
 class EnergyProfile(models.Model):
     """Model to store user's energy consumption profile"""
@@ -35,6 +44,14 @@ class EnergyProfile(models.Model):
     annual_consumption = models.FloatField(default=0)
     peak_demand = models.FloatField(default=0)  # kW
     
+    # Month x weekday/weekend x hour mean load and monthly peaks from the
+    # uploaded interval data, see calculator.loadshape
+    load_shape = models.BinaryField(null=True, blank=True, editable=False)
+    
+    # SHA-256 of the uploaded file; its parsed intervals are kept as
+    # memory-mapped columns, see calculator.intervalstore
+    data_hash = models.CharField(max_length=64, blank=True, default='', editable=False)
+    
     def save(self, *args, **kwargs):
         # Calculate annual consumption
         self.annual_consumption = sum([
@@ -54,12 +71,36 @@ class EnergyProfile(models.Model):
             self.oct_consumption, self.nov_consumption, self.dec_consumption
         ]
     
+    def set_load_shape(self, load_shape):
+        """Store a LoadShape as a packed blob (None clears it)"""
+        self.load_shape = load_shape.pack() if load_shape is not None else None
+    
+    def get_load_shape(self):
+        """Return the stored LoadShape, or None for profiles without interval data"""
+        if not self.load_shape:
+            return None
+        return LoadShape.unpack(self.load_shape)
+    
+    def get_interval_data(self):
+        """Memory-mapped interval columns of the uploaded file, or None"""
+        if not self.data_hash:
+            return None
+        return intervalstore.load(self.data_hash)
+    
+    def get_monthly_peak_demand(self):
+        """Measured peak kW per month, else peak_demand for every month, else None"""
+        return monthly_peak_demand(self.load_shape, self.peak_demand)
+    
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at'])]
+    
     def __str__(self):
         return f"{self.name} - {self.annual_consumption:.0f} kWh/year"
 
 
 class PVSystem(models.Model):
     """Model to store PV system specifications"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -78,12 +119,16 @@ class PVSystem(models.Model):
     # Degradation
     annual_degradation = models.FloatField(default=0.005, help_text="Annual degradation rate (0-1)")
     
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at'])]
+    
     def __str__(self):
         return f"{self.name} - {self.system_size_kw} kW"
 
 
 class BESSSystem(models.Model):
     """Model to store BESS system specifications"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -110,12 +155,16 @@ class BESSSystem(models.Model):
     min_soc = models.FloatField(default=0.10, help_text="Minimum state of charge (0-1)")
     max_soc = models.FloatField(default=0.90, help_text="Maximum state of charge (0-1)")
     
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at'])]
+    
     def __str__(self):
         return f"{self.name} - {self.capacity_kwh} kWh"
 
 
 class FinancialParameters(models.Model):
     """Model to store financial parameters for calculations"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     name = models.CharField(max_length=100)
     created_at = models.DateTimeField(auto_now_add=True)
     
@@ -138,6 +187,9 @@ class FinancialParameters(models.Model):
     electricity_inflation = models.FloatField(default=0.03, help_text="Annual electricity rate inflation")
     system_lifetime = models.IntegerField(default=25, help_text="System lifetime in years")
     
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at'])]
+    
     def __str__(self):
         return f"{self.name} - {self.electricity_rate:.2f}/kWh"
 
@@ -165,6 +217,10 @@ class CalculationResult(models.Model):
     monthly_results = models.TextField(default='{}')  # JSON string
     annual_results = models.TextField(default='{}')   # JSON string
     
+    # Per-interval series (grid import/export, SOC, PV, ...) as a compressed
+    # float32 blob, see calculator.series
+    interval_results = models.BinaryField(null=True, blank=True, editable=False)
+    
     def set_monthly_results(self, data):
         """Store monthly results as JSON"""
         self.monthly_results = json.dumps(data)
@@ -181,5 +237,132 @@ class CalculationResult(models.Model):
         """Retrieve annual results from JSON"""
         return json.loads(self.annual_results)
     
+    def set_interval_results(self, series, interval_minutes=60, start=None):
+        """Store per-interval series as a packed float32 blob"""
+        self.interval_results = pack_series(series, interval_minutes, start)
+    
+    def get_interval_results(self):
+        """Return a lazily decoded PackedSeries, or None if nothing was stored"""
+        if not self.interval_results:
+            return None
+        return PackedSeries(self.interval_results)
+    
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at'])]
+    
+    def __str__(self):
+        return f"{self.name} - Payback: {self.payback_period_years:.1f} years" 
+
+
+def _latest_row_subquery(model):
+    """Subquery returning a user's newest ``model`` row as a JSON object"""
+    attnames = [f.attname for f in model._meta.concrete_fields]
+    return Subquery(
+        model.objects.filter(user=OuterRef('user'))
+        .order_by('-created_at')
+        .values(row=JSONObject(**{name: name for name in attnames}))[:1]
+    )
+
+
+def _value_from_json(field, value):
+    """A column value read back out of JSON, as the field's Python type"""
+    if value is None:
+        return None
+    value = field.to_python(value)
+    if isinstance(value, datetime.datetime) and settings.USE_TZ and timezone.is_naive(value):
+        # SQLite writes the stored UTC time without an offset
+        value = timezone.make_aware(value, datetime.timezone.utc)
+    return value
+
+
+def _instance_from_row(model, row, using):
+    """
+    Build a model instance from a JSON row produced by _latest_row_subquery.
+    Fields are read in the model's order, not the JSON object's: PostgreSQL
+    (jsonb) and MySQL return the keys reordered.
+    """
+    fields = model._meta.concrete_fields
+    return model.from_db(using, [f.attname for f in fields],
+                         [_value_from_json(f, row[f.attname]) for f in fields])
+
+
+def _latest_inputs_queryset(user):
+    return (
+        EnergyProfile.objects.filter(user=user)
+        .order_by('-created_at')
+        .annotate(
+            latest_pv_system=_latest_row_subquery(PVSystem),
+            latest_bess_system=_latest_row_subquery(BESSSystem),
+            latest_financial_params=_latest_row_subquery(FinancialParameters),
+        )
+    )
+
+
+def _unpack_latest_inputs(energy_profile):
+    if energy_profile is None:
+        raise EnergyProfile.DoesNotExist("No energy profile found for this user.")
+    
+    inputs = [energy_profile]
+    for model, attr in ((PVSystem, 'latest_pv_system'),
+                        (BESSSystem, 'latest_bess_system'),
+                        (FinancialParameters, 'latest_financial_params')):
+        row = getattr(energy_profile, attr)
+        if row is None:
+            raise model.DoesNotExist(f"No {model._meta.verbose_name} found for this user.")
+        inputs.append(_instance_from_row(model, row, energy_profile._state.db))
+    return tuple(inputs)
+
+
+def get_latest_inputs(user):
+    """
+    Return the user's most recent (energy_profile, pv_system, bess_system,
+    financial_params) using a single query.
+    Raises the DoesNotExist of the first model with no row for the user.
+    """
+    return _unpack_latest_inputs(_latest_inputs_queryset(user).first())
+
+
+async def aget_latest_inputs(user):
+    """Async version of get_latest_inputs()"""
+    return _unpack_latest_inputs(await _latest_inputs_queryset(user).afirst())
+
+
+class PortfolioRun(models.Model):
+    """One system design evaluated across many stored energy profiles"""
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    name = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    # Design evaluated for every profile
+    pv_system = models.ForeignKey(PVSystem, on_delete=models.CASCADE)
+    bess_system = models.ForeignKey(BESSSystem, on_delete=models.CASCADE)
+    financial_params = models.ForeignKey(FinancialParameters, on_delete=models.CASCADE)
+    
+    max_payback_years = models.FloatField(null=True, blank=True, help_text="Payback target in years")
+    profile_count = models.IntegerField(default=0)
+    qualifying_count = models.IntegerField(default=0, help_text="Profiles meeting the payback target")
+    duration_seconds = models.FloatField(default=0)
+    
+    class Meta:
+        indexes = [models.Index(fields=['user', 'created_at'])]
+    
+    def __str__(self):
+        return f"{self.name} - {self.profile_count} profiles"
+
+
+class PortfolioResult(models.Model):
+    """Outcome of a PortfolioRun's design for one energy profile"""
+    run = models.ForeignKey(PortfolioRun, on_delete=models.CASCADE, related_name='results')
+    energy_profile = models.ForeignKey(EnergyProfile, on_delete=models.CASCADE)
+    rank = models.IntegerField(help_text="1 = shortest payback")
+    
+    annual_savings = models.FloatField()
+    payback_period_years = models.FloatField()
+    npv_25_years = models.FloatField()
+    
+    class Meta:
+        ordering = ['run', 'rank']
+        indexes = [models.Index(fields=['run', 'rank'])]
+    
     def __str__(self):
-        return f"{self.name} - Payback: {self.payback_period_years:.1f} years" 
\ No newline at end of file
+        return f"#{self.rank} {self.energy_profile_id} - Payback: {self.payback_period_years:.1f} years"
@@ -0,0 +1,195 @@
+"""
+Staged, memoized calculation pipeline.
+
+run_complete_calculation (calculator.calculation) builds on these stages:
+
+    load, peaks, pv -> dispatch -> billing -> finance
+
+Each stage declares the model fields it reads and the upstream stages it
+depends on. Its output is memoized on a key built from those field
+values and the upstream stages' keys, so editing e.g. ``discount_rate``
+re-runs only the finance stage while PV and battery results come from
+the cache. Hit/miss counts are exported with the other metrics.
+
+The cache keeps its own copy of each output and hands every caller a
+fresh one, so a caller editing its results can't change what later
+callers get.
+"""
+import copy
+import threading
+from collections import OrderedDict
+from operator import attrgetter
+from typing import Any, Callable, Dict, List, Tuple
+
+from django.conf import settings
+
+from .instrumentation import STAGE_CACHE, timed
+from .memprofile import profiled
+from .utils import calculate_bess_operation, calculate_financial_metrics, calculate_pv_production
+
+
+SOURCES = ('energy_profile', 'pv_system', 'bess_system', 'financial_params')
+
+
+class Stage:
+    """One pipeline step: ``compute(sources, upstream)`` -> output"""
+
+    def __init__(self, name: str, fields: Dict[str, List[str]], depends: Tuple[str, ...],
+                 compute: Callable[[Dict[str, Any], Dict[str, Any]], Any]):
+        self.name = name
+        self.fields = fields
+        self.depends = depends
+        self.compute = compute
+        self._getters = [(source, attrgetter(*names)) for source, names in fields.items()]
+
+    def key(self, sources: Dict[str, Any], upstream_keys: Dict[str, tuple]) -> tuple:
+        """Hashable key of this stage's field values and its upstream keys"""
+        values = tuple(getter(sources[source]) for source, getter in self._getters)
+        return values, tuple(upstream_keys[name] for name in self.depends)
+
+
+def _load(sources, upstream):
+    return sources['energy_profile'].get_monthly_consumption()
+
+
+def _peaks(sources, upstream):
+    return sources['energy_profile'].get_monthly_peak_demand()
+
+
+def _pv(sources, upstream):
+    pv_system = sources['pv_system']
+    # Production doesn't depend on the load; the first argument is unused
+    return calculate_pv_production(
+        [0.0] * 12, pv_system.system_size_kw,
+        pv_system.latitude, pv_system.longitude,
+        pv_system.tilt_angle, pv_system.azimuth,
+        pv_system.system_efficiency
+    )
+
+
+def _dispatch(sources, upstream):
+    bess_system = sources['bess_system']
+    return calculate_bess_operation(
+        upstream['load'], upstream['pv'],
+        bess_system.capacity_kwh, bess_system.usable_capacity_kwh,
+        bess_system.max_charge_rate_kw, bess_system.max_discharge_rate_kw,
+        bess_system.round_trip_efficiency, bess_system.control_strategy,
+        upstream['peaks']
+    )
+
+
+def _billing(sources, upstream):
+    return upstream['dispatch']['total_savings'] * sources['financial_params'].electricity_rate
+
+
+def _finance(sources, upstream):
+    pv_system = sources['pv_system']
+    bess_system = sources['bess_system']
+    financial_params = sources['financial_params']
+    return calculate_financial_metrics(
+        pv_system.system_size_kw, bess_system.capacity_kwh,
+        upstream['billing'],
+        financial_params.pv_cost_per_kw, financial_params.bess_cost_per_kwh,
+        financial_params.installation_cost_percent, financial_params.federal_tax_credit,
+        financial_params.state_incentive, financial_params.discount_rate,
+        financial_params.electricity_inflation, financial_params.system_lifetime
+    )
+
+
+MONTHLY_FIELDS = [
+    'jan_consumption', 'feb_consumption', 'mar_consumption', 'apr_consumption',
+    'may_consumption', 'jun_consumption', 'jul_consumption', 'aug_consumption',
+    'sep_consumption', 'oct_consumption', 'nov_consumption', 'dec_consumption',
+]
+
+# In dependency order
+STAGES = [
+    Stage('load', {'energy_profile': MONTHLY_FIELDS}, (), _load),
+    Stage('peaks', {'energy_profile': ['load_shape', 'peak_demand']}, (), _peaks),
+    Stage('pv', {'pv_system': ['system_size_kw', 'latitude', 'longitude', 'tilt_angle',
+                               'azimuth', 'system_efficiency']},
+          (), _pv),
+    Stage('dispatch', {'bess_system': ['capacity_kwh', 'usable_capacity_kwh', 'max_charge_rate_kw',
+                                       'max_discharge_rate_kw', 'round_trip_efficiency',
+                                       'control_strategy']},
+          ('load', 'pv', 'peaks'), _dispatch),
+    Stage('billing', {'financial_params': ['electricity_rate']}, ('dispatch',), _billing),
+    Stage('finance', {'pv_system': ['system_size_kw'],
+                      'bess_system': ['capacity_kwh'],
+                      'financial_params': ['pv_cost_per_kw', 'bess_cost_per_kwh',
+                                           'installation_cost_percent', 'federal_tax_credit',
+                                           'state_incentive', 'discount_rate',
+                                           'electricity_inflation', 'system_lifetime']},
+          ('billing',), _finance),
+]
+
+
+class StageCache:
+    """Per-stage LRU of stage outputs keyed by Stage.key()"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: Dict[str, OrderedDict] = {}
+        self._lock = threading.Lock()
+
+    def get(self, stage: str, key: tuple):
+        with self._lock:
+            entries = self._entries.get(stage)
+            if entries is None or key not in entries:
+                return False, None
+            entries.move_to_end(key)
+            value = entries[key]
+        return True, copy.deepcopy(value)
+
+    def put(self, stage: str, key: tuple, value):
+        value = copy.deepcopy(value)
+        with self._lock:
+            entries = self._entries.setdefault(stage, OrderedDict())
+            entries[key] = value
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = StageCache(getattr(settings, 'CALCULATOR_STAGE_CACHE_SIZE', 256))
+
+
+def run_pipeline(energy_profile, pv_system, bess_system, financial_params) -> Dict[str, Any]:
+    """Run every stage, reusing memoized outputs; returns {stage name: output}"""
+    sources = dict(zip(SOURCES, (energy_profile, pv_system, bess_system, financial_params)))
+    outputs: Dict[str, Any] = {}
+    keys: Dict[str, tuple] = {}
+
+    for stage in STAGES:
+        key = stage.key(sources, keys)
+        hit, output = _cache.get(stage.name, key)
+        if hit:
+            STAGE_CACHE.inc(stage.name, 'hit')
+        else:
+            STAGE_CACHE.inc(stage.name, 'miss')
+            with timed(stage.name), profiled(stage.name):
+                output = stage.compute(sources, {name: outputs[name] for name in stage.depends})
+            _cache.put(stage.name, key, output)
+        outputs[stage.name] = output
+        keys[stage.name] = key
+
+    return outputs
+
+
+def stage_stats() -> Dict[str, Dict[str, int]]:
+    """Hit/miss counts per stage for this process"""
+    return {
+        stage.name: {
+            'hits': STAGE_CACHE.get(stage.name, 'hit'),
+            'misses': STAGE_CACHE.get(stage.name, 'miss'),
+        }
+        for stage in STAGES
+    }
+
+
+def clear_stage_cache():
+    _cache.clear()
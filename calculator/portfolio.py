@@ -0,0 +1,204 @@
+"""
+Portfolio mode: one system design evaluated across many energy profiles.
+
+Profiles are streamed from the database with ``.values_list().iterator()``
+(ids and monthly consumption only, plus peak demand when the design uses
+peak shaving), packed into (rows, 12) float arrays and evaluated chunk by
+chunk with the vectorized engines in calculator.batch. Chunks run on a
+ComputePool, so with workers > 0 they are spread across processes while
+the next chunk is being read. At most one chunk per worker is in flight:
+reading waits for the oldest to finish, so only a few chunks of inputs
+are in memory at a time.
+
+A request waits for its run to finish and be written back, so the view
+caps portfolios at CALCULATOR_PORTFOLIO_MAX_PROFILES, one chunk by default
+(run_portfolio raises PortfolioTooLarge); bigger ones go through
+``python manage.py portfolio``.
+
+Results are ranked by payback (ties broken by higher NPV) and written
+back with bulk_create. Runs over enough profiles switch to float32 under
+the CALCULATOR_BATCH_PRECISION policy (see calculator.batch.batch_dtype).
+"""
+import time
+from collections import deque
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .batch import batch_dtype, bess_operation_batch, financial_metrics_batch, pv_production_batch
+from .compute import ComputePool
+from .loadshape import monthly_peak_demand
+from .models import EnergyProfile, PortfolioResult, PortfolioRun
+from .pipeline import MONTHLY_FIELDS, STAGES
+
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_MAX_REQUEST_PROFILES = DEFAULT_CHUNK_SIZE
+
+
+class PortfolioTooLarge(Exception):
+    """Raised when a portfolio has more profiles than the caller allows."""
+
+
+def max_request_profiles() -> int:
+    """Most profiles a portfolio started from a request may cover"""
+    return getattr(settings, 'CALCULATOR_PORTFOLIO_MAX_PROFILES', DEFAULT_MAX_REQUEST_PROFILES)
+
+
+def design_values(pv_system, bess_system, financial_params) -> Dict[str, Dict]:
+    """Plain (picklable) copy of every design field a pipeline stage reads"""
+    sources = {'pv_system': pv_system, 'bess_system': bess_system,
+               'financial_params': financial_params}
+    design = {source: {} for source in sources}
+    for stage in STAGES:
+        for source, names in stage.fields.items():
+            if source in sources:
+                for name in names:
+                    design[source][name] = getattr(sources[source], name)
+    return design
+
+
+def evaluate_chunk(monthly_consumption: np.ndarray, design: Dict[str, Dict],
+                   monthly_peak_demand: Optional[np.ndarray] = None,
+                   dtype=np.float64) -> Dict[str, np.ndarray]:
+    """
+    Evaluate ``design`` for every row of a (rows, 12) monthly consumption array.
+    Same results as run_complete_calculation per row (to float32 rounding
+    with ``dtype=np.float32``).
+    """
+    pv = design['pv_system']
+    bess = design['bess_system']
+    fin = design['financial_params']
+
+    # The PV estimate doesn't depend on the load, so one row serves every profile
+    monthly_pv = pv_production_batch(pv['system_size_kw'], pv['latitude'], pv['tilt_angle'],
+                                     pv['azimuth'], pv['system_efficiency'], pv['longitude'],
+                                     dtype=dtype)
+    operation = bess_operation_batch(
+        monthly_consumption, monthly_pv,
+        bess['capacity_kwh'], bess['usable_capacity_kwh'],
+        bess['max_charge_rate_kw'], bess['max_discharge_rate_kw'],
+        bess['round_trip_efficiency'], bess['control_strategy'], monthly_peak_demand,
+        dtype=dtype,
+    )
+    annual_savings = operation['total_savings'] * fin['electricity_rate']
+    metrics = financial_metrics_batch(
+        pv['system_size_kw'], bess['capacity_kwh'], annual_savings,
+        fin['pv_cost_per_kw'], fin['bess_cost_per_kwh'], fin['installation_cost_percent'],
+        fin['federal_tax_credit'], fin['state_incentive'], fin['discount_rate'],
+        fin['electricity_inflation'], fin['system_lifetime'],
+        dtype=dtype,
+    )
+    return {
+        'annual_savings': annual_savings,
+        'payback_period_years': metrics['payback_period_years'],
+        'npv_25_years': metrics['npv_25_years'],
+    }
+
+
+def _evaluate_chunk_task(ids: np.ndarray, monthly_consumption: np.ndarray, design,
+                         monthly_peak_demand: Optional[np.ndarray] = None, dtype=np.float64):
+    return ids, evaluate_chunk(monthly_consumption, design, monthly_peak_demand, dtype)
+
+
+def iter_profile_chunks(queryset, chunk_size: int = DEFAULT_CHUNK_SIZE, with_peaks: bool = False
+                        ) -> Iterator[Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]]:
+    """
+    Yield (ids, (rows, 12) monthly consumption, (rows, 12) monthly peak kW or
+    None) chunks without building model instances. Peaks are 0 where unknown.
+    """
+    fields = ['id'] + MONTHLY_FIELDS
+    if with_peaks:
+        fields += ['peak_demand', 'load_shape']
+    rows = queryset.order_by().values_list(*fields).iterator(chunk_size=chunk_size)
+    buffer = []
+    for row in rows:
+        buffer.append(row)
+        if len(buffer) == chunk_size:
+            yield _pack(buffer, with_peaks)
+            buffer = []
+    if buffer:
+        yield _pack(buffer, with_peaks)
+
+
+def _pack(rows, with_peaks: bool) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    width = 1 + len(MONTHLY_FIELDS)
+    packed = np.array([row[:width] for row in rows] if with_peaks else rows, dtype=np.float64)
+    peaks = None
+    if with_peaks:
+        peaks = np.array([monthly_peak_demand(load_shape, peak_demand) or [0.0] * 12
+                          for peak_demand, load_shape in (row[width:] for row in rows)])
+    return packed[:, 0].astype(np.int64), packed[:, 1:], peaks
+
+
+def run_portfolio(pv_system, bess_system, financial_params, name: str,
+                  user=None, max_payback_years: Optional[float] = None,
+                  queryset=None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  pool: Optional[ComputePool] = None,
+                  precision: Optional[str] = None,
+                  max_profiles: Optional[int] = None) -> PortfolioRun:
+    """
+    Evaluate a saved design across ``queryset`` (default: every EnergyProfile)
+    and store a ranked PortfolioRun. ``pool`` defaults to inline evaluation;
+    ``precision`` overrides CALCULATOR_BATCH_PRECISION. Raises
+    PortfolioTooLarge before evaluating anything if there are more than
+    ``max_profiles`` profiles.
+    """
+    if queryset is None:
+        queryset = EnergyProfile.objects.all()
+    if pool is None:
+        pool = ComputePool(workers=0, max_pending=1)
+    count = queryset.count()
+    if max_profiles is not None and count > max_profiles:
+        raise PortfolioTooLarge(f"{count} profiles is more than the {max_profiles} allowed here; "
+                                "run 'python manage.py portfolio' instead.")
+    dtype = batch_dtype(count * len(MONTHLY_FIELDS), precision)
+
+    started = time.perf_counter()
+    design = design_values(pv_system, bess_system, financial_params)
+    # Only peak shaving looks at peak demand, so skip the blobs otherwise
+    with_peaks = bess_system.control_strategy == 'peak_shaving'
+    window = 1 if pool.inline else max(1, min(pool.workers, pool.max_pending))
+    pending = deque()
+    chunks = []
+    for ids, monthly, peaks in iter_profile_chunks(queryset, chunk_size, with_peaks):
+        if len(pending) >= window:
+            chunks.append(pending.popleft().result())
+        pending.append(pool.submit(_evaluate_chunk_task, ids, monthly, design, peaks, dtype))
+    chunks.extend(future.result() for future in pending)
+
+    if chunks:
+        ids = np.concatenate([chunk_ids for chunk_ids, _ in chunks])
+        columns = {key: np.concatenate([result[key] for _, result in chunks])
+                   for key in chunks[0][1]}
+    else:
+        ids = np.empty(0, dtype=np.int64)
+        columns = {key: np.empty(0) for key in ('annual_savings', 'payback_period_years', 'npv_25_years')}
+
+    payback = columns['payback_period_years']
+    order = np.lexsort((-columns['npv_25_years'], payback))
+    qualifying = int((payback <= max_payback_years).sum()) if max_payback_years is not None else 0
+
+    with transaction.atomic():
+        run = PortfolioRun.objects.create(
+            user=user, name=name,
+            pv_system=pv_system, bess_system=bess_system, financial_params=financial_params,
+            max_payback_years=max_payback_years,
+            profile_count=len(ids), qualifying_count=qualifying,
+        )
+        ids_list = ids[order].tolist()
+        savings_list = columns['annual_savings'][order].tolist()
+        payback_list = payback[order].tolist()
+        npv_list = columns['npv_25_years'][order].tolist()
+        PortfolioResult.objects.bulk_create(
+            (PortfolioResult(run=run, energy_profile_id=profile_id, rank=rank,
+                             annual_savings=savings, payback_period_years=years, npv_25_years=npv)
+             for rank, (profile_id, savings, years, npv)
+             in enumerate(zip(ids_list, savings_list, payback_list, npv_list), start=1)),
+            batch_size=chunk_size,
+        )
+        run.duration_seconds = time.perf_counter() - started
+        run.save(update_fields=['duration_seconds'])
+    return run
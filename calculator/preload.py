@@ -0,0 +1,133 @@
+"""
+Build the read-only tables once, before web workers fork.
+
+The server entry points (pv_bess_calculator.wsgi and .asgi) call
+preload_server() after setting Django up. Under ``gunicorn --preload``
+they are imported in the master, so it runs there once and every worker
+forked after it inherits what preload() built instead of building its own
+copy on its first request:
+
+- the weather library: station headers and the KD-tree over them;
+- each station's irradiance array, memory-mapped from its ``.npy`` cache
+  (parsed and cached first if needed), so workers share the pages through
+  the page cache;
+- per-kW PV profiles of every station at the model's default tilt and
+  azimuth, the orientation most systems use;
+- the module-level solar, calendar and export-rate tables, imported and
+  marked read-only so nothing can write to (and un-share) them.
+
+It ends with gc.freeze(), which moves everything allocated so far out of
+the collector's reach. Otherwise each worker's first collection writes to
+the header of every inherited object and copies its page.
+
+Without ``--preload`` (runserver, plain gunicorn) each serving process
+runs this during its own start-up instead, which still moves the cost out
+of the first request. Nothing else imports the entry points, so migrate,
+other management commands, the test runner and the compute pool's
+processes don't pay for it; there the tables build lazily on first use.
+Set CALCULATOR_PRELOAD = False to skip it in the server too.
+"""
+import gc
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+
+
+logger = logging.getLogger('calculator.preload')
+
+REPORT: List[Dict] = []
+
+
+@contextmanager
+def _step(report: List[Dict], table: str):
+    entry = {'table': table, 'items': 0, 'bytes': 0}
+    started = time.perf_counter()
+    yield entry
+    entry['seconds'] = time.perf_counter() - started
+    report.append(entry)
+
+
+def _freeze(array: np.ndarray) -> int:
+    array.setflags(write=False)
+    return array.nbytes
+
+
+def preload(freeze_gc: bool = True) -> List[Dict]:
+    """
+    Build every shared table and return what was built: one
+    {'table', 'items', 'bytes', 'seconds'} entry per table.
+    """
+    from . import batch, billing, degradation, hourly, loadshape
+    from .models import PVSystem
+    from .weather import _profile, library
+
+    report: List[Dict] = []
+    with _step(report, 'solar_tables') as entry:
+        tables = [batch.SOLAR_RADIATION, batch.DAYS_PER_MONTH, hourly.SOLAR_CURVE,
+                  loadshape.DAYS_PER_MONTH, loadshape.DEFAULT_DAY_SPLIT,
+                  billing.DEFAULT_EXPORT_RATES, degradation.DEPTH_BINS]
+        entry['items'] = len(tables)
+        entry['bytes'] = sum(_freeze(table) for table in tables)
+
+    with _step(report, 'weather_library') as entry:
+        weather = library()
+        entry['items'] = len(weather)
+
+    with _step(report, 'irradiance') as entry:
+        for station in weather.stations:
+            entry['bytes'] += weather.irradiance(station).nbytes
+        entry['items'] = len(weather.stations)
+
+    with _step(report, 'pv_profiles') as entry:
+        tilt = PVSystem._meta.get_field('tilt_angle').default
+        azimuth = PVSystem._meta.get_field('azimuth').default
+        for station in weather.stations:
+            profile = _profile(station, float(tilt), float(azimuth))
+            entry['bytes'] += _freeze(profile.monthly_kwh) + _freeze(profile.month_hour_kw)
+        entry['items'] = len(weather.stations)
+
+    if freeze_gc:
+        with _step(report, 'gc_freeze') as entry:
+            gc.collect()
+            gc.freeze()
+            entry['items'] = gc.get_freeze_count()
+            # Objects, not a table; their size isn't measured
+            entry['bytes'] = None
+
+    REPORT[:] = report
+    return report
+
+
+def _kib(size: Optional[int]) -> str:
+    return f'{size / 1024:>10.1f} KiB' if size is not None else f"{'':>14}"
+
+
+def format_report(report: Optional[List[Dict]] = None) -> str:
+    """One line per table, then the total"""
+    report = REPORT if report is None else report
+    lines = [f"{entry['table']:<16} {entry['items']:>6} items {_kib(entry['bytes'])} "
+             f"{entry['seconds'] * 1000:>9.1f} ms" for entry in report]
+    total = sum(entry['seconds'] for entry in report)
+    size = sum(entry['bytes'] for entry in report if entry['bytes'] is not None)
+    lines.append(f"{'total':<16} {'':>6}       {_kib(size)} {total * 1000:>9.1f} ms")
+    return '\n'.join(lines)
+
+
+def preload_server():
+    """
+    preload() for a server entry point, unless CALCULATOR_PRELOAD is False.
+    Never raises; the tables build again lazily on first use.
+    """
+    if not getattr(settings, 'CALCULATOR_PRELOAD', True):
+        return
+    try:
+        report = preload()
+    except Exception:
+        logger.exception('Preloading calculator tables failed')
+        return
+    logger.info('Preloaded calculator tables:\n%s', format_report(report))
+
@@ -0,0 +1,157 @@
+"""
+One-at-a-time sensitivity (tornado) analysis.
+
+Every numeric PVSystem, BESSSystem and FinancialParameters field that
+the pipeline actually reads is moved down and up by a configurable
+amount, one at a time. The base case and every perturbation become rows
+of one batch that runs through the vectorized PV, battery and financial
+engines (calculator.batch) together. Rows that only move a financial
+field share the base row's PV and battery results, so only the base and
+the other rows are simulated. The shared stage cache is not used, so a
+tornado chart doesn't evict other users' memoized stages.
+"""
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .batch import bess_operation_batch, financial_metrics_batch, pv_production_batch
+from .pipeline import STAGES
+
+
+DEFAULT_STEP = ('relative', 0.10)
+FINANCE_STAGES = {'billing', 'finance'}
+SOURCES = ('pv_system', 'bess_system', 'financial_params')
+# Arguments of financial_metrics_batch, by where they come from
+FINANCE_FIELDS = [
+    ('pv_system', 'system_size_kw'), ('bess_system', 'capacity_kwh'),
+    ('financial_params', 'pv_cost_per_kw'), ('financial_params', 'bess_cost_per_kwh'),
+    ('financial_params', 'installation_cost_percent'), ('financial_params', 'federal_tax_credit'),
+    ('financial_params', 'state_incentive'), ('financial_params', 'discount_rate'),
+    ('financial_params', 'electricity_inflation'), ('financial_params', 'system_lifetime'),
+]
+
+
+def sensitivity_fields() -> List[Tuple[str, str, bool]]:
+    """
+    (source, field, financial_only) for every numeric input a pipeline stage
+    reads; fields nothing reads would only produce zero-width bars.
+    """
+    readers: Dict[Tuple[str, str], set] = {}
+    for stage in STAGES:
+        for source, names in stage.fields.items():
+            if source not in SOURCES:
+                continue
+            for name in names:
+                readers.setdefault((source, name), set()).add(stage.name)
+    return [
+        (source, name, stages <= FINANCE_STAGES)
+        for (source, name), stages in readers.items()
+        if name != 'control_strategy'
+    ]
+
+
+def _perturbed_value(value, field_name, direction, step):
+    kind, amount = step
+    if kind == 'absolute':
+        new_value = value + direction * amount
+    else:
+        new_value = value * (1 + direction * amount)
+    if field_name == 'system_lifetime':
+        new_value = max(1, int(round(new_value)))
+    return new_value
+
+
+def run_sensitivity(energy_profile, pv_system, bess_system, financial_params,
+                    steps: Optional[Dict[str, Tuple[str, float]]] = None,
+                    default_step: Tuple[str, float] = DEFAULT_STEP) -> Dict:
+    """
+    Tornado-chart data for payback and NPV.
+    ``steps`` maps 'source.field' (e.g. 'financial_params.bess_cost_per_kwh')
+    to ('relative', 0.1) or ('absolute', 100); other fields use ``default_step``.
+    Raises ValueError for a ``steps`` key that isn't a sensitivity field.
+    """
+    steps = steps or {}
+    fields = sensitivity_fields()
+    known = {f'{source}.{name}' for source, name, _ in fields}
+    unknown = sorted(set(steps) - known)
+    if unknown:
+        raise ValueError(f"Unknown field '{unknown[0]}'")
+
+    base_sources = {'pv_system': pv_system, 'bess_system': bess_system,
+                    'financial_params': financial_params}
+
+    # Row 0 is the base; then (low, high) for every field
+    cases = 1 + 2 * len(fields)
+    columns = {(source, name): np.full(cases, float(getattr(base_sources[source], name)))
+               for source, name, _ in fields}
+    for i, (source, name, _) in enumerate(fields):
+        step = steps.get(f'{source}.{name}', default_step)
+        base_value = getattr(base_sources[source], name)
+        columns[(source, name)][1 + 2 * i] = _perturbed_value(base_value, name, -1, step)
+        columns[(source, name)][2 + 2 * i] = _perturbed_value(base_value, name, 1, step)
+
+    # Financial-only rows reuse the base row's simulation (row 0)
+    simulated = [0] + [row for i, (_, _, financial_only) in enumerate(fields)
+                       if not financial_only for row in (1 + 2 * i, 2 + 2 * i)]
+    simulation_row = np.zeros(cases, dtype=np.intp)
+    simulation_row[simulated] = np.arange(len(simulated))
+
+    def column(source, name):
+        return columns[(source, name)]
+
+    def simulated_column(source, name):
+        return columns[(source, name)][simulated]
+
+    # Same stages as the pipeline, one row per simulated case
+    pv = pv_production_batch(
+        simulated_column('pv_system', 'system_size_kw'), simulated_column('pv_system', 'latitude'),
+        simulated_column('pv_system', 'tilt_angle'), simulated_column('pv_system', 'azimuth'),
+        simulated_column('pv_system', 'system_efficiency'),
+        longitude=simulated_column('pv_system', 'longitude'),
+    )
+    dispatch = bess_operation_batch(
+        energy_profile.get_monthly_consumption(), pv,
+        simulated_column('bess_system', 'capacity_kwh'),
+        simulated_column('bess_system', 'usable_capacity_kwh'),
+        simulated_column('bess_system', 'max_charge_rate_kw'),
+        simulated_column('bess_system', 'max_discharge_rate_kw'),
+        simulated_column('bess_system', 'round_trip_efficiency'), bess_system.control_strategy,
+        energy_profile.get_monthly_peak_demand(),
+    )
+    total_savings = dispatch['total_savings'][simulation_row]
+    annual_savings = total_savings * column('financial_params', 'electricity_rate')
+    metrics = financial_metrics_batch(
+        column('pv_system', 'system_size_kw'), column('bess_system', 'capacity_kwh'),
+        annual_savings, *[column(*key) for key in FINANCE_FIELDS[2:]]
+    )
+    payback = metrics['payback_period_years']
+    npv = metrics['npv_25_years']
+
+    bars = []
+    for i, (source, name, financial_only) in enumerate(fields):
+        low, high = 1 + 2 * i, 2 + 2 * i
+        model_field = base_sources[source]._meta.get_field(name)
+        base_value = getattr(base_sources[source], name)
+        step = steps.get(f'{source}.{name}', default_step)
+        bars.append({
+            'field': f'{source}.{name}',
+            'label': str(model_field.verbose_name).capitalize(),
+            'financial_only': financial_only,
+            'base_value': base_value,
+            'low_value': _perturbed_value(base_value, name, -1, step),
+            'high_value': _perturbed_value(base_value, name, 1, step),
+            'payback_period_years': [float(payback[low]), float(payback[high])],
+            'npv_25_years': [float(npv[low]), float(npv[high])],
+            'npv_swing': float(abs(npv[high] - npv[low])),
+        })
+    bars.sort(key=lambda bar: bar['npv_swing'], reverse=True)
+
+    return {
+        'base': {
+            'payback_period_years': float(payback[0]),
+            'npv_25_years': float(npv[0]),
+        },
+        'bars': bars,
+        'cases_evaluated': cases,
+        'cases_simulated': len(simulated),
+    }
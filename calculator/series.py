@@ -0,0 +1,106 @@
+"""
+Compact binary storage for per-interval simulation series.
+
+A packed blob holds any number of named series (grid import/export, SOC, PV,
+...) of equal or differing lengths. Each series is stored as float32,
+byte-shuffled and zlib-compressed on its own, so reading one series for a
+chart never touches the others. The layout is:
+
+    b'PVS1' | uint32 header length | JSON header | compressed series ...
+"""
+import json
+import struct
+import zlib
+from collections.abc import Mapping
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+
+MAGIC = b'PVS1'
+_HEADER_LENGTH = struct.Struct('<I')
+_DTYPE = np.dtype('<f4')
+
+
+def _shuffle(values: np.ndarray) -> bytes:
+    """Group the bytes of each float32 by significance so zlib sees long runs"""
+    return values.view(np.uint8).reshape(-1, _DTYPE.itemsize).T.tobytes()
+
+
+def _unshuffle(raw: bytes, length: int) -> np.ndarray:
+    planes = np.frombuffer(raw, dtype=np.uint8).reshape(_DTYPE.itemsize, length)
+    return np.ascontiguousarray(planes.T).view(_DTYPE).reshape(length)
+
+
+def pack_series(series: Dict[str, Iterable[float]], interval_minutes: int = 60,
+                start: Optional[str] = None, level: int = 6) -> bytes:
+    """
+    Pack named numeric series into a compressed float32 blob.
+    ``start`` is an optional ISO timestamp of the first interval.
+    """
+    entries = []
+    chunks = []
+    offset = 0
+    for name, values in series.items():
+        array = np.ascontiguousarray(np.asarray(values, dtype=_DTYPE))
+        chunk = zlib.compress(_shuffle(array), level)
+        entries.append({'name': name, 'length': int(array.size),
+                        'offset': offset, 'size': len(chunk)})
+        chunks.append(chunk)
+        offset += len(chunk)
+
+    header = json.dumps({
+        'interval_minutes': interval_minutes,
+        'start': start,
+        'series': entries,
+    }, separators=(',', ':')).encode('utf-8')
+    return b''.join([MAGIC, _HEADER_LENGTH.pack(len(header)), header] + chunks)
+
+
+class PackedSeries(Mapping):
+    """
+    Read-only, lazily decoded view over a blob produced by pack_series.
+    Only the header is parsed up front; each series is decompressed the
+    first time it is requested and then cached.
+    """
+
+    def __init__(self, blob: bytes):
+        blob = bytes(blob)  # BinaryField may hand back a memoryview
+        if blob[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a packed series blob")
+
+        header_start = len(MAGIC) + _HEADER_LENGTH.size
+        (header_length,) = _HEADER_LENGTH.unpack_from(blob, len(MAGIC))
+        header = json.loads(blob[header_start:header_start + header_length])
+
+        self._blob = blob
+        self._data_start = header_start + header_length
+        self._entries = {entry['name']: entry for entry in header['series']}
+        self._decoded = {}
+        self.interval_minutes = header['interval_minutes']
+        self.start = header['start']
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        if name not in self._decoded:
+            entry = self._entries[name]
+            begin = self._data_start + entry['offset']
+            raw = zlib.decompress(self._blob[begin:begin + entry['size']])
+            array = _unshuffle(raw, entry['length'])
+            array.flags.writeable = False
+            self._decoded[name] = array
+        return self._decoded[name]
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def length(self, name: str) -> int:
+        """Number of points in a series, without decoding it"""
+        return self._entries[name]['length']
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the packed blob in bytes"""
+        return len(self._blob)
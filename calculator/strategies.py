@@ -0,0 +1,102 @@
+"""
+Side-by-side comparison of the BESS control strategies.
+
+Every strategy is dispatched by the hourly engine (calculator.hourly) on
+the profile's load shape, or a flat one for manual entries. The strategies
+step through one battery loop together and are billed with one tariff,
+one set of day weights and one no-system baseline bill. The monthly
+engine isn't used here: its strategy branches don't share a model of PV
+(peak shaving credits all PV at retail, time of use ignores it), so its
+savings can't be ranked against each other.
+
+Every column of a row comes from the same bills: the grid energy saved,
+the NEM 2.0 and NEM 3.0 savings, and the payback, NPV and IRR of the
+NEM 3.0 savings from a single financial_metrics_batch call. The best
+strategy is the one with the highest NPV, with shorter payback breaking
+ties.
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+from .batch import financial_metrics_batch
+from .billing import Tariff, bill_representative_days
+from .hourly import dispatch_strategies
+from .loadshape import LoadShape
+from .models import BESSSystem
+from .pipeline import run_pipeline
+
+
+STRATEGIES = [name for name, _ in BESSSystem.CONTROL_STRATEGIES]
+STRATEGY_LABELS = dict(BESSSystem.CONTROL_STRATEGIES)
+TARIFFS = ('nem2', 'nem3')
+# Annual savings, payback and NPV are under this tariff
+RANKING_TARIFF = 'nem3'
+
+
+def _net_energy_cost(bill: Dict) -> np.ndarray:
+    return np.asarray(bill['monthly_energy_charges']) - np.asarray(bill['monthly_export_credits'])
+
+
+def compare_strategies(energy_profile, pv_system, bess_system, financial_params,
+                       stages: Optional[Dict] = None) -> Dict:
+    """
+    Every control strategy for one design. ``stages`` is a run_pipeline
+    result to reuse; only its load output is read, for profiles without a
+    load shape.
+    """
+    load_shape = energy_profile.get_load_shape()
+    if load_shape is None:
+        if stages is None:
+            stages = run_pipeline(energy_profile, pv_system, bess_system, financial_params)
+        load_shape = LoadShape.flat(stages['load'])
+
+    tariff = Tariff.from_financial_params(financial_params)
+    weights = load_shape.day_weights()
+    before = bill_representative_days(
+        {'grid_import_kw': load_shape.mean_kw, 'grid_export_kw': np.zeros_like(load_shape.mean_kw)},
+        weights, tariff)
+    after = {strategy: bill_representative_days(hourly, weights, tariff)
+             for strategy, hourly in dispatch_strategies(load_shape, pv_system, bess_system,
+                                                         STRATEGIES).items()}
+
+    savings = {name: np.array([before[name]['annual_bill'] - after[strategy][name]['annual_bill']
+                               for strategy in STRATEGIES])
+               for name in TARIFFS}
+    annual_savings = savings[RANKING_TARIFF]
+    metrics = financial_metrics_batch(
+        pv_system.system_size_kw, bess_system.capacity_kwh, annual_savings,
+        financial_params.pv_cost_per_kw, financial_params.bess_cost_per_kwh,
+        financial_params.installation_cost_percent, financial_params.federal_tax_credit,
+        financial_params.state_incentive, financial_params.discount_rate,
+        financial_params.electricity_inflation, financial_params.system_lifetime,
+    )
+    npv = metrics['npv_25_years']
+    payback = metrics['payback_period_years']
+    best = int(np.lexsort((payback, -npv))[0])
+
+    before_import = sum(before[RANKING_TARIFF]['monthly_import_kwh'])
+    before_cost = _net_energy_cost(before[RANKING_TARIFF])
+    rows = []
+    for i, strategy in enumerate(STRATEGIES):
+        bill = after[strategy][RANKING_TARIFF]
+        rows.append({
+            'strategy': strategy,
+            'label': STRATEGY_LABELS[strategy],
+            'total_savings_kwh': before_import - sum(bill['monthly_import_kwh']),
+            'annual_savings': float(annual_savings[i]),
+            'payback_period_years': float(payback[i]),
+            'npv_25_years': float(npv[i]),
+            'irr_percent': float(metrics['irr_percent'][i]),
+            'monthly_savings': (before_cost - _net_energy_cost(bill)).tolist(),
+            'net_billing': {name: float(savings[name][i]) for name in TARIFFS},
+            'selected': strategy == bess_system.control_strategy,
+            'best': i == best,
+        })
+
+    return {
+        'strategies': rows,
+        'best': STRATEGIES[best],
+        'selected': bess_system.control_strategy,
+        'tariff': RANKING_TARIFF,
+    }
@@ -0,0 +1,248 @@
+"""
+Parallel parameter sweeps streamed as Server-Sent Events.
+
+A sweep is a grid over one or more numeric design fields, e.g. PV size x
+battery size. The grid points are split into chunks that run on the
+ComputePool; each chunk runs the (memoized) pipeline for its points. As
+each chunk finishes its rows go out as an SSE ``result`` event, so the
+page can fill in the table while the rest are still computing:
+
+    event: start   {"total": 40, "axes": [...]}
+    event: result  {"rows": [...], "completed": 8, "total": 40, "best": {...}}
+    event: done    {"completed": 40, "total": 40, "best": {...}, "elapsed_seconds": 1.2}
+    event: error   {"error": "..."}
+
+Only about one chunk per worker is in flight at a time, and the next
+chunk is submitted only when one finishes. When the client goes away,
+chunks that have not started are cancelled, so at most the ones already
+running are wasted. Under ASGI the disconnect is noticed through
+calculator.middleware.DisconnectMiddleware; under WSGI it shows up as a failed
+write, which closes the event generator.
+"""
+import asyncio
+import copy
+import itertools
+import json
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from asgiref.sync import sync_to_async
+
+from .compute import ComputePool, ComputePoolBusy, get_pool
+from .pipeline import run_pipeline
+from .sensitivity import sensitivity_fields
+
+
+MAX_POINTS = 400
+# Points per task: enough to amortize pickling, few enough to stream often
+MAX_CHUNK_POINTS = 16
+# Fields that keep their ratio to a swept field
+COUPLED_FIELDS = {
+    ('bess_system', 'capacity_kwh'): ['usable_capacity_kwh'],
+}
+
+
+class SweepError(ValueError):
+    """An invalid sweep definition"""
+
+
+def sweep_fields() -> Dict[str, Tuple[str, str]]:
+    """'source.field' -> (source, field) for every field a sweep may vary"""
+    return {f'{source}.{name}': (source, name) for source, name, _ in sensitivity_fields()}
+
+
+def parse_axis(value: str) -> Tuple[str, List[float]]:
+    """
+    'pv_system.system_size_kw:4,6,8' (listed values) or
+    'pv_system.system_size_kw:4:12:5' (start:stop:count, inclusive)
+    """
+    field, _, spec = value.partition(':')
+    if field not in sweep_fields():
+        raise SweepError(f"Unknown sweep field '{field}'")
+    parts = spec.split(':')
+    try:
+        if len(parts) == 3:
+            start, stop, count = float(parts[0]), float(parts[1]), int(parts[2])
+            if count < 1:
+                raise SweepError('A sweep axis needs at least one value')
+            step = (stop - start) / (count - 1) if count > 1 else 0.0
+            values = [start + step * i for i in range(count)]
+        elif len(parts) == 1:
+            values = [float(part) for part in parts[0].split(',') if part]
+        else:
+            raise SweepError(f"Axis '{value}' is neither a value list nor start:stop:count")
+    except ValueError as e:
+        if isinstance(e, SweepError):
+            raise
+        raise SweepError(f"Axis '{value}' has a non-numeric value")
+    if not values or not all(math.isfinite(v) for v in values):
+        raise SweepError(f"Axis '{field}' has no usable values")
+    return field, values
+
+
+def sweep_points(axes: Sequence[Tuple[str, List[float]]]) -> List[Dict[str, float]]:
+    """Every combination of the axes' values, first axis slowest"""
+    if not axes:
+        raise SweepError('A sweep needs at least one axis')
+    fields = [field for field, _ in axes]
+    if len(set(fields)) != len(fields):
+        raise SweepError('Each field can be swept on one axis only')
+    total = math.prod(len(values) for _, values in axes)
+    if total > MAX_POINTS:
+        raise SweepError(f'A sweep is limited to {MAX_POINTS} points, this one has {total}')
+    return [dict(zip(fields, combination))
+            for combination in itertools.product(*(values for _, values in axes))]
+
+
+def evaluate_points(energy_profile, pv_system, bess_system, financial_params,
+                    points: Sequence[Tuple[int, Dict[str, float]]]) -> List[Dict]:
+    """Pipeline results for (index, {field: value}) points"""
+    fields = sweep_fields()
+    base = {'pv_system': pv_system, 'bess_system': bess_system, 'financial_params': financial_params}
+    rows = []
+    for index, point in points:
+        sources = {name: copy.copy(source) for name, source in base.items()}
+        for key, value in point.items():
+            source, name = fields[key]
+            original = getattr(base[source], name)
+            for coupled in COUPLED_FIELDS.get((source, name), ()):
+                if original:
+                    setattr(sources[source], coupled, getattr(base[source], coupled) * value / original)
+                else:
+                    setattr(sources[source], coupled, value)
+            if name == 'system_lifetime':
+                value = max(1, int(round(value)))
+            setattr(sources[source], name, value)
+        stages = run_pipeline(energy_profile, sources['pv_system'], sources['bess_system'],
+                              sources['financial_params'])
+        finance = stages['finance']
+        rows.append({
+            'index': index,
+            'point': point,
+            'annual_savings': finance['annual_savings'],
+            'total_system_cost': finance['total_system_cost'],
+            'payback_period_years': finance['payback_period_years'],
+            'npv_25_years': finance['npv_25_years'],
+            'irr_percent': finance['irr_percent'],
+        })
+    return rows
+
+
+def sse_event(event: str, data) -> str:
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def _better(row: Dict, best: Optional[Dict]) -> bool:
+    """Highest NPV, shorter payback breaking ties (as calculator.strategies)"""
+    if best is None:
+        return True
+    return (row['npv_25_years'], -row['payback_period_years']) > \
+        (best['npv_25_years'], -best['payback_period_years'])
+
+
+class SweepRun:
+    """One sweep's chunks, submitted a window at a time; iterate it for SSE events"""
+
+    def __init__(self, energy_profile, pv_system, bess_system, financial_params,
+                 axes: Sequence[Tuple[str, List[float]]], pool: Optional[ComputePool] = None):
+        self.axes = list(axes)
+        self.points = sweep_points(self.axes)
+        self.pool = pool or get_pool()
+        self.inputs = (energy_profile, pv_system, bess_system, financial_params)
+
+        workers = max(1, self.pool.workers)
+        # About four chunks per worker, so results stream and work balances
+        size = max(1, min(MAX_CHUNK_POINTS, math.ceil(len(self.points) / (workers * 4))))
+        indexed = list(enumerate(self.points))
+        self._chunks = iter([indexed[i:i + size] for i in range(0, len(indexed), size)])
+        self.window = 1 if self.pool.inline else min(workers, self.pool.max_pending)
+        self.pending: Set[Future] = set()
+        self.completed = 0
+        self.best: Optional[Dict] = None
+        self.started = time.perf_counter()
+
+    def _submit_next(self) -> bool:
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            return False
+        self.pending.add(self.pool.submit(evaluate_points, *self.inputs, chunk))
+        return True
+
+    def _fill(self):
+        while len(self.pending) < self.window and self._submit_next():
+            pass
+
+    def _start_event(self) -> str:
+        return sse_event('start', {
+            'total': len(self.points),
+            'axes': [{'field': field, 'values': values} for field, values in self.axes],
+        })
+
+    def _result_event(self, future: Future) -> str:
+        rows = future.result()
+        self.completed += len(rows)
+        for row in rows:
+            if _better(row, self.best):
+                self.best = row
+        return sse_event('result', {'rows': rows, 'completed': self.completed,
+                                    'total': len(self.points), 'best': self.best})
+
+    def _done_event(self) -> str:
+        return sse_event('done', {'completed': self.completed, 'total': len(self.points),
+                                  'best': self.best,
+                                  'elapsed_seconds': time.perf_counter() - self.started})
+
+    def cancel(self) -> int:
+        """Cancel chunks that haven't started; returns how many were dropped"""
+        cancelled = sum(1 for future in self.pending if future.cancel())
+        self.pending.clear()
+        self._chunks = iter(())
+        return cancelled
+
+    def __iter__(self) -> Iterator[str]:
+        """Events for a synchronous (WSGI) response"""
+        try:
+            yield self._start_event()
+            self._fill()
+            while self.pending:
+                done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield self._result_event(future)
+                self._fill()
+            yield self._done_event()
+        except ComputePoolBusy as e:
+            yield sse_event('error', {'error': str(e)})
+        except Exception as e:
+            yield sse_event('error', {'error': f'Sweep failed: {e}'})
+        finally:
+            self.cancel()
+
+    async def events(self, disconnected: Optional[asyncio.Event] = None) -> AsyncIterator[str]:
+        """Events for an ASGI response; stops early once ``disconnected`` is set"""
+        fill = sync_to_async(self._fill, thread_sensitive=False)
+        watcher = asyncio.ensure_future(disconnected.wait()) if disconnected is not None else None
+        try:
+            yield self._start_event()
+            await fill()
+            while self.pending:
+                waiting = {asyncio.wrap_future(future): future for future in self.pending}
+                waitables = set(waiting) | ({watcher} if watcher is not None else set())
+                done, _ = await asyncio.wait(waitables, return_when=asyncio.FIRST_COMPLETED)
+                if watcher is not None and watcher in done:
+                    return
+                for wrapped in done:
+                    future = waiting[wrapped]
+                    self.pending.discard(future)
+                    yield self._result_event(future)
+                await fill()
+            yield self._done_event()
+        except ComputePoolBusy as e:
+            yield sse_event('error', {'error': str(e)})
+        except Exception as e:
+            yield sse_event('error', {'error': f'Sweep failed: {e}'})
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+            self.cancel()
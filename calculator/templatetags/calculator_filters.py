@@ -0,0 +1,30 @@
+"""Arithmetic filters for result templates"""
+from django import template
+
+
+register = template.Library()
+
+
+@register.filter
+def div(value, divisor):
+    """value / divisor, or 0 when either isn't a number or divisor is 0"""
+    try:
+        return float(value) / float(divisor)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return 0
+
+
+@register.filter
+def mul(value, factor):
+    try:
+        return float(value) * float(factor)
+    except (TypeError, ValueError):
+        return 0
+
+
+@register.filter
+def sub(value, other):
+    try:
+        return float(value) - float(other)
+    except (TypeError, ValueError):
+        return 0
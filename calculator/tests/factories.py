@@ -0,0 +1,53 @@
+"""Model instances for tests; ``save=False`` returns them unsaved"""
+from django.contrib.auth.models import User
+
+from calculator.models import BESSSystem, EnergyProfile, FinancialParameters, PVSystem
+from calculator.pipeline import MONTHLY_FIELDS
+
+
+MONTHLY_KWH = [620, 560, 600, 640, 720, 850, 980, 1010, 900, 720, 610, 640]
+
+
+def make_user(username='alice', **kwargs):
+    return User.objects.create_user(username=username, password='secret', **kwargs)
+
+
+def make_energy_profile(user=None, save=True, monthly=MONTHLY_KWH, **kwargs):
+    fields = {'name': 'Home', **dict(zip(MONTHLY_FIELDS, monthly))}
+    fields.update(kwargs)
+    energy_profile = EnergyProfile(user=user, **fields)
+    if save:
+        energy_profile.save()
+    return energy_profile
+
+
+def make_pv_system(user=None, save=True, **kwargs):
+    fields = {'name': 'Roof', 'system_size_kw': 7.0, 'latitude': 34.1, 'longitude': -118.1}
+    fields.update(kwargs)
+    pv_system = PVSystem(user=user, **fields)
+    if save:
+        pv_system.save()
+    return pv_system
+
+
+def make_bess_system(user=None, save=True, **kwargs):
+    fields = {'name': 'Battery', 'capacity_kwh': 13.5, 'usable_capacity_kwh': 13.5,
+              'max_charge_rate_kw': 5.0, 'max_discharge_rate_kw': 5.0}
+    fields.update(kwargs)
+    bess_system = BESSSystem(user=user, **fields)
+    if save:
+        bess_system.save()
+    return bess_system
+
+
+def make_financial_params(user=None, save=True, **kwargs):
+    financial_params = FinancialParameters(user=user, **{'name': 'Rates', **kwargs})
+    if save:
+        financial_params.save()
+    return financial_params
+
+
+def make_inputs(user=None, save=True):
+    """(energy_profile, pv_system, bess_system, financial_params)"""
+    return (make_energy_profile(user, save), make_pv_system(user, save),
+            make_bess_system(user, save), make_financial_params(user, save))
@@ -0,0 +1,136 @@
+"""
+The ASGI path: the middleware chain stays async, the sweep streams from
+SweepRun.events and stops when DisconnectMiddleware sees the client leave.
+"""
+import asyncio
+import warnings
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.handlers.asgi import ASGIHandler
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from calculator.middleware import DISCONNECT_SCOPE_KEY, DisconnectMiddleware, StaticFilesMiddleware
+from calculator.pipeline import clear_stage_cache
+
+from .factories import make_inputs, make_user
+
+
+SWEEP_AXES = {'axis': ['pv_system.system_size_kw:4:12:5', 'bess_system.capacity_kwh:0:20:8']}
+
+
+async def _body(response):
+    # Iterate the response the way ASGIHandler does
+    return b''.join([part async for part in response])
+
+
+class AsyncMiddlewareChainTests(SimpleTestCase):
+
+    @override_settings(DEBUG=True)
+    def test_no_middleware_is_adapted(self):
+        # Django logs each sync middleware it has to wrap in a thread
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler().load_middleware(is_async=True)
+
+    @override_settings(WHITENOISE_USE_FINDERS=True, WHITENOISE_AUTOREFRESH=False)
+    async def test_static_files_are_served_without_the_view(self):
+        async def view(request):
+            raise AssertionError('static request reached the view')
+
+        middleware = StaticFilesMiddleware(view)
+        request = AsyncRequestFactory().get(f'{settings.STATIC_URL}admin/css/base.css')
+        response = await middleware(request)
+        self.assertEqual(response.status_code, 200)
+        with warnings.catch_warnings():
+            # A sync iterator would be consumed with a warning
+            warnings.simplefilter('error')
+            body = await _body(response)
+        with open(finders.find('admin/css/base.css'), 'rb') as f:
+            self.assertEqual(body, f.read())
+
+    async def test_other_requests_reach_the_view(self):
+        async def view(request):
+            return 'view'
+
+        middleware = StaticFilesMiddleware(view)
+        self.assertEqual(await middleware(AsyncRequestFactory().get('/')), 'view')
+
+
+class DisconnectMiddlewareTests(SimpleTestCase):
+
+    async def test_sets_the_event_when_the_client_leaves(self):
+        messages = asyncio.Queue()
+        await messages.put({'type': 'http.request', 'body': b'', 'more_body': False})
+        seen = {}
+
+        async def app(scope, receive, send):
+            seen['request'] = await receive()
+            disconnected = scope[DISCONNECT_SCOPE_KEY]
+            self.assertFalse(disconnected.is_set())
+            await messages.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(disconnected.wait(), 5)
+            # The watcher owns receive now; later reads see the disconnect
+            seen['after'] = await receive()
+
+        await DisconnectMiddleware(app)({'type': 'http'}, messages.get, None)
+        self.assertEqual(seen['request']['type'], 'http.request')
+        self.assertEqual(seen['after'], {'type': 'http.disconnect'})
+
+
+class AsyncSweepTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # SQLite probes for JSON support the first time a query needs it
+        connection.features.supports_json_field
+        cls.user = make_user()
+        make_inputs(cls.user)
+
+    def setUp(self):
+        clear_stage_cache()
+        self.async_client.force_login(self.user)
+        self.client.force_login(self.user)
+        self.session_cookie = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    async def test_streams_from_the_async_generator(self):
+        response = await self.async_client.get(reverse('calculator:sweep_stream'), SWEEP_AXES)
+        self.assertTrue(response.is_async)
+        body = (await _body(response)).decode()
+        self.assertEqual(body.count('event: start'), 1)
+        self.assertIn('"completed": 40', body)
+        self.assertTrue(body.endswith('\n\n') and 'event: done' in body)
+
+    async def test_stops_when_the_client_disconnects(self):
+        # The test client detaches these; a raw ASGI call must too, or the
+        # end of the request would close the test transaction's connection
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+        cookie = f'{settings.SESSION_COOKIE_NAME}={self.session_cookie}'
+        path = reverse('calculator:sweep_stream')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'root_path': '',
+            'query_string': b'axis=pv_system.system_size_kw:4:12:5&axis=bess_system.capacity_kwh:0:20:8',
+            'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 1234), 'server': ('testserver', 80),
+        }
+        messages = asyncio.Queue()
+        await messages.put({'type': 'http.request', 'body': b'', 'more_body': False})
+        events = []
+
+        async def send(message):
+            if message['type'] == 'http.response.body' and message.get('body'):
+                events.append(message['body'].decode())
+                if 'event: result' in events[-1]:
+                    await messages.put({'type': 'http.disconnect'})
+
+        application = DisconnectMiddleware(ASGIHandler())
+        await asyncio.wait_for(application(scope, messages.get, send), 60)
+        body = ''.join(events)
+        self.assertIn('event: start', body)
+        self.assertEqual(body.count('event: result'), 1)
+        self.assertNotIn('event: done', body)
@@ -0,0 +1,59 @@
+import json
+import os
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import skipUnless
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, tag
+
+
+BASELINE = Path(__file__).resolve().parent.parent / 'bench_baseline.json'
+
+
+def _bench(**options):
+    call_command('bench', stdout=StringIO(), stderr=StringIO(), **options)
+
+
+class BenchCommandTests(SimpleTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.output = os.path.join(self.directory.name, 'bench.json')
+
+    def test_writes_results(self):
+        _bench(scales='1,2', repeat=1, only='quick_calculation', inputs='synthetic',
+               output=self.output)
+        with open(self.output) as f:
+            results = json.load(f)['benchmarks']
+        self.assertEqual(sorted(results), ['quick_calculation[synthetic,1]',
+                                           'quick_calculation[synthetic,2]'])
+        self.assertGreater(results['quick_calculation[synthetic,2]']['median_s'], 0)
+
+    def test_fails_on_regression(self):
+        with open(self.output, 'w') as f:
+            json.dump({'benchmarks': {'quick_calculation[synthetic,1]': {'median_s': 1e-12}}}, f)
+        with self.assertRaisesMessage(CommandError, 'quick_calculation[synthetic,1]'):
+            _bench(scales='1', repeat=1, only='quick_calculation', inputs='synthetic',
+                   baseline=self.output, noise_floor=0)
+
+    def test_committed_baseline_covers_the_defaults(self):
+        with open(BASELINE) as f:
+            baseline = json.load(f)['benchmarks']
+        for name in ('quick_calculation', 'run_complete_calculation', 'detailed_calculation'):
+            for scale in (1, 100):
+                self.assertIn(f'{name}[synthetic,{scale}]', baseline)
+
+
+@tag('bench')
+@skipUnless(os.environ.get('CALCULATOR_BENCH'), 'set CALCULATOR_BENCH=1 to compare timings')
+class BenchBaselineTests(SimpleTestCase):
+    """
+    Timing comparison against the committed baseline; machine-dependent, so opt-in:
+    CALCULATOR_BENCH=1 python manage.py test calculator --tag bench
+    """
+
+    def test_no_regression(self):
+        _bench(baseline=str(BASELINE), tolerance=float(os.environ.get('CALCULATOR_BENCH_TOLERANCE', 0.5)))
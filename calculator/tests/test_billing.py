@@ -0,0 +1,71 @@
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from calculator.billing import (Tariff, bill_intervals, bill_nem2, bill_nem3, bill_parsed,
+                                bill_representative_days, net_billing_savings)
+from calculator.ingest import CSVEnergyParser, parse_stream
+from calculator.loadshape import HOURS, MONTHS, SHAPE, load_shape_from_parsed
+
+from .factories import make_inputs
+
+
+SAMPLE_FILE = Path(settings.BASE_DIR) / 'data' / 'SCE_Usage_8012047060_06-27-22_to_06-30-22.csv'
+
+
+class BillingTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tariff = Tariff.time_of_use(0.45, 0.25)
+        self.month = np.repeat(np.arange(MONTHS), HOURS)
+        self.hour = np.tile(np.arange(HOURS), MONTHS)
+
+    def test_no_pv_bill_is_the_same_under_both_tariffs(self):
+        load = np.random.default_rng(7).uniform(0.2, 3.0, SHAPE)
+        no_export = {'grid_import_kw': load, 'grid_export_kw': np.zeros(SHAPE)}
+        weights = np.tile([22.0, 8.0], (MONTHS, 1))
+        bills = bill_representative_days(no_export, weights, self.tariff)
+        self.assertAlmostEqual(bills['nem2']['annual_bill'], bills['nem3']['annual_bill'])
+        expected = (load * weights[:, :, None] * self.tariff.import_rates[:, None, :]).sum()
+        self.assertAlmostEqual(bills['nem2']['annual_bill'], expected)
+
+    def test_nem2_credits_exports_at_retail_less_nbc(self):
+        grid_import = np.ones(MONTHS * HOURS)
+        grid_export = np.zeros(MONTHS * HOURS)
+        grid_export[self.hour == 12] = 1.0
+        with_export = bill_nem2(self.month, self.hour, grid_import, grid_export, self.tariff)
+        without = bill_nem2(self.month, self.hour, grid_import, np.zeros_like(grid_export), self.tariff)
+        credit = without['annual_bill'] - with_export['annual_bill']
+        self.assertAlmostEqual(credit, MONTHS * (0.25 - self.tariff.nbc_rate))
+
+    def test_nem3_credits_exports_at_export_prices(self):
+        grid_import = np.ones(MONTHS * HOURS)
+        grid_export = np.where(self.hour == 12, 1.0, 0.0)
+        with_export = bill_nem3(self.month, self.hour, grid_import, grid_export, self.tariff)
+        without = bill_nem3(self.month, self.hour, grid_import, np.zeros_like(grid_export), self.tariff)
+        credit = without['annual_bill'] - with_export['annual_bill']
+        self.assertAlmostEqual(credit, self.tariff.export_rates[:, 12].sum())
+
+    def test_bill_parsed_uses_the_metered_intervals(self):
+        with open(SAMPLE_FILE, 'rb') as f:
+            parsed = parse_stream(CSVEnergyParser(), f)
+        bills = bill_parsed(parsed, self.tariff)
+        direct = bill_intervals(parsed['timestamps'], parsed['values'], parsed['received'], self.tariff)
+        self.assertEqual(bills, direct)
+        self.assertAlmostEqual(sum(bills['nem2']['monthly_import_kwh']), sum(parsed['values']))
+
+    def test_net_billing_savings_adds_metered_bills(self):
+        with open(SAMPLE_FILE, 'rb') as f:
+            parsed = parse_stream(CSVEnergyParser(), f)
+        energy_profile, pv_system, bess_system, financial_params = make_inputs(save=False)
+        load_shape = load_shape_from_parsed(parsed)
+        without = net_billing_savings(load_shape, pv_system, bess_system, financial_params)
+        self.assertNotIn('metered_bill', without['nem2'])
+        results = net_billing_savings(load_shape, pv_system, bess_system, financial_params, parsed)
+        metered = bill_parsed(parsed, Tariff.from_financial_params(financial_params))
+        for name in ('nem2', 'nem3'):
+            self.assertAlmostEqual(results[name]['metered_bill'], metered[name]['annual_bill'])
+        # No exports in the sample, so the no-system bills agree too
+        self.assertAlmostEqual(results['nem2']['bill_before'], results['nem3']['bill_before'])
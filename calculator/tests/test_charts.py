@@ -0,0 +1,80 @@
+import numpy as np
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from calculator.charts import get_chart_series, lttb
+from calculator.models import CalculationResult
+
+from .factories import make_inputs
+
+
+HOURS_PER_YEAR = 8760
+
+
+def _year_result(pk=1):
+    """An unsaved result holding a year of hourly series with daily and seasonal swings"""
+    hours = np.arange(HOURS_PER_YEAR)
+    daily = np.sin(2 * np.pi * hours / 24)
+    seasonal = 1 + 0.5 * np.sin(2 * np.pi * hours / HOURS_PER_YEAR)
+    energy_profile, pv_system, bess_system, financial_params = make_inputs(save=False)
+    result = CalculationResult(pk=pk, energy_profile=energy_profile, pv_system=pv_system,
+                               bess_system=bess_system, financial_params=financial_params,
+                               total_system_cost=0, annual_savings=0, payback_period_years=0,
+                               npv_25_years=0, irr_percent=0)
+    result.set_interval_results({
+        'pv_kw': np.maximum(daily, 0) * seasonal * 5,
+        'grid_import_kw': np.maximum(-daily, 0) * seasonal * 2,
+    }, 60, '2023-01-01T00:00')
+    return result
+
+
+class LTTBTests(SimpleTestCase):
+
+    def test_keeps_endpoints_and_extremes(self):
+        y = np.zeros(HOURS_PER_YEAR)
+        y[1234], y[5678] = 10.0, -10.0
+        indices = lttb(y, 200)
+        self.assertEqual(indices.size, 200)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], HOURS_PER_YEAR - 1)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertIn(1234, indices)
+        self.assertIn(5678, indices)
+
+    def test_short_series_is_returned_whole(self):
+        np.testing.assert_array_equal(lttb(np.arange(10.0), 50), np.arange(10))
+
+
+class ChartSeriesTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.result = _year_result()
+        self.packed = self.result.get_interval_results()
+
+    def test_full_year_downsamples_to_width(self):
+        data = get_chart_series(self.result, width=800)
+        self.assertEqual(data['interval_minutes'], 60)
+        self.assertEqual(data['start'], '2023-01-01T00:00')
+        for name in ('pv_kw', 'grid_import_kw'):
+            with self.subTest(name):
+                series = data['series'][name]
+                self.assertEqual(len(series['x']), 800)
+                self.assertEqual(series['x'][0], 0)
+                self.assertEqual(series['x'][-1], HOURS_PER_YEAR - 1)
+                # Every point is a real sample, not an average
+                np.testing.assert_allclose(series['y'], self.packed[name][series['x']], atol=1e-3)
+                self.assertAlmostEqual(max(series['y']), float(self.packed[name].max()), places=3)
+
+    def test_cached_tier_serves_other_widths(self):
+        get_chart_series(self.result, width=1024)
+        # Dropping the blob proves the second call comes from the cached tier
+        self.result.interval_results = None
+        data = get_chart_series(self.result, ['pv_kw'], width=600)
+        self.assertEqual(list(data['series']), ['pv_kw'])
+        self.assertEqual(len(data['series']['pv_kw']['x']), 600)
+
+    def test_zoomed_range_is_offset(self):
+        data = get_chart_series(self.result, ['pv_kw'], width=100, start=4000, end=4500)
+        x = data['series']['pv_kw']['x']
+        self.assertEqual((len(x), x[0], x[-1]), (100, 4000, 4499))
@@ -0,0 +1,48 @@
+import time
+
+from django.test import SimpleTestCase
+
+from calculator.compute import ComputePool, ComputePoolBusy, ComputeTimeout
+
+
+class ComputePoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.pool = ComputePool(workers=1, max_pending=2, timeout=1.0, retire_grace=0.0)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_runs_in_spawned_process(self):
+        self.assertEqual(self.pool.run(abs, -3), 3)
+        self.assertEqual(self.pool._get_executor()._mp_context.get_start_method(), 'spawn')
+
+    def test_timeout_replaces_the_executor(self):
+        self.assertEqual(self.pool.run(abs, -1), 1)
+        stuck = self.pool._get_executor()
+        processes = list(stuck._processes.values())
+        with self.assertRaises(ComputeTimeout):
+            self.pool.run(time.sleep, 60)
+        # The next task goes to a fresh pool instead of queueing behind the stuck one
+        self.assertEqual(self.pool.run(abs, -2, timeout=30), 2)
+        self.assertIsNot(self.pool._get_executor(), stuck)
+        deadline = time.monotonic() + 10
+        while any(process.is_alive() for process in processes):
+            self.assertLess(time.monotonic(), deadline, 'retired worker was not killed')
+            time.sleep(0.05)
+
+    def test_full_pool_rejects_new_tasks(self):
+        self.pool._get_executor()
+        running = [self.pool.submit(time.sleep, 1) for _ in range(self.pool.max_pending)]
+        with self.assertRaises(ComputePoolBusy):
+            self.pool.submit(abs, -1)
+        for future in running:
+            future.result(timeout=30)
+        # Finished tasks give their slots back
+        self.assertEqual(self.pool.run(abs, -1), 1)
+
+    def test_queue_wait_takes_the_next_free_slot(self):
+        self.pool.queue_wait = 30.0
+        self.pool._get_executor()
+        running = [self.pool.submit(time.sleep, 0.5) for _ in range(self.pool.max_pending)]
+        # Admitted once the first sleeper finished and released its slot
+        self.assertEqual(self.pool.run(abs, -1), 1)
+        self.assertTrue(running[0].done())
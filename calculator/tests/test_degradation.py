@@ -0,0 +1,60 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from calculator.degradation import cycle_life, rainflow, turning_points, wear_from_soc
+
+
+# ASTM E1049-85 (2017), section 5.4.4 and figure 6
+ASTM_LOADING = [-2, 1, -3, 5, -1, 3, -4, 4, -2]
+ASTM_CYCLES = {3: 0.5, 4: 1.5, 6: 0.5, 8: 1.0, 9: 0.5}
+
+
+class RainflowTests(SimpleTestCase):
+
+    def test_astm_e1049_example(self):
+        ranges, means, counts = rainflow(ASTM_LOADING)
+        found = {}
+        for cycle_range, count in zip(ranges.tolist(), counts.tolist()):
+            found[cycle_range] = found.get(cycle_range, 0) + count
+        self.assertEqual(found, ASTM_CYCLES)
+        # The one full cycle runs between -1 and 3
+        self.assertEqual(means[counts == 1.0].tolist(), [1.0])
+
+    def test_turning_points_skip_flats_and_monotone_runs(self):
+        np.testing.assert_array_equal(turning_points([0, 1, 1, 2, 1, 1, 0, 3]), [0, 2, 0, 3])
+        np.testing.assert_array_equal(turning_points([5, 5]), [5])
+
+    def test_counts_are_independent_of_sampling(self):
+        # Extra points along each ramp are not turning points
+        dense = np.concatenate([np.linspace(a, b, 7)[:-1] for a, b in zip(ASTM_LOADING, ASTM_LOADING[1:])]
+                               + [[ASTM_LOADING[-1]]])
+        for got, expected in zip(rainflow(dense), rainflow(ASTM_LOADING)):
+            np.testing.assert_allclose(got, expected)
+
+
+class WearTests(SimpleTestCase):
+
+    def _daily_cycles(self, depth, days=365):
+        hours = np.arange(days * 24)
+        return 0.5 + depth / 2 * np.sin(2 * np.pi * hours / 24)
+
+    def test_wear_grows_with_cycle_depth(self):
+        depths = [0.05, 0.1, 0.2, 0.4, 0.6, 0.8, 0.95]
+        wear = [wear_from_soc(self._daily_cycles(depth)) for depth in depths]
+        used = [result['cycle_life_used_per_year'] for result in wear]
+        self.assertEqual(used, sorted(used))
+        self.assertEqual(len(set(used)), len(used))
+        # Same number of cycles each time, only deeper
+        for depth, result in zip(depths, wear):
+            self.assertAlmostEqual(result['cycles_per_year'], 365, delta=1)
+            self.assertAlmostEqual(result['max_depth'], depth, places=2)
+        self.assertTrue(np.all(np.diff(cycle_life(depths)) < 0))
+
+    def test_reference_depth_matches_the_rated_life(self):
+        result = wear_from_soc(self._daily_cycles(0.8))
+        self.assertAlmostEqual(result['years_to_end_of_life'], 6000 / 365, delta=0.1)
+
+    def test_flat_trace_does_not_wear(self):
+        result = wear_from_soc(np.full(24 * 365, 0.5))
+        self.assertEqual(result['cycle_life_used_per_year'], 0.0)
+        self.assertIsNone(result['years_to_end_of_life'])
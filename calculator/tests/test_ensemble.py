@@ -0,0 +1,63 @@
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from calculator import ensemble, weather
+from calculator.billing import net_billing_savings
+from calculator.loadshape import LoadShape
+from calculator.pipeline import clear_stage_cache, run_pipeline
+
+from .factories import MONTHLY_KWH, make_inputs
+
+
+METRICS = ('total_pv_production', 'annual_savings', 'payback_period_years', 'npv_25_years')
+
+
+@override_settings(CALCULATOR_WEATHER_DIR=Path(__file__).parent / 'no-weather')
+class EnsembleTests(SimpleTestCase):
+    """Without weather files, so over synthetic years"""
+
+    def setUp(self):
+        weather.library.cache_clear()
+        self.addCleanup(weather.library.cache_clear)
+        clear_stage_cache()
+        self.inputs = make_inputs(save=False)
+        self.inputs[0].set_load_shape(LoadShape.flat(MONTHLY_KWH))
+
+    def test_same_seed_same_ensemble(self):
+        first = ensemble.run_ensemble(*self.inputs)
+        self.assertEqual(first['source'], 'synthetic')
+        self.assertEqual(first['years'], ensemble.ENSEMBLE_YEARS)
+        self.assertEqual(ensemble.run_ensemble(*self.inputs), first)
+        other = ensemble.run_ensemble(*self.inputs, seed=ensemble.ENSEMBLE_SEED + 1)
+        self.assertNotEqual(other['annual_savings'], first['annual_savings'])
+
+    def test_spread_brackets_the_mean(self):
+        result = ensemble.run_ensemble(*self.inputs)
+        for name in METRICS:
+            with self.subTest(name):
+                spread = result[name]
+                self.assertLess(spread['min'], spread['max'])
+                self.assertLessEqual(spread['min'], spread['mean'])
+                self.assertLessEqual(spread['mean'], spread['max'])
+        for name, spread in result['net_billing'].items():
+            with self.subTest(name):
+                self.assertLessEqual(spread['min'], spread['mean'])
+                self.assertLessEqual(spread['mean'], spread['max'])
+        savings = [year['annual_savings'] for year in result['per_year']]
+        self.assertAlmostEqual(result['annual_savings']['mean'], np.mean(savings))
+
+    def test_one_unperturbed_year_matches_the_single_year_pipeline(self):
+        with mock.patch.object(ensemble, 'MONTHLY_VARIABILITY', 0.0):
+            result = ensemble.run_ensemble(*self.inputs, years=1)
+        (year,) = result['per_year']
+        stages = run_pipeline(*self.inputs)
+        self.assertAlmostEqual(year['pv_production'], sum(stages['pv']))
+        self.assertAlmostEqual(year['annual_savings'], stages['billing'])
+        self.assertAlmostEqual(year['payback_period_years'], stages['finance']['payback_period_years'])
+        self.assertAlmostEqual(year['npv_25_years'], stages['finance']['npv_25_years'], places=6)
+        net_billing = net_billing_savings(self.inputs[0].get_load_shape(), *self.inputs[1:])
+        for name, savings in year['net_billing'].items():
+            self.assertAlmostEqual(savings, net_billing[name]['annual_savings'])
@@ -0,0 +1,151 @@
+import codecs
+import io
+from pathlib import Path
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from calculator.ingest import CSVEnergyParser, GreenButtonParser, parse_stream
+from calculator.loadshape import load_shape_from_parsed
+from calculator.quality import clean_parsed
+from calculator.utils import parse_csv_energy_data, parse_xml_energy_data
+
+
+SAMPLE_FILE = Path(settings.BASE_DIR) / 'data' / 'SCE_Usage_8012047060_06-27-22_to_06-30-22.csv'
+
+
+class CSVUnitTests(SimpleTestCase):
+
+    def setUp(self):
+        with open(SAMPLE_FILE, 'rb') as f:
+            self.parsed = parse_stream(CSVEnergyParser(), f)
+
+    def test_delivered_is_kwh(self):
+        # The file's first rows read "0.070", "0.090", "0.120" kWh per 15 minutes
+        self.assertEqual(self.parsed['values'][:3], [0.07, 0.09, 0.12])
+        self.assertAlmostEqual(sum(self.parsed['consumption']), sum(self.parsed['values']))
+
+    def test_measured_peak_is_household_scale(self):
+        # The largest interval, 1.430 kWh in 15 minutes, is 5.72 kW
+        load_shape = load_shape_from_parsed(self.parsed)
+        self.assertAlmostEqual(float(load_shape.peak_kw.max()), 1.43 * 4)
+
+
+CSV_HEADER = 'Date,Energy Consumption time Period Start,Energy Consumption time Period End,Delivered,Received'
+
+
+def csv_rows(count, bad_start=None):
+    """Hourly SCE rows on 06/27/2022; row ``bad_start`` has an unreadable start time"""
+    rows = []
+    for hour in range(count):
+        start = f'06/27/2022 {(hour - 1) % 12 + 1:02d}:00{"AM" if hour < 12 else "PM"}'
+        if hour == bad_start:
+            start = 'sometime'
+        rows.append(f'"06/27/2022","{start}","","{0.5 + hour / 10:.3f}","0.100"')
+    return rows
+
+
+class CSVRowAlignmentTests(SimpleTestCase):
+
+    def test_bad_start_time_keeps_the_columns_aligned(self):
+        data = '\n'.join([CSV_HEADER] + csv_rows(6, bad_start=2)).encode()
+        parsed = parse_stream(CSVEnergyParser(), io.BytesIO(data))
+        # Like the reference, the row still counts towards dates, values and totals
+        self.assertEqual(len(parsed['values']), 6)
+        self.assertEqual(len(parsed['timestamps']), 6)
+        self.assertEqual(len(parsed['received']), 6)
+        self.assertIsNone(parsed['timestamps'][2])
+        self.assertEqual(parsed['timestamps'][3].hour, 3)
+
+        cleaned = clean_parsed(parsed)
+        self.assertEqual(cleaned['quality']['untimed'], 1)
+        # The 02:00 slot is interpolated from its neighbours, not shifted
+        self.assertEqual([round(value, 3) for value in cleaned['values']],
+                         [0.5, 0.6, 0.7, 0.8, 0.9, 1.0])
+        self.assertEqual(len(cleaned['received']), 6)
+
+    def test_short_row_gets_no_received(self):
+        rows = csv_rows(3)
+        rows[1] = rows[1].rpartition(',')[0]
+        parsed = parse_stream(CSVEnergyParser(), io.BytesIO('\n'.join([CSV_HEADER] + rows).encode()))
+        self.assertEqual(parsed['received'], [0.1, 0.0, 0.1])
+
+    def test_file_without_start_times(self):
+        rows = [f'"06/27/2022","{0.5 + hour / 10:.3f}"' for hour in range(4)]
+        parsed = parse_stream(CSVEnergyParser(), io.BytesIO('\n'.join(['Date,Delivered'] + rows).encode()))
+        self.assertEqual(len(parsed['values']), 4)
+        self.assertEqual(parsed['timestamps'], [])
+        self.assertEqual(parsed['received'], [])
+        self.assertIs(clean_parsed(parsed), parsed)
+
+
+GREEN_BUTTON = b'''<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom" xmlns:espi="http://naesb.org/espi">
+  <entry><content><espi:IntervalBlock>
+%s
+  </espi:IntervalBlock></content></entry>
+</feed>
+'''
+READING = (b'    <espi:IntervalReading><espi:timePeriod><espi:duration>900</espi:duration>'
+           b'<espi:start>%d</espi:start></espi:timePeriod><espi:value>%d</espi:value>'
+           b'</espi:IntervalReading>')
+
+
+def feed_chunks(parser, data, size):
+    for i in range(0, len(data), size):
+        parser.feed(data[i:i + size])
+    return parser.finish()
+
+
+class ChunkBoundaryTests(SimpleTestCase):
+    """The incremental parsers against the whole-file reference parsers in calculator.utils"""
+
+    def setUp(self):
+        self.data = SAMPLE_FILE.read_bytes()
+        self.reference = parse_csv_energy_data(io.BytesIO(self.data))
+
+    def assertMatchesReference(self, parsed, reference=None):
+        reference = reference or self.reference
+        for key in ('dates', 'values'):
+            self.assertEqual(parsed[key], reference[key])
+        for got, expected in zip(parsed['consumption'], reference['consumption']):
+            self.assertAlmostEqual(got, expected)
+
+    def test_lines_split_across_chunks(self):
+        for size in (1, 7, 100):
+            with self.subTest(size=size):
+                self.assertMatchesReference(feed_chunks(CSVEnergyParser(), self.data, size))
+
+    def test_crlf_split_between_chunks(self):
+        data = self.data.replace(b'\n', b'\r\n')
+        # Every chunk ends right after a \r, so each \r\n is split in two
+        pieces = data.split(b'\r')
+        parser = CSVEnergyParser()
+        for piece in pieces[:-1]:
+            parser.feed(piece + b'\r')
+        parser.feed(pieces[-1])
+        parsed = parser.finish()
+        self.assertMatchesReference(parsed)
+        self.assertEqual(len(parsed['timestamps']), len(self.reference['values']))
+
+    def test_bom(self):
+        self.assertTrue(self.data.startswith(codecs.BOM_UTF8))
+        # The three BOM bytes land in separate chunks
+        self.assertMatchesReference(feed_chunks(CSVEnergyParser(), self.data, 1))
+        without_bom = self.data[len(codecs.BOM_UTF8):]
+        self.assertMatchesReference(parse_stream(CSVEnergyParser(), io.BytesIO(without_bom)))
+
+    def test_header_as_first_line_after_bom(self):
+        header_at = self.data.index(b'Date,')
+        data = codecs.BOM_UTF8 + self.data[header_at:]
+        reference = parse_csv_energy_data(io.BytesIO(data))
+        self.assertMatchesReference(feed_chunks(CSVEnergyParser(), data, 3), reference)
+
+    def test_xml(self):
+        start = 1656313200  # 2022-06-27 07:00 UTC
+        data = GREEN_BUTTON % b'\n'.join(READING % (start + 900 * i, 50 + i) for i in range(300))
+        reference = parse_xml_energy_data(io.BytesIO(data))
+        self.assertEqual(len(reference['values']), 300)
+        for size in (1, 13, 4096):
+            with self.subTest(size=size):
+                self.assertMatchesReference(feed_chunks(GreenButtonParser(), data, size), reference)
@@ -0,0 +1,72 @@
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from calculator import intervalstore
+from calculator.calculation import run_complete_calculation
+from calculator.loadshape import load_shape_from_parsed
+from calculator.pipeline import clear_stage_cache
+
+from .factories import make_bess_system, make_energy_profile, make_financial_params, make_pv_system
+
+
+SAMPLE_FILE = Path(settings.BASE_DIR) / 'data' / 'SCE_Usage_8012047060_06-27-22_to_06-30-22.csv'
+
+
+class IntervalStoreTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # SQLite probes for JSON support the first time a query needs it
+        connection.features.supports_json_field
+
+    def setUp(self):
+        clear_stage_cache()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        with open(SAMPLE_FILE, 'rb') as f:
+            self.digest, self.parsed = intervalstore.parse_upload(f)
+
+    def test_columns_are_memory_mapped(self):
+        stored = intervalstore.load(self.digest)
+        self.assertIsInstance(stored.delivered, np.memmap)
+        self.assertIsInstance(stored.minutes, np.memmap)
+        self.assertEqual(len(stored), 4 * 24 * 4)
+
+    def test_dates_are_interval_days(self):
+        dates = self.parsed['dates']
+        self.assertEqual(dates.dtype, np.dtype('datetime64[D]'))
+        self.assertEqual(len(dates), len(self.parsed['values']))
+        self.assertEqual(str(dates[0]), '2022-06-27')
+        self.assertEqual(str(dates[-1]), '2022-06-30')
+
+    def test_calculation_bills_the_stored_columns(self):
+        energy_profile = make_energy_profile(save=False, data_hash=self.digest)
+        energy_profile.set_load_shape(load_shape_from_parsed(self.parsed))
+        results = run_complete_calculation(energy_profile, make_pv_system(save=False),
+                                           make_bess_system(save=False),
+                                           make_financial_params(save=False),
+                                           analyses=['net_billing'])
+        for tariff in ('nem2', 'nem3'):
+            self.assertGreater(results['net_billing'][tariff]['metered_bill'], 0)
+
+    def test_file_without_start_times(self):
+        data = b'Date,Delivered\n' + b'\n'.join(b'"06/27/2022","0.%d00"' % i for i in range(1, 5))
+        digest, parsed = intervalstore.parse_upload(SimpleUploadedFile('usage.csv', data))
+        stored = intervalstore.load(digest)
+        # Same length as the values, but no times to bill or shape
+        self.assertEqual(len(stored.minutes), len(stored.delivered))
+        self.assertFalse(stored.timed)
+        self.assertEqual(len(parsed['values']), 4)
+        self.assertEqual(len(parsed['timestamps']), 0)
+        self.assertIsNone(load_shape_from_parsed(parsed))
+        self.assertAlmostEqual(parsed['consumption'][5], 1.0)
@@ -0,0 +1,127 @@
+import contextvars
+import json
+import os
+import tempfile
+import tracemalloc
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from calculator.memprofile import begin_profile, end_profile, profile_header, profiled
+from calculator.models import CalculationResult
+from calculator.pipeline import clear_stage_cache
+
+from .factories import make_inputs, make_user
+
+
+def _allocate(size):
+    return bytearray(size)
+
+
+class ProfiledTests(SimpleTestCase):
+
+    def tearDown(self):
+        # A failed test must not leave tracing on for the rest of the suite
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def test_no_op_without_a_profile(self):
+        with profiled('pv'):
+            self.assertFalse(tracemalloc.is_tracing())
+
+    def test_nested_stages(self):
+        token = begin_profile()
+        with profiled('outer'):
+            kept = _allocate(1 << 20)
+            with profiled('inner'):
+                _allocate(4 << 20)
+        stages = end_profile(token)
+        self.assertEqual([(entry['stage'], entry['depth']) for entry in stages],
+                         [('outer', 0), ('inner', 1)])
+        outer, inner = stages
+        self.assertGreaterEqual(inner['peak_bytes'], 4 << 20)
+        self.assertLess(inner['retained_bytes'], 1 << 20)
+        # The parent's peak includes the child's on top of what it already held
+        self.assertGreaterEqual(outer['peak_bytes'], 5 << 20)
+        self.assertGreaterEqual(outer['retained_bytes'], 1 << 20)
+        self.assertEqual(outer['top_sites'][0]['file'], __file__)
+        self.assertEqual(profile_header(stages),
+                         f"outer;peak={outer['peak_bytes']}, inner;peak={inner['peak_bytes']}")
+        del kept
+
+    def test_tracing_stops_with_the_last_profile(self):
+        # Two requests profiled at once, each in its own context
+        first, second = contextvars.copy_context(), contextvars.copy_context()
+        first_token = first.run(begin_profile)
+        second_token = second.run(begin_profile)
+        first.run(end_profile, first_token)
+        self.assertTrue(tracemalloc.is_tracing())
+        second.run(end_profile, second_token)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_leaves_tracing_it_did_not_start(self):
+        tracemalloc.start()
+        end_profile(begin_profile())
+        self.assertTrue(tracemalloc.is_tracing())
+
+
+class MemoryProfileTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # SQLite probes for JSON support the first time a query needs it
+        connection.features.supports_json_field
+        cls.user = make_user()
+        make_inputs(cls.user)
+
+    def setUp(self):
+        clear_stage_cache()
+        self.client.force_login(self.user)
+
+
+@override_settings(CALCULATOR_MEMORY_PROFILING='header')
+class MiddlewareTests(MemoryProfileTestCase):
+
+    def test_profiles_requests_that_ask(self):
+        with self.assertLogs('calculator.memory', 'INFO') as logs:
+            response = self.client.get(reverse('calculator:detailed_calculator'),
+                                       HTTP_X_PROFILE_MEMORY='1')
+        self.assertEqual(response.status_code, 200)
+        stages = dict(part.split(';peak=') for part in response['X-Memory-Profile'].split(', '))
+        self.assertIn('pv', stages)
+        self.assertTrue(all(int(peak) >= 0 for peak in stages.values()))
+        self.assertIn('detailed-calculator', logs.output[0])
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_other_requests_are_not_profiled(self):
+        response = self.client.get(reverse('calculator:detailed_calculator'))
+        self.assertNotIn('X-Memory-Profile', response)
+
+
+class MemprofileCommandTests(MemoryProfileTestCase):
+
+    def test_replays_a_stored_calculation(self):
+        self.client.get(reverse('calculator:detailed_calculator'))
+        result = CalculationResult.objects.get()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'memprofile.json')
+            stdout, stderr = StringIO(), StringIO()
+            call_command('memprofile', result.pk, output=path, stdout=stdout, stderr=stderr)
+            with open(path) as f:
+                profile = json.load(f)
+        self.assertEqual(profile['result'], result.pk)
+        stages = [entry['stage'] for entry in profile['stages']]
+        self.assertIn('pv', stages)
+        self.assertEqual(profile['peak_bytes'],
+                         max(entry['peak_bytes'] for entry in profile['stages'] if entry['depth'] == 0))
+        self.assertIn('Peak traced memory', stdout.getvalue())
+        # Manual inputs: nothing to ingest, and the replay matches the stored savings
+        self.assertIn('no interval data', stderr.getvalue())
+        self.assertNotIn('differ', stderr.getvalue())
+
+    def test_unknown_result(self):
+        with self.assertRaisesMessage(CommandError, 'CalculationResult 999 does not exist'):
+            call_command('memprofile', 999, stdout=StringIO())
@@ -0,0 +1,65 @@
+from django.db import connection
+from django.test import TestCase
+
+from calculator.models import (BESSSystem, EnergyProfile, FinancialParameters, PVSystem,
+                               _instance_from_row, get_latest_inputs)
+
+from .factories import (make_bess_system, make_energy_profile, make_financial_params,
+                        make_pv_system, make_user)
+
+
+class LatestInputsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # SQLite probes for JSON support the first time a query needs it
+        connection.features.supports_json_field
+        cls.user = make_user()
+        make_pv_system(cls.user, name='Old roof', system_size_kw=3.0)
+        cls.inputs = (
+            make_energy_profile(cls.user, peak_demand=6.5),
+            make_pv_system(cls.user, name='Roof', system_size_kw=7.25, tilt_angle=22.5, azimuth=190),
+            make_bess_system(cls.user, control_strategy='time_of_use', round_trip_efficiency=0.88),
+            make_financial_params(cls.user, electricity_rate=0.31, system_lifetime=20),
+        )
+
+    def assertSameRow(self, loaded, saved):
+        stored = type(saved).objects.get(pk=saved.pk)
+        self.assertEqual(loaded.get_deferred_fields(), set())
+        for field in type(saved)._meta.concrete_fields:
+            with self.subTest(model=type(saved).__name__, field=field.attname):
+                self.assertEqual(getattr(loaded, field.attname), getattr(stored, field.attname))
+
+    def test_loads_the_newest_rows_with_their_values(self):
+        with self.assertNumQueries(1):
+            loaded = get_latest_inputs(self.user)
+        # Every field, created_at included, was loaded by that one query
+        with self.assertNumQueries(0):
+            for instance in loaded:
+                instance.created_at
+        for instance, saved in zip(loaded, self.inputs):
+            self.assertSameRow(instance, saved)
+        self.assertEqual(loaded[1].name, 'Roof')
+        self.assertEqual(loaded[1].system_size_kw, 7.25)
+
+    def test_json_key_order_does_not_matter(self):
+        # jsonb and MySQL hand the object's keys back in their own order
+        pv_system = self.inputs[1]
+        row = {field.attname: field.value_from_object(pv_system)
+               for field in reversed(PVSystem._meta.concrete_fields)}
+        row['created_at'] = pv_system.created_at.isoformat()
+        self.assertSameRow(_instance_from_row(PVSystem, row, 'default'), pv_system)
+
+    def test_missing_rows(self):
+        other = make_user('bob')
+        with self.assertRaises(EnergyProfile.DoesNotExist):
+            get_latest_inputs(other)
+        make_energy_profile(other)
+        with self.assertRaises(PVSystem.DoesNotExist):
+            get_latest_inputs(other)
+        make_pv_system(other)
+        with self.assertRaises(BESSSystem.DoesNotExist):
+            get_latest_inputs(other)
+        make_bess_system(other)
+        with self.assertRaises(FinancialParameters.DoesNotExist):
+            get_latest_inputs(other)
@@ -0,0 +1,24 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from calculator.pipeline import clear_stage_cache
+
+
+# Fixed, so a failure here reproduces with manage.py oracle --seed
+SEED = 20240601
+
+
+class OracleTests(SimpleTestCase):
+
+    def setUp(self):
+        clear_stage_cache()
+
+    def test_engines_match_the_references(self):
+        stdout = StringIO()
+        # Raises CommandError, naming the checks, on any mismatch
+        call_command('oracle', seed=SEED, cases=400, stdout=stdout)
+        output = stdout.getvalue()
+        for name in ('pv', 'bess', 'finance', 'pipeline', 'csv_chunks', 'xml_chunks'):
+            self.assertRegex(output, rf'{name} +\d+ cases .* ok')
@@ -0,0 +1,89 @@
+from django.test import SimpleTestCase
+
+from calculator.calculation import ANALYSES, run_complete_calculation
+from calculator.pipeline import clear_stage_cache, run_pipeline, stage_stats
+
+from .factories import make_inputs
+
+
+class StageCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        clear_stage_cache()
+        self.inputs = make_inputs(save=False)
+
+    def test_callers_get_their_own_copies(self):
+        first = run_pipeline(*self.inputs)
+        expected = run_pipeline(*self.inputs)
+        first['load'][0] = -1.0
+        first['dispatch']['monthly_savings'].clear()
+        first['finance']['annual_savings'] = None
+
+        again = run_pipeline(*self.inputs)
+        self.assertEqual(again, expected)
+        self.assertGreater(stage_stats()['finance']['hits'], 0)
+
+    def test_edited_results_do_not_leak_into_the_next_calculation(self):
+        results = run_complete_calculation(*self.inputs)
+        expected = results['financial_results']['payback_period_years']
+        results['financial_results']['payback_period_years'] = 0
+        results['bess_results']['monthly_savings'][:] = [0] * 12
+        again = run_complete_calculation(*self.inputs)
+        self.assertEqual(again['financial_results']['payback_period_years'], expected)
+        self.assertNotEqual(again['bess_results']['monthly_savings'], [0] * 12)
+
+
+class StageReuseTests(SimpleTestCase):
+
+    def setUp(self):
+        clear_stage_cache()
+        self.inputs = make_inputs(save=False)
+        run_pipeline(*self.inputs)
+
+    def _rerun_misses(self):
+        """Stages that missed the cache when the pipeline ran again"""
+        before = stage_stats()
+        run_pipeline(*self.inputs)
+        after = stage_stats()
+        return {name for name in after if after[name]['misses'] > before[name]['misses']}
+
+    def test_unchanged_inputs_hit_every_stage(self):
+        self.assertEqual(self._rerun_misses(), set())
+
+    def test_discount_rate_reruns_only_finance(self):
+        self.inputs[3].discount_rate = 0.09
+        self.assertEqual(self._rerun_misses(), {'finance'})
+
+    def test_load_edit_keeps_pv(self):
+        self.inputs[0].jul_consumption += 100
+        self.assertEqual(self._rerun_misses(), {'load', 'dispatch', 'billing', 'finance'})
+
+    def test_tilt_edit_keeps_the_load(self):
+        self.inputs[1].tilt_angle = 20
+        self.assertEqual(self._rerun_misses(), {'pv', 'dispatch', 'billing', 'finance'})
+
+
+class AnalysesTests(SimpleTestCase):
+
+    def setUp(self):
+        clear_stage_cache()
+        self.inputs = make_inputs(save=False)
+
+    def test_analyses_are_opt_in(self):
+        results = run_complete_calculation(*self.inputs)
+        for name in ANALYSES:
+            self.assertNotIn(name, results)
+        results = run_complete_calculation(*self.inputs, analyses=['battery_wear'])
+        self.assertIn('battery_wear', results)
+        self.assertNotIn('weather_ensemble', results)
+
+    def test_every_analysis(self):
+        results = run_complete_calculation(*self.inputs, analyses=ANALYSES)
+        for name in ANALYSES:
+            self.assertIn(name, results)
+        # A manual profile has no load shape to bill hourly
+        self.assertIsNone(results['net_billing'])
+
+    def test_unknown_analysis(self):
+        with self.assertRaisesMessage(ValueError, 'colour'):
+            run_complete_calculation(*self.inputs, analyses=['colour'])
@@ -0,0 +1,99 @@
+from concurrent.futures import Future
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from calculator.models import BESSSystem, EnergyProfile, FinancialParameters, PortfolioRun, PVSystem
+from calculator.pipeline import clear_stage_cache, run_pipeline
+from calculator.portfolio import PortfolioTooLarge, run_portfolio
+
+from .factories import make_energy_profile, make_inputs
+
+
+class _LazyFuture(Future):
+    """Runs its task when the result is asked for, so a test can count tasks in flight"""
+
+    def __init__(self, pool, fn, args):
+        super().__init__()
+        self.pool, self.fn, self.args = pool, fn, args
+
+    def result(self, timeout=None):
+        if not self.done():
+            self.pool.in_flight -= 1
+            self.set_result(self.fn(*self.args))
+        return super().result(timeout)
+
+
+class _CountingPool:
+    inline = False
+
+    def __init__(self, workers):
+        self.workers = self.max_pending = workers
+        self.in_flight = self.most_in_flight = self.submitted = 0
+
+    def submit(self, fn, *args):
+        self.in_flight += 1
+        self.submitted += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        return _LazyFuture(self, fn, args)
+
+
+class PortfolioTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for i in range(7):
+            make_energy_profile(name=f'Home {i}', monthly=[500 + 50 * i] * 12)
+        _, cls.pv_system, cls.bess_system, cls.financial_params = make_inputs()
+
+    def test_matches_the_scalar_engine_per_profile(self):
+        for strategy in ('self_consumption', 'peak_shaving'):
+            with self.subTest(strategy):
+                clear_stage_cache()
+                self.bess_system.control_strategy = strategy
+                run = run_portfolio(self.pv_system, self.bess_system, self.financial_params,
+                                    strategy, chunk_size=3)
+                results = run.results.select_related('energy_profile')
+                self.assertEqual(len(results), EnergyProfile.objects.count())
+                for result in results:
+                    finance = run_pipeline(result.energy_profile, self.pv_system,
+                                           self.bess_system, self.financial_params)['finance']
+                    self.assertAlmostEqual(result.annual_savings, finance['annual_savings'], places=6)
+                    self.assertAlmostEqual(result.payback_period_years,
+                                           finance['payback_period_years'], places=6)
+                    self.assertAlmostEqual(result.npv_25_years, finance['npv_25_years'], places=4)
+
+    def test_ranked_by_payback_then_npv(self):
+        run = run_portfolio(self.pv_system, self.bess_system, self.financial_params, 'ranked',
+                            max_payback_years=13.0)
+        results = list(run.results.order_by('rank'))
+        self.assertEqual([result.rank for result in results], list(range(1, len(results) + 1)))
+        keys = [(result.payback_period_years, -result.npv_25_years) for result in results]
+        self.assertEqual(keys, sorted(keys))
+        self.assertGreater(results[0].annual_savings, results[-1].annual_savings)
+        self.assertEqual(run.qualifying_count, 3)
+
+    def test_limits_chunks_in_flight(self):
+        pool = _CountingPool(workers=2)
+        run = run_portfolio(self.pv_system, self.bess_system, self.financial_params, 'window',
+                            chunk_size=1, pool=pool)
+        self.assertEqual(pool.submitted, run.profile_count)
+        self.assertEqual(pool.most_in_flight, 2)
+        self.assertEqual(run.results.count(), run.profile_count)
+
+    def test_max_profiles(self):
+        with self.assertRaises(PortfolioTooLarge):
+            run_portfolio(self.pv_system, self.bess_system, self.financial_params, 'capped',
+                          max_profiles=3)
+        self.assertFalse(PortfolioRun.objects.exists())
+
+    def test_command_reuses_design_rows(self):
+        counts = (PVSystem.objects.count(), BESSSystem.objects.count(),
+                  FinancialParameters.objects.count())
+        for _ in range(2):
+            call_command('portfolio', workers=0, stdout=StringIO())
+        self.assertEqual((PVSystem.objects.count(), BESSSystem.objects.count(),
+                          FinancialParameters.objects.count()),
+                         tuple(count + 1 for count in counts))
+        self.assertEqual(PortfolioRun.objects.count(), 2)
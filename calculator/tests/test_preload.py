@@ -0,0 +1,42 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from calculator import preload
+
+
+REPORT = [
+    {'table': 'solar_tables', 'items': 7, 'bytes': 3072, 'seconds': 0.001},
+    {'table': 'gc_freeze', 'items': 50000, 'bytes': None, 'seconds': 0.02},
+]
+
+
+class PreloadTests(SimpleTestCase):
+
+    def test_not_run_outside_the_server(self):
+        # Django setup alone (tests, migrate, compute processes) doesn't preload
+        self.assertEqual(preload.REPORT, [])
+
+    def test_report_leaves_gc_freeze_size_blank(self):
+        lines = preload.format_report(REPORT).splitlines()
+        self.assertIn('3.0 KiB', lines[0])
+        self.assertNotIn('KiB', lines[1])
+        self.assertIn('3.0 KiB', lines[2])
+
+    def test_server_logs_the_report_at_info(self):
+        with mock.patch.object(preload, 'preload', return_value=REPORT) as run, \
+                self.assertLogs('calculator.preload', 'INFO') as logs:
+            preload.preload_server()
+        run.assert_called_once_with()
+        self.assertEqual([record.levelname for record in logs.records], ['INFO'])
+
+    @override_settings(CALCULATOR_PRELOAD=False)
+    def test_server_setting_off(self):
+        with mock.patch.object(preload, 'preload') as run:
+            preload.preload_server()
+        run.assert_not_called()
+
+    def test_server_survives_a_failure(self):
+        with mock.patch.object(preload, 'preload', side_effect=OSError('weather dir')), \
+                self.assertLogs('calculator.preload', 'ERROR'):
+            preload.preload_server()
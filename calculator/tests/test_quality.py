@@ -0,0 +1,96 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from calculator.quality import clean_intervals
+
+
+def grid(start, count, interval=15):
+    return np.datetime64(start, 'm') + np.arange(count) * np.timedelta64(interval, 'm')
+
+
+class CleanIntervalsTests(SimpleTestCase):
+
+    def test_regular_data_is_unchanged(self):
+        minutes = grid('2023-06-01T00:00', 96)
+        cleaned = clean_intervals(minutes, np.arange(96.0))
+        np.testing.assert_array_equal(cleaned.minutes, minutes)
+        np.testing.assert_array_equal(cleaned.delivered, np.arange(96.0))
+        self.assertEqual(cleaned.report['coverage_percent'], 100.0)
+        self.assertEqual(cleaned.report['gaps'], 0)
+
+    def test_short_gap_is_interpolated(self):
+        minutes = grid('2023-06-01T00:00', 96)
+        keep = np.ones(96, dtype=bool)
+        keep[10:14] = False  # an hour
+        cleaned = clean_intervals(minutes[keep], np.arange(96.0)[keep])
+        np.testing.assert_array_equal(cleaned.minutes, minutes)
+        np.testing.assert_allclose(cleaned.delivered, np.arange(96.0))
+        self.assertEqual(cleaned.report['filled_linear'], 4)
+
+    def test_long_gap_uses_the_weekday_profile(self):
+        # Three weeks of a repeating daily pattern with a day missing in week two
+        minutes = grid('2023-06-05T00:00', 21 * 24, interval=60)
+        values = np.tile(np.arange(24.0), 21)
+        keep = np.ones(minutes.size, dtype=bool)
+        keep[9 * 24:10 * 24] = False
+        cleaned = clean_intervals(minutes[keep], values[keep])
+        np.testing.assert_allclose(cleaned.delivered, values)
+        self.assertEqual(cleaned.report['filled_profile'], 24)
+
+    def test_gaps_over_max_fill_days_stay_empty(self):
+        minutes = np.concatenate([grid('2023-06-01T00:00', 24, 60), grid('2023-06-20T00:00', 24, 60)])
+        cleaned = clean_intervals(minutes, np.ones(48))
+        self.assertEqual(cleaned.delivered.size, 48)
+        self.assertGreater(cleaned.report['unfilled_intervals'], 0)
+
+    def test_duplicates_are_averaged(self):
+        minutes = grid('2023-06-01T00:00', 8)
+        cleaned = clean_intervals(np.concatenate([minutes, minutes[2:3]]),
+                                  np.concatenate([np.ones(8), [3.0]]))
+        self.assertEqual(cleaned.delivered[2], 2.0)
+        self.assertEqual(cleaned.delivered.sum(), 9.0)
+        self.assertEqual(cleaned.report['duplicates'], 1)
+
+    def test_out_of_order_blocks_are_sorted(self):
+        minutes = grid('2023-06-01T00:00', 96)
+        order = np.concatenate([np.arange(48, 96), np.arange(48)])
+        cleaned = clean_intervals(minutes[order], np.arange(96.0)[order])
+        np.testing.assert_array_equal(cleaned.delivered, np.arange(96.0))
+        self.assertEqual(cleaned.report['out_of_order'], 1)
+
+    def test_fall_back_hour_is_summed(self):
+        # 00:00-01:45, then 01:00-01:45 again, then 02:00-03:45 local time
+        minutes = np.concatenate([grid('2022-11-06T00:00', 8), grid('2022-11-06T01:00', 12)])
+        delivered = np.concatenate([np.full(8, 0.1), np.full(4, 0.2), np.full(8, 0.1)])
+        received = np.concatenate([np.zeros(8), np.full(4, 0.05), np.zeros(8)])
+        cleaned = clean_intervals(minutes, delivered, received)
+        np.testing.assert_array_equal(cleaned.minutes, grid('2022-11-06T00:00', 16))
+        np.testing.assert_allclose(cleaned.delivered[4:8], 0.3)
+        np.testing.assert_allclose(cleaned.received[4:8], 0.05)
+        # Nothing metered is lost
+        self.assertAlmostEqual(cleaned.delivered.sum(), delivered.sum())
+        self.assertEqual(cleaned.report['dst_transitions'], 1)
+        self.assertEqual(cleaned.report['duplicates'], 0)
+
+    def test_hourly_fall_back(self):
+        minutes = grid('2022-11-06T00:00', 2, 60)
+        minutes = np.concatenate([minutes, minutes[1:], grid('2022-11-06T02:00', 3, 60)])
+        delivered = np.array([1.0, 1.0, 2.0, 1.0, 1.0, 1.0])
+        cleaned = clean_intervals(minutes, delivered)
+        np.testing.assert_allclose(cleaned.delivered, [1.0, 3.0, 1.0, 1.0, 1.0])
+
+    def test_duplicates_outside_the_fall_back_hour_are_averaged(self):
+        # A repeated row at 03:00 in November is a duplicate, not DST
+        minutes = grid('2022-11-06T00:00', 6, 60)
+        cleaned = clean_intervals(np.concatenate([minutes, minutes[3:4]]),
+                                  np.concatenate([np.ones(6), [3.0]]))
+        self.assertEqual(cleaned.delivered[3], 2.0)
+        self.assertEqual(cleaned.report['dst_transitions'], 0)
+
+    def test_spring_forward_hour_is_filled(self):
+        minutes = np.concatenate([grid('2023-03-12T00:00', 8), grid('2023-03-12T03:00', 8)])
+        cleaned = clean_intervals(minutes, np.ones(16))
+        np.testing.assert_array_equal(cleaned.minutes, grid('2023-03-12T00:00', 20))
+        np.testing.assert_allclose(cleaned.delivered, 1.0)
+        self.assertEqual(cleaned.report['dst_transitions'], 1)
+        self.assertEqual(cleaned.report['filled_linear'], 4)
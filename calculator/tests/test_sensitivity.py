@@ -0,0 +1,64 @@
+import copy
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from calculator import pipeline, sensitivity
+from calculator.pipeline import clear_stage_cache, run_pipeline
+from calculator.sensitivity import run_sensitivity, sensitivity_fields
+
+from .factories import make_inputs
+
+
+class SensitivityTests(SimpleTestCase):
+
+    def setUp(self):
+        clear_stage_cache()
+        self.inputs = make_inputs(save=False)
+        self.results = run_sensitivity(*self.inputs)
+        self.bars = {bar['field']: bar for bar in self.results['bars']}
+
+    def _pipeline_npv(self, field, value):
+        energy_profile, pv_system, bess_system, financial_params = self.inputs
+        sources = {'pv_system': copy.copy(pv_system), 'bess_system': copy.copy(bess_system),
+                   'financial_params': copy.copy(financial_params)}
+        source, name = field.split('.')
+        setattr(sources[source], name, value)
+        return run_pipeline(energy_profile, sources['pv_system'], sources['bess_system'],
+                            sources['financial_params'])['finance']['npv_25_years']
+
+    def test_matches_the_pipeline_for_every_kind_of_field(self):
+        for field in ('pv_system.system_size_kw', 'pv_system.latitude',
+                      'bess_system.usable_capacity_kwh', 'bess_system.round_trip_efficiency',
+                      'financial_params.electricity_rate', 'financial_params.discount_rate'):
+            with self.subTest(field):
+                bar = self.bars[field]
+                self.assertAlmostEqual(bar['npv_25_years'][0],
+                                       self._pipeline_npv(field, bar['low_value']), places=6)
+                self.assertAlmostEqual(bar['npv_25_years'][1],
+                                       self._pipeline_npv(field, bar['high_value']), places=6)
+
+    def test_financial_fields_reuse_the_base_simulation(self):
+        simulated_fields = sum(1 for *_, financial_only in sensitivity_fields() if not financial_only)
+        with mock.patch.object(sensitivity, 'bess_operation_batch',
+                               wraps=sensitivity.bess_operation_batch) as dispatch:
+            results = run_sensitivity(*self.inputs)
+        rows = len(dispatch.call_args.args[2])
+        self.assertEqual(rows, 1 + 2 * simulated_fields)
+        self.assertEqual(results['cases_simulated'], rows)
+        self.assertLess(rows, results['cases_evaluated'])
+        self.assertTrue(self.bars['financial_params.discount_rate']['financial_only'])
+
+    def test_leaves_the_stage_cache_alone(self):
+        clear_stage_cache()
+        run_sensitivity(*self.inputs)
+        self.assertEqual(pipeline._cache._entries, {})
+
+    def test_custom_step(self):
+        results = run_sensitivity(*self.inputs, steps={'financial_params.bess_cost_per_kwh': ('absolute', 100)})
+        bar = next(bar for bar in results['bars'] if bar['field'] == 'financial_params.bess_cost_per_kwh')
+        self.assertEqual(bar['high_value'] - bar['base_value'], 100)
+
+    def test_unknown_field(self):
+        with self.assertRaisesMessage(ValueError, 'pv_system.colour'):
+            run_sensitivity(*self.inputs, steps={'pv_system.colour': ('relative', 0.1)})
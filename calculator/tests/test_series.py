@@ -0,0 +1,43 @@
+import json
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from calculator.hourly import year_series
+from calculator.loadshape import LoadShape
+from calculator.series import PackedSeries, pack_series
+
+from .factories import MONTHLY_KWH, make_bess_system, make_pv_system
+
+
+class PackSeriesTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        rng = np.random.default_rng(0)
+        series = {
+            'grid_import_kw': rng.random(8760) * 5,
+            'soc': np.linspace(0, 1, 96),
+            'empty': [],
+        }
+        packed = PackedSeries(memoryview(pack_series(series, 15, '2023-01-01T00:00')))
+        self.assertEqual(list(packed), list(series))
+        self.assertEqual(packed.interval_minutes, 15)
+        self.assertEqual(packed.start, '2023-01-01T00:00')
+        for name, values in series.items():
+            with self.subTest(name):
+                self.assertEqual(packed.length(name), len(values))
+                # float32 storage: equal to the input rounded to single precision
+                np.testing.assert_array_equal(packed[name], np.asarray(values, dtype=np.float32))
+                self.assertFalse(packed[name].flags.writeable)
+
+    def test_rejects_other_blobs(self):
+        with self.assertRaises(ValueError):
+            PackedSeries(b'{"pv_kw": []}')
+
+    def test_stored_year_is_over_ten_times_smaller_than_json(self):
+        # What the detailed view stores: a typical year built from representative days
+        start, series = year_series(LoadShape.flat(MONTHLY_KWH), make_pv_system(save=False),
+                                    make_bess_system(save=False))
+        blob = pack_series(series, 60, start)
+        as_json = json.dumps({name: values.tolist() for name, values in series.items()})
+        self.assertGreater(len(as_json) / len(blob), 10)
@@ -0,0 +1,44 @@
+from django.test import SimpleTestCase
+
+from calculator.batch import financial_metrics_batch
+from calculator.pipeline import clear_stage_cache
+from calculator.strategies import STRATEGIES, compare_strategies
+
+from .factories import make_bess_system, make_energy_profile, make_financial_params, make_pv_system
+
+
+class CompareStrategiesTests(SimpleTestCase):
+
+    def setUp(self):
+        clear_stage_cache()
+        self.energy_profile = make_energy_profile(save=False)
+        self.pv_system = make_pv_system(save=False)
+        self.financial_params = make_financial_params(save=False)
+
+    def _compare(self, bess_system):
+        return compare_strategies(self.energy_profile, self.pv_system, bess_system,
+                                  self.financial_params)
+
+    def test_columns_come_from_the_same_bills(self):
+        comparison = self._compare(make_bess_system(save=False))
+        self.assertEqual([row['strategy'] for row in comparison['strategies']], STRATEGIES)
+        for row in comparison['strategies']:
+            with self.subTest(row['strategy']):
+                self.assertEqual(row['annual_savings'], row['net_billing']['nem3'])
+                metrics = financial_metrics_batch(7.0, 13.5, row['annual_savings'])
+                self.assertAlmostEqual(row['npv_25_years'], float(metrics['npv_25_years']))
+                self.assertAlmostEqual(row['payback_period_years'],
+                                       float(metrics['payback_period_years']))
+        best = max(comparison['strategies'], key=lambda row: row['npv_25_years'])
+        self.assertEqual(comparison['best'], best['strategy'])
+
+    def test_strategies_only_differ_through_the_battery(self):
+        # Without a battery every strategy is the same PV-only system
+        no_battery = make_bess_system(save=False, capacity_kwh=0, usable_capacity_kwh=0,
+                                      max_charge_rate_kw=0, max_discharge_rate_kw=0)
+        rows = self._compare(no_battery)['strategies']
+        for row in rows[1:]:
+            with self.subTest(row['strategy']):
+                self.assertAlmostEqual(row['annual_savings'], rows[0]['annual_savings'])
+                self.assertAlmostEqual(row['total_savings_kwh'], rows[0]['total_savings_kwh'])
+                self.assertEqual(row['net_billing'], rows[0]['net_billing'])
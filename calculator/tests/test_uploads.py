@@ -0,0 +1,56 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.uploadhandler import MemoryFileUploadHandler
+from django.test import RequestFactory, SimpleTestCase
+from django.urls import resolve, reverse
+
+from calculator.uploads import EnergyDataUploadHandler, streamed_upload
+
+
+SAMPLE_FILE = Path(settings.BASE_DIR) / 'data' / 'SCE_Usage_8012047060_06-27-22_to_06-30-22.csv'
+
+
+class _CountingStream:
+    """Wraps a WSGI request's body stream and counts the bytes read from it"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, *args):
+        data = self.stream.read(*args)
+        self.bytes_read += len(data)
+        return data
+
+    def readline(self, *args):
+        data = self.stream.readline(*args)
+        self.bytes_read += len(data)
+        return data
+
+
+class WSGIOverlapTests(SimpleTestCase):
+
+    def test_parsing_starts_before_the_body_is_read(self):
+        url = reverse('calculator:ajax_file_upload')
+        with open(SAMPLE_FILE, 'rb') as f:
+            request = RequestFactory().post(url, {'file': f})
+        request.resolver_match = resolve(url)
+        stream = request._stream = _CountingStream(request._stream)
+
+        handler = EnergyDataUploadHandler(request)
+        handler.chunk_size = 1024
+        read_at_chunk = []
+        receive_data_chunk = handler.receive_data_chunk
+
+        def recording(raw_data, start):
+            read_at_chunk.append(stream.bytes_read)
+            return receive_data_chunk(raw_data, start)
+
+        handler.receive_data_chunk = recording
+        request.upload_handlers = [handler, MemoryFileUploadHandler(request)]
+        request.FILES
+
+        self.assertGreater(len(read_at_chunk), 2)
+        self.assertLess(read_at_chunk[0], int(request.META['CONTENT_LENGTH']) // 2)
+        self.assertIsNotNone(streamed_upload(request, 'file').parsed)
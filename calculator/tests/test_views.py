@@ -0,0 +1,246 @@
+"""
+Query counts per view. A logged-in request always costs two queries
+(session and user); the rest is the view's own work, which must not grow
+with the number of rows a user has.
+"""
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from calculator import compute
+from calculator.models import CalculationResult, EnergyProfile
+from calculator.pipeline import MONTHLY_FIELDS, clear_stage_cache
+
+from .factories import MONTHLY_KWH, make_inputs, make_user
+
+
+AUTH_QUERIES = 2
+SAMPLE_FILE = Path(settings.BASE_DIR) / 'data' / 'SCE_Usage_8012047060_06-27-22_to_06-30-22.csv'
+
+
+class AnonymousViewQueryTests(TestCase):
+
+    def test_home(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('calculator:home')).status_code, 200)
+
+    def test_home_quick_calculation(self):
+        data = {'annual_consumption': 9000, 'pv_size': 7, 'bess_size': 13.5, 'electricity_rate': 0.3}
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('calculator:home'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('results', response.context)
+
+    def test_about_and_help(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('calculator:about')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('calculator:help')).status_code, 200)
+
+    def test_api_calculate(self):
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('calculator:api_calculate'),
+                                        json.dumps({'annual_consumption': 9000, 'system_size': 7}),
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['success'])
+
+    def test_ajax_file_upload(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root), open(SAMPLE_FILE, 'rb') as f:
+            with self.assertNumQueries(0):
+                response = self.client.post(reverse('calculator:ajax_file_upload'), {'file': f})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['monthly_data']), 12)
+
+    @override_settings(CALCULATOR_TIMING_PUBLIC=True)
+    def test_metrics_public(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('calculator:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Server-Timing', response)
+
+    @override_settings(CALCULATOR_TIMING_PUBLIC=False)
+    def test_metrics_private(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('calculator:metrics'))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('Server-Timing', response)
+
+
+class LoggedInViewQueryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        # SQLite probes for JSON support the first time a query needs it
+        connection.features.supports_json_field
+
+    def setUp(self):
+        clear_stage_cache()
+        cache.clear()
+        self.user = make_user()
+        self.client.force_login(self.user)
+
+    def _with_history(self, count=3):
+        """Several rows per model, so a per-row query would show up in the counts"""
+        for _ in range(count):
+            inputs = make_inputs(self.user)
+        return inputs
+
+    def _form_get(self, name):
+        with self.assertNumQueries(AUTH_QUERIES):
+            self.assertEqual(self.client.get(reverse(f'calculator:{name}')).status_code, 200)
+
+    def test_form_pages(self):
+        for name in ('energy_profile_form', 'pv_system_form', 'bess_system_form',
+                     'financial_parameters_form'):
+            with self.subTest(name):
+                self._form_get(name)
+
+    def test_energy_profile_manual_entry(self):
+        data = {'name': 'Manual', **dict(zip(MONTHLY_FIELDS, MONTHLY_KWH))}
+        # The profile insert
+        with self.assertNumQueries(AUTH_QUERIES + 1):
+            response = self.client.post(reverse('calculator:energy_profile_form'), data)
+        self.assertRedirects(response, reverse('calculator:pv_system_form'),
+                             fetch_redirect_response=False)
+        self.assertEqual(EnergyProfile.objects.get().user, self.user)
+
+    def _upload_profile(self, peak_demand=''):
+        data = {'name': 'Upload', 'peak_demand': peak_demand, **dict(zip(MONTHLY_FIELDS, MONTHLY_KWH))}
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root), open(SAMPLE_FILE, 'rb') as f:
+            response = self.client.post(reverse('calculator:energy_profile_form'),
+                                        {**data, 'energy_data_file': f})
+        self.assertEqual(response.status_code, 302)
+        return EnergyProfile.objects.get()
+
+    def test_upload_fills_a_blank_peak_demand(self):
+        # 1.430 kWh in one 15-minute interval
+        self.assertAlmostEqual(self._upload_profile().peak_demand, 5.72)
+
+    def test_upload_keeps_a_typed_peak_demand(self):
+        self.assertEqual(self._upload_profile(peak_demand=7.5).peak_demand, 7.5)
+
+    def test_pv_system_post(self):
+        data = {'name': 'Roof', 'system_size_kw': 7, 'panel_efficiency': 0.2,
+                'inverter_efficiency': 0.96, 'system_efficiency': 0.75, 'latitude': 34.1,
+                'longitude': -118.1, 'tilt_angle': 30, 'azimuth': 180, 'annual_degradation': 0.005}
+        with self.assertNumQueries(AUTH_QUERIES + 1):
+            response = self.client.post(reverse('calculator:pv_system_form'), data)
+        self.assertEqual(response.status_code, 302)
+
+    def test_detailed_calculator(self):
+        self._with_history()
+        # Latest inputs in one query, then the result insert
+        with self.assertNumQueries(AUTH_QUERIES + 2):
+            response = self.client.get(reverse('calculator:detailed_calculator'))
+        self.assertEqual(response.status_code, 200)
+        packed = CalculationResult.objects.get().get_interval_results()
+        self.assertEqual(packed.interval_minutes, 60)
+        self.assertEqual(packed.length('grid_import_kw'), 8760)
+
+    def test_detailed_calculator_without_inputs(self):
+        with self.assertNumQueries(AUTH_QUERIES + 1):
+            response = self.client.get(reverse('calculator:detailed_calculator'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_detailed_calculator_when_the_pool_is_full(self):
+        make_inputs(self.user)
+        busy = compute.ComputePoolBusy('All compute workers are busy.')
+        with mock.patch.object(compute, 'arun', side_effect=busy):
+            response = self.client.get(reverse('calculator:detailed_calculator'))
+        self.assertRedirects(response, reverse('calculator:home'), fetch_redirect_response=False)
+        self.assertFalse(CalculationResult.objects.exists())
+
+    def test_my_calculations(self):
+        self._with_history()
+        for _ in range(3):
+            self.client.get(reverse('calculator:detailed_calculator'))
+        with self.assertNumQueries(AUTH_QUERIES + 1):
+            response = self.client.get(reverse('calculator:my_calculations'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['calculations']), 3)
+
+    def test_chart_data(self):
+        self._with_history()
+        self.client.get(reverse('calculator:detailed_calculator'))
+        result = CalculationResult.objects.get()
+        # The result, then its deferred interval blob on a chart cache miss
+        with self.assertNumQueries(AUTH_QUERIES + 2):
+            response = self.client.get(reverse('calculator:chart_data', args=[result.pk]))
+        self.assertEqual(response.status_code, 200)
+        # A cached tier needs only the result row
+        with self.assertNumQueries(AUTH_QUERIES + 1):
+            response = self.client.get(reverse('calculator:chart_data', args=[result.pk]))
+        self.assertEqual(len(response.json()['series']['grid_import_kw']['x']), 800)
+
+    def test_chart_data_rejects_bad_ranges(self):
+        self._with_history()
+        self.client.get(reverse('calculator:detailed_calculator'))
+        url = reverse('calculator:chart_data', args=[CalculationResult.objects.get().pk])
+        for params in ({'start': 100, 'end': 10}, {'start': -5}, {'end': -1}, {'width': 0}):
+            with self.subTest(params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_sensitivity_analysis(self):
+        self._with_history()
+        with self.assertNumQueries(AUTH_QUERIES + 1):
+            response = self.client.get(reverse('calculator:sensitivity_analysis'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['bars'])
+
+    def test_sensitivity_analysis_unknown_field(self):
+        self._with_history()
+        response = self.client.get(reverse('calculator:sensitivity_analysis'),
+                                   {'step': 'pv_system.colour:relative:0.2'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pv_system.colour', response.json()['error'])
+
+    def test_sweep_stream(self):
+        self._with_history()
+        with self.assertNumQueries(AUTH_QUERIES + 1):
+            response = self.client.get(reverse('calculator:sweep_stream'),
+                                       {'axis': 'pv_system.system_size_kw:4,6'})
+            body = b''.join(response.streaming_content).decode()
+        self.assertIn('event: done', body)
+
+    @override_settings(CALCULATOR_TIMING_PUBLIC=False)
+    def test_metrics_staff(self):
+        self.user.is_staff = True
+        self.user.save()
+        with self.assertNumQueries(AUTH_QUERIES):
+            response = self.client.get(reverse('calculator:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'calculator_request_duration_seconds', response.content)
+
+    def test_api_portfolio(self):
+        self.user.is_staff = True
+        self.user.save()
+        self._with_history()
+        # Latest inputs, profile count, profile rows, then the run, its results
+        # and the duration update inside one transaction, then the ranked results
+        with self.assertNumQueries(AUTH_QUERIES + 9):
+            response = self.client.post(reverse('calculator:api_portfolio'), '{}',
+                                        content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['profile_count'], 3)
+
+    @override_settings(CALCULATOR_PORTFOLIO_MAX_PROFILES=2)
+    def test_api_portfolio_too_large(self):
+        self.user.is_staff = True
+        self.user.save()
+        self._with_history()
+        response = self.client.post(reverse('calculator:api_portfolio'), '{}',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('manage.py portfolio', response.json()['error'])
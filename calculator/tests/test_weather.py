@@ -0,0 +1,144 @@
+import math
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from calculator import weather
+from calculator.weather import (DURATION, GHI, HOUR, MONTH, KDTree, WeatherLibrary, _parse_irradiance,
+                                _read_header, _unit_vector)
+
+
+FIXTURES = Path(__file__).parent / 'weather'
+BAKERSFIELD = (35.433, -119.050)
+SACRAMENTO = (38.58, -121.49)
+
+
+class WeatherFixtureTestCase(SimpleTestCase):
+    """Runs against a copy of the fixtures, since the library caches next to its files"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        for path in FIXTURES.glob('*.csv'):
+            shutil.copy(path, self.directory)
+        settings = override_settings(CALCULATOR_WEATHER_DIR=self.directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        for cached in (weather.library, weather._profile):
+            cached.cache_clear()
+            self.addCleanup(cached.cache_clear)
+
+    def station(self, name):
+        return _read_header(self.directory / name)
+
+
+class HeaderTests(WeatherFixtureTestCase):
+
+    def test_tmy3(self):
+        station = self.station('723840TYA.csv')
+        self.assertEqual(station.name, 'BAKERSFIELD MEADOWS FIELD')
+        self.assertEqual((station.latitude, station.longitude), BAKERSFIELD)
+        self.assertEqual((station.timezone, station.layout), (-8.0, 'tmy3'))
+
+    def test_psm3(self):
+        station = self.station('psm3_sacramento_60.csv')
+        self.assertEqual(station.name, 'Sacramento')
+        self.assertEqual((station.latitude, station.longitude), SACRAMENTO)
+        self.assertEqual((station.timezone, station.layout), (-8.0, 'psm3'))
+
+    def test_other_files_are_skipped(self):
+        (self.directory / 'notes.csv').write_text('just,some\n')
+        self.assertIsNone(self.station('notes.csv'))
+        self.assertEqual(len(WeatherLibrary(self.directory)), 3)
+
+
+class IrradianceTests(WeatherFixtureTestCase):
+
+    def test_tmy3_hour_ending_rows(self):
+        data = _parse_irradiance(self.station('723840TYA.csv'))
+        self.assertEqual(data.shape, (8, 48))
+        # "01:00" covers midnight to 1am
+        np.testing.assert_array_equal(data[HOUR, :24], np.arange(24))
+        np.testing.assert_array_equal(data[MONTH], 0)
+        np.testing.assert_array_equal(data[DURATION], 1.0)
+        # The "12:00" row: 11 to noon
+        self.assertEqual(data[GHI, 11], 593)
+
+    def test_psm3_time_step(self):
+        hourly = _parse_irradiance(self.station('psm3_sacramento_60.csv'))
+        half_hourly = _parse_irradiance(self.station('psm3_sacramento_30.csv'))
+        np.testing.assert_array_equal(hourly[DURATION], 1.0)
+        np.testing.assert_array_equal(half_hourly[DURATION], 0.5)
+        np.testing.assert_array_equal(half_hourly[HOUR, :4], [0, 0, 1, 1])
+
+    def test_half_hourly_rows_give_the_same_energy(self):
+        # Flat panels see only the diffuse, which both files hold per hour
+        hourly = weather._profile(self.station('psm3_sacramento_60.csv'), 0.0, 180.0)
+        half_hourly = weather._profile(self.station('psm3_sacramento_30.csv'), 0.0, 180.0)
+        self.assertGreater(hourly.monthly_kwh[0], 0)
+        np.testing.assert_allclose(half_hourly.monthly_kwh, hourly.monthly_kwh)
+        np.testing.assert_allclose(half_hourly.month_hour_kw, hourly.month_hour_kw)
+        # Two days of data: the typical day holds half the month's energy
+        self.assertAlmostEqual(hourly.month_hour_kw[0].sum(), hourly.monthly_kwh[0] / 2)
+
+
+class NearestStationTests(WeatherFixtureTestCase):
+
+    def test_kd_tree_matches_brute_force(self):
+        rng = np.random.default_rng(7)
+        points = [_unit_vector(lat, lon) for lat, lon in zip(rng.uniform(-60, 70, 300),
+                                                             rng.uniform(-180, 180, 300))]
+        tree = KDTree(points)
+        for lat, lon in zip(rng.uniform(-90, 90, 200), rng.uniform(-180, 180, 200)):
+            query = _unit_vector(lat, lon)
+            squared = ((np.asarray(points) - query) ** 2).sum(axis=1)
+            index, distance = tree.nearest(query)
+            self.assertEqual(index, int(np.argmin(squared)))
+            self.assertAlmostEqual(distance, squared.min())
+        self.assertEqual(KDTree([]).nearest((1.0, 0.0, 0.0)), (-1, math.inf))
+
+    def test_nearest_site_and_its_years(self):
+        library = WeatherLibrary(self.directory)
+        self.assertEqual(library.nearest(35.3, -119.0).name, 'BAKERSFIELD MEADOWS FIELD')
+        station = library.nearest(38.5, -121.5)
+        # The site's first file by name, with both of its years
+        self.assertEqual(station.path.name, 'psm3_sacramento_30.csv')
+        self.assertEqual([year.path.name for year in library.site_years(station)],
+                         ['psm3_sacramento_30.csv', 'psm3_sacramento_60.csv'])
+
+    def test_max_distance_cutoff(self):
+        # Fresno is about 160 km from Bakersfield and 250 km from Sacramento
+        self.assertEqual(WeatherLibrary(self.directory, 200).nearest(36.74, -119.79).name,
+                         'BAKERSFIELD MEADOWS FIELD')
+        self.assertIsNone(WeatherLibrary(self.directory, 100).nearest(36.74, -119.79))
+        with override_settings(CALCULATOR_WEATHER_MAX_DISTANCE_KM=100):
+            weather.library.cache_clear()
+            self.assertIsNone(weather.pv_profile(36.74, -119.79))
+            self.assertEqual(weather.pv_profiles(36.74, -119.79), [])
+
+
+class IrradianceCacheTests(WeatherFixtureTestCase):
+
+    def test_parsed_once_then_memory_mapped(self):
+        station = self.station('723840TYA.csv')
+        parsed = WeatherLibrary(self.directory).irradiance(station)
+        self.assertEqual(len(list((self.directory / '.cache').glob('723840TYA-*.npy'))), 1)
+        with mock.patch.object(weather, '_parse_irradiance') as parse:
+            cached = WeatherLibrary(self.directory).irradiance(station)
+        parse.assert_not_called()
+        self.assertIsInstance(cached, np.memmap)
+        np.testing.assert_array_equal(cached, parsed)
+
+    def test_edited_file_is_parsed_again(self):
+        path = self.directory / '723840TYA.csv'
+        WeatherLibrary(self.directory).irradiance(_read_header(path))
+        with open(path, 'a') as handle:
+            handle.write('01/03/1991,01:00,0,0,0\n')
+        data = WeatherLibrary(self.directory).irradiance(_read_header(path))
+        self.assertEqual(data.shape, (8, 49))
+        self.assertEqual(len(list((self.directory / '.cache').glob('723840TYA-*.npy'))), 2)
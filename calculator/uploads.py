@@ -0,0 +1,112 @@
+"""
+Upload handler that parses energy data files while they are being received.
+
+Installed first in FILE_UPLOAD_HANDLERS. For the energy data file fields
+of the upload views it hashes each chunk and feeds it to the incremental
+parser from calculator.ingest as Django's multipart parser hands it over.
+A file of an unsupported type, one whose first bytes don't
+look like interval data, or one over CALCULATOR_MAX_UPLOAD_SIZE is
+skipped on the spot and the rest of it is discarded unbuffered. Chunks
+are passed on unchanged, so Django's own handlers still build the
+UploadedFile.
+
+Under WSGI the multipart parser reads the request body from the socket
+as it goes, so parsing overlaps the transfer and an oversized or foreign
+file is dropped before the rest of it arrives. Under ASGI Django reads the
+whole body into a spooled file before any handler runs
+(ASGIHandler.read_body); the file is still parsed in the same single pass,
+but only once it has been received in full.
+
+Views pick the outcome up with streamed_upload() and upload_rejection().
+"""
+import hashlib
+from typing import Dict, NamedTuple, Optional
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.template.defaultfilters import filesizeformat
+
+from .ingest import parser_for
+
+
+DEFAULT_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+# url name -> file field handled there
+ENERGY_DATA_FIELDS = {
+    'energy_profile_form': 'energy_data_file',
+    'ajax_file_upload': 'file',
+}
+
+
+def max_upload_size() -> int:
+    return getattr(settings, 'CALCULATOR_MAX_UPLOAD_SIZE', DEFAULT_MAX_UPLOAD_SIZE)
+
+
+class StreamedUpload(NamedTuple):
+    digest: str  # SHA-256 of the file's bytes, as calculator.intervalstore.content_hash
+    parsed: Optional[Dict]
+    size: int
+
+
+class EnergyDataUploadHandler(FileUploadHandler):
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.results: Dict[str, StreamedUpload] = {}
+        self.rejections: Dict[str, str] = {}
+        self.activated = False
+
+    def _handles(self, field_name: str) -> bool:
+        match = getattr(self.request, 'resolver_match', None)
+        return match is not None and ENERGY_DATA_FIELDS.get(match.url_name) == field_name
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        super().new_file(field_name, file_name, *args, **kwargs)
+        self.activated = self._handles(field_name)
+        if not self.activated:
+            return
+        self.parser = parser_for(file_name)
+        if self.parser is None:
+            self._reject('Only CSV and XML files are allowed.')
+        self.hasher = hashlib.sha256()
+        self.limit = max_upload_size()
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.activated:
+            if start + len(raw_data) > self.limit:
+                self._reject(f'File size must be under {filesizeformat(self.limit)}.')
+            self.hasher.update(raw_data)
+            if not self.parser.feed(raw_data):
+                self._reject(f'Could not parse the uploaded file: {self.parser.rejected}')
+        return raw_data
+
+    def file_complete(self, file_size):
+        if self.activated:
+            self.results[self.field_name] = StreamedUpload(
+                self.hasher.hexdigest(), self.parser.finish(), file_size)
+            self.activated = False
+        # Let the next handler return the UploadedFile
+        return None
+
+    def _reject(self, reason: str):
+        self.rejections[self.field_name] = reason
+        self.activated = False
+        raise SkipFile(reason)
+
+
+def _handler(request) -> Optional[EnergyDataUploadHandler]:
+    for handler in request.upload_handlers:
+        if isinstance(handler, EnergyDataUploadHandler):
+            return handler
+    return None
+
+
+def streamed_upload(request, field_name: str) -> Optional[StreamedUpload]:
+    """What the handler parsed for ``field_name``, if it saw that file"""
+    handler = _handler(request)
+    return handler.results.get(field_name) if handler is not None else None
+
+
+def upload_rejection(request, field_name: str) -> Optional[str]:
+    """Why the handler skipped the ``field_name`` file, if it did"""
+    handler = _handler(request)
+    return handler.rejections.get(field_name) if handler is not None else None
@@ -14,4 +14,10 @@ urlpatterns = [
     path('help/', views.help_page, name='help'),
     path('my-calculations/', views.my_calculations, name='my_calculations'),
     path('ajax/file-upload/', views.ajax_file_upload, name='ajax_file_upload'),
+    path('api/calculate/', views.api_calculate, name='api_calculate'),
+    path('results/<int:pk>/chart-data/', views.chart_data, name='chart_data'),
+    path('api/portfolio/', views.api_portfolio, name='api_portfolio'),
+    path('sensitivity/', views.sensitivity_analysis, name='sensitivity_analysis'),
+    path('sweep/', views.sweep_stream, name='sweep_stream'),
+    path('metrics', views.metrics, name='metrics'),
 ] 
\ No newline at end of file
@@ -1,9 +1,25 @@
-import math
+"""
+Scalar PV, battery and financial engines, and the energy-file parsers.
+
+parse_csv_energy_data and parse_xml_energy_data read the whole file;
+uploads go through calculator.ingest instead, and these stay as the
+reference it is checked against.
+"""
 import csv
+import logging
+import math
 import xml.etree.ElementTree as ET
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional
 
+from .ingest import CSVEnergyParser, GreenButtonParser, parse_stream
+from .instrumentation import timed
+from .memprofile import profiled
+from .weather import pv_profile
+
+
+logger = logging.getLogger('calculator.utils')
+
 
 def calculate_solar_irradiance(latitude: float, longitude: float, month: int) -> float:
     """
@@ -162,62 +178,6 @@ def calculate_annual_savings(grid_import: List[float], grid_export: List[float],
     return net_cost_with_system
 
 
-def run_complete_calculation(energy_profile, pv_system, bess_system, financial_params):
-    """
-    Run complete calculation for PV + BESS system.
-    Returns detailed results including monthly breakdowns.
-    """
-    # Get monthly consumption data
-    monthly_consumption = energy_profile.get_monthly_consumption()
-    
-    # Calculate PV production
-    monthly_pv_production = calculate_pv_production(
-        monthly_consumption, pv_system.system_size_kw,
-        pv_system.latitude, pv_system.longitude,
-        pv_system.tilt_angle, pv_system.azimuth,
-        pv_system.system_efficiency
-    )
-    
-    # Calculate BESS operation
-    bess_results = calculate_bess_operation(
-        monthly_consumption, monthly_pv_production,
-        bess_system.capacity_kwh, bess_system.usable_capacity_kwh,
-        bess_system.max_charge_rate_kw, bess_system.max_discharge_rate_kw,
-        bess_system.round_trip_efficiency, bess_system.control_strategy
-    )
-    
-    # Calculate financial metrics
-    financial_results = calculate_financial_metrics(
-        pv_system.system_size_kw, bess_system.capacity_kwh,
-        bess_results['total_savings'] * financial_params.electricity_rate,
-        financial_params.pv_cost_per_kw, financial_params.bess_cost_per_kwh,
-        financial_params.installation_cost_percent, financial_params.federal_tax_credit,
-        financial_params.state_incentive, financial_params.discount_rate,
-        financial_params.electricity_inflation, financial_params.system_lifetime
-    )
-    
-    # Prepare detailed monthly results
-    monthly_results = []
-    for i in range(12):
-        monthly_results.append({
-            'month': i + 1,
-            'consumption': monthly_consumption[i],
-            'pv_production': monthly_pv_production[i],
-            'bess_energy': bess_results['monthly_bess_energy'][i],
-            'grid_energy': bess_results['monthly_grid_energy'][i],
-            'savings': bess_results['monthly_savings'][i]
-        })
-    
-    return {
-        'monthly_results': monthly_results,
-        'financial_results': financial_results,
-        'bess_results': bess_results,
-        'total_consumption': sum(monthly_consumption),
-        'total_pv_production': sum(monthly_pv_production),
-        'annual_savings': bess_results['total_savings'] * financial_params.electricity_rate
-    }
-
-
 def quick_calculation(annual_consumption: float, system_size: float, 
                      battery_capacity: float, electricity_rate: float,
                      pv_cost_per_kw: float = 2000, battery_cost_per_kwh: float = 500) -> Dict:
@@ -282,8 +242,13 @@ def calculate_pv_production(monthly_consumption: List[float], pv_size_kw: float,
                           azimuth: float = 180, system_efficiency: float = 0.75) -> List[float]:
     """
     Calculate monthly PV production based on location and system parameters.
-    Uses simplified solar radiation model.
+    Uses the nearest local TMY weather station when there is one
+    (calculator.weather), else a simplified solar radiation model.
     """
+    profile = pv_profile(latitude, longitude, tilt_angle, azimuth)
+    if profile is not None:
+        return (profile.monthly_kwh * system_efficiency * pv_size_kw).tolist()
+    
     # Monthly solar radiation data (kWh/m²/day) for different latitudes
     # This is a simplified model - in practice, you'd use more sophisticated solar data
     solar_radiation = {
@@ -322,9 +287,12 @@ def calculate_bess_operation(monthly_consumption: List[float], monthly_pv_produc
                            bess_capacity_kwh: float, usable_capacity_kwh: float,
                            max_charge_rate_kw: float, max_discharge_rate_kw: float,
                            round_trip_efficiency: float = 0.90,
-                           control_strategy: str = 'self_consumption') -> Dict:
+                           control_strategy: str = 'self_consumption',
+                           monthly_peak_demand: Optional[List[float]] = None) -> Dict:
     """
     Calculate BESS operation and energy savings.
+    ``monthly_peak_demand`` (kW per month, e.g. measured from interval data)
+    is used by peak shaving; months without one fall back to the average load.
     """
     monthly_savings = []
     monthly_bess_energy = []
@@ -371,7 +339,10 @@ def calculate_bess_operation(monthly_consumption: List[float], monthly_pv_produc
             
         else:  # peak_shaving
             # Peak demand shaving
-            peak_demand = daily_consumption / 24  # Simplified peak calculation
+            if monthly_peak_demand and monthly_peak_demand[i] > 0:
+                peak_demand = monthly_peak_demand[i]
+            else:
+                peak_demand = daily_consumption / 24  # Simplified peak calculation
             target_peak = peak_demand * 0.8  # Reduce peak by 20%
             
             bess_discharge = min(peak_demand - target_peak, max_discharge_rate_kw * 24)
@@ -448,6 +419,7 @@ def calculate_financial_metrics(pv_size_kw: float, bess_capacity_kwh: float,
     }
 
 
+@profiled('parse_energy_data_file')
 def parse_energy_data_file(file) -> Optional[Dict[str, List[float]]]:
     """
     Parse uploaded CSV or XML file to extract monthly energy consumption data.
@@ -457,14 +429,16 @@ def parse_energy_data_file(file) -> Optional[Dict[str, List[float]]]:
         file_extension = file.name.lower()
         
         if file_extension.endswith('.csv'):
-            return parse_csv_energy_data(file)
+            with timed('parse_csv'):
+                return parse_stream(CSVEnergyParser(), file)
         elif file_extension.endswith('.xml'):
-            return parse_xml_energy_data(file)
+            with timed('parse_xml'):
+                return parse_stream(GreenButtonParser(), file)
         else:
             return None
             
     except Exception as e:
-        print(f"Error parsing file: {e}")
+        logger.warning("Error parsing file: %s", e)
         return None
 
 
@@ -537,9 +511,9 @@ def parse_csv_energy_data(file) -> Optional[Dict[str, List[float]]]:
                 except ValueError:
                     continue
                 
-                # Parse delivered energy value (convert Wh to kWh)
+                # SCE's CSV export is already in kWh per interval (e.g. "0.100")
                 try:
-                    delivered_value = float(delivered_str.replace(',', '')) / 1000.0
+                    delivered_value = float(delivered_str.replace(',', ''))
                     monthly_data['consumption'][month] += delivered_value
                     monthly_data['dates'].append(date_str)
                     monthly_data['values'].append(delivered_value)
@@ -556,7 +530,7 @@ def parse_csv_energy_data(file) -> Optional[Dict[str, List[float]]]:
             return None
             
     except Exception as e:
-        print(f"Error parsing CSV: {e}")
+        logger.warning("Error parsing CSV: %s", e)
         return None
 
 
@@ -632,7 +606,7 @@ def parse_xml_energy_data(file) -> Optional[Dict[str, List[float]]]:
             return None
             
     except Exception as e:
-        print(f"Error parsing XML: {e}")
+        logger.warning("Error parsing XML: %s", e)
         return None
 
 
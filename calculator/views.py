@@ -1,15 +1,54 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (Http404, HttpResponse, JsonResponse, HttpResponseNotAllowed,
+                         StreamingHttpResponse)
+from django.template.defaultfilters import filesizeformat
+from asgiref.sync import sync_to_async
+from functools import partial
 import json
+import logging
 
-from .models import EnergyProfile, PVSystem, BESSSystem, FinancialParameters, CalculationResult
+from .models import (EnergyProfile, PVSystem, BESSSystem, FinancialParameters, CalculationResult,
+                     get_latest_inputs, aget_latest_inputs)
 from .forms import (EnergyProfileForm, PVSystemForm, BESSSystemForm, 
                    FinancialParametersForm, QuickCalculatorForm)
-from .utils import run_complete_calculation, quick_calculation, parse_energy_data_file, get_most_recent_12_months
+from .calculation import ANALYSES, run_complete_calculation
+from .utils import quick_calculation, get_most_recent_12_months
+from . import compute
+from .charts import get_chart_series
+from .intervalstore import parse_upload
+from .quality import summary as quality_summary
+from .uploads import max_upload_size, streamed_upload, upload_rejection
+from .loadshape import load_shape_from_parsed
+from .instrumentation import is_public, render_prometheus, timed
+from .sensitivity import run_sensitivity
+from .sweep import SweepError, SweepRun, parse_axis
+from .middleware import DISCONNECT_SCOPE_KEY
+from .portfolio import PortfolioTooLarge, max_request_profiles, run_portfolio
+from .decorators import aget_user, async_login_required, async_csrf_exempt
+
+
+logger = logging.getLogger('calculator.views')
+
+
+async def _arender(request, template_name, context=None):
+    """render() for coroutine views; context processors may hit the database"""
+    with timed('render'):
+        return await sync_to_async(render)(request, template_name, context)
+
+
+def _measured_peak(load_shape):
+    """Measured peak kW of an upload, or None if it has no interval times"""
+    if load_shape is None:
+        return None
+    return float(load_shape.peak_kw.max())
+
+
+def _read_post(request):
+    """Parse the (possibly multipart) request body"""
+    return request.POST, request.FILES
 
 
 def home(request):
@@ -43,37 +82,40 @@ def detailed_calculator(request):
     return render(request, 'calculator/detailed_calculator.html')
 
 
-@login_required
-def energy_profile_form(request):
+@async_login_required
+async def energy_profile_form(request):
     """Energy profile form with file upload support"""
     if request.method == 'POST':
-        print(f"POST data keys: {list(request.POST.keys())}")
-        print(f"FILES keys: {list(request.FILES.keys())}")
+        # Multipart parsing reads the spooled body, so keep it off the event loop
+        post, files = await sync_to_async(_read_post, thread_sensitive=False)(request)
+        logger.debug('Energy profile POST fields %s, files %s', list(post), list(files))
         
-        form = EnergyProfileForm(request.POST)
+        form = EnergyProfileForm(post)
         if form.is_valid():
             energy_profile = form.save(commit=False)
-            energy_profile.user = request.user
+            energy_profile.user = await aget_user(request)
             
             # Handle file upload (either direct upload or AJAX-populated values)
-            if 'energy_data_file' in request.FILES:
+            if 'energy_data_file' in files:
                 # Direct file upload during form submission
-                uploaded_file = request.FILES['energy_data_file']
+                uploaded_file = files['energy_data_file']
                 
                 # Validate file size and type
-                if uploaded_file.size > 10 * 1024 * 1024:
-                    messages.error(request, "File size must be under 10MB.")
-                    return render(request, 'calculator/energy_profile_form.html', {'form': form})
+                if uploaded_file.size > max_upload_size():
+                    messages.error(request, f"File size must be under {filesizeformat(max_upload_size())}.")
+                    return await _arender(request, 'calculator/energy_profile_form.html', {'form': form})
                 
                 allowed_extensions = ['.csv', '.xml']
                 file_extension = uploaded_file.name.lower()
                 if not any(file_extension.endswith(ext) for ext in allowed_extensions):
                     messages.error(request, "Only CSV and XML files are allowed.")
-                    return render(request, 'calculator/energy_profile_form.html', {'form': form})
+                    return await _arender(request, 'calculator/energy_profile_form.html', {'form': form})
                 
-                parsed_data = parse_energy_data_file(uploaded_file)
+                data_hash, parsed_data = await sync_to_async(parse_upload, thread_sensitive=False)(
+                    uploaded_file, streamed_upload(request, 'energy_data_file'))
                 
                 if parsed_data:
+                    energy_profile.data_hash = data_hash
                     # Get the most recent 12 months of data
                     monthly_consumption = get_most_recent_12_months(parsed_data)
                     
@@ -90,21 +132,33 @@ def energy_profile_form(request):
                     energy_profile.oct_consumption = monthly_consumption[9]
                     energy_profile.nov_consumption = monthly_consumption[10]
                     energy_profile.dec_consumption = monthly_consumption[11]
+                    load_shape = load_shape_from_parsed(parsed_data)
+                    energy_profile.set_load_shape(load_shape)
+                    if not energy_profile.peak_demand:
+                        # Left blank, so use the measured peak
+                        energy_profile.peak_demand = _measured_peak(load_shape) or 0
                     
-                    messages.success(request, f"Successfully parsed {len(parsed_data['dates'])} data points from uploaded file.")
+                    messages.success(request, f"Successfully parsed {len(parsed_data['values'])} data points from uploaded file.")
+                    if parsed_data.get('quality'):
+                        messages.info(request, quality_summary(parsed_data['quality']))
                 else:
                     messages.error(request, "Could not parse the uploaded file. Please check the file format.")
+            elif upload_rejection(request, 'energy_data_file'):
+                # Skipped while it was being received (see calculator.uploads)
+                messages.error(request, upload_rejection(request, 'energy_data_file'))
+                return await _arender(request, 'calculator/energy_profile_form.html', {'form': form})
             else:
                 # No file uploaded, but form has monthly consumption data (from AJAX upload)
                 # The form validation ensures we have valid monthly data
                 messages.success(request, 'Energy profile created from manual entry data.')
             
-            energy_profile.save()
+            with timed('orm'):
+                await energy_profile.asave()
             messages.success(request, 'Energy profile created successfully!')
             return redirect('calculator:pv_system_form')
         else:
             # Form is invalid - show validation errors
-            print(f"Form errors: {form.errors}")
+            logger.debug('Energy profile form errors: %s', form.errors.as_json())
             messages.error(request, 'Please correct the errors below.')
             for field, errors in form.errors.items():
                 for error in errors:
@@ -112,7 +166,7 @@ def energy_profile_form(request):
     else:
         form = EnergyProfileForm()
     
-    return render(request, 'calculator/energy_profile_form.html', {'form': form})
+    return await _arender(request, 'calculator/energy_profile_form.html', {'form': form})
 
 
 @login_required
@@ -166,26 +220,36 @@ def financial_parameters_form(request):
     return render(request, 'calculator/financial_parameters_form.html', {'form': form})
 
 
-@login_required
-def detailed_calculator(request):
+@async_login_required
+async def detailed_calculator(request):
     """Detailed calculator with all parameters"""
+    user = await aget_user(request)
+    
     # Get the most recent data for each component
     try:
-        energy_profile = EnergyProfile.objects.filter(user=request.user).latest('created_at')
-        pv_system = PVSystem.objects.filter(user=request.user).latest('created_at')
-        bess_system = BESSSystem.objects.filter(user=request.user).latest('created_at')
-        financial_params = FinancialParameters.objects.filter(user=request.user).latest('created_at')
+        with timed('orm'):
+            energy_profile, pv_system, bess_system, financial_params = await aget_latest_inputs(user)
     except (EnergyProfile.DoesNotExist, PVSystem.DoesNotExist, 
             BESSSystem.DoesNotExist, FinancialParameters.DoesNotExist):
         messages.error(request, 'Please complete all previous steps first.')
         return redirect('calculator:energy_profile_form')
     
-    # Run calculation
-    results = run_complete_calculation(energy_profile, pv_system, bess_system, financial_params)
+    # Run calculation on the compute pool
+    try:
+        with timed('compute'):
+            results = await compute.arun(partial(run_complete_calculation, interval_series=True,
+                                                 analyses=ANALYSES),
+                                         energy_profile, pv_system, bess_system, financial_params)
+    except compute.ComputePoolBusy:
+        messages.error(request, 'The calculator is busy right now. Please try again in a moment.')
+        return redirect('calculator:home')
+    except compute.ComputeTimeout:
+        messages.error(request, 'The calculation took too long to complete. Please try again.')
+        return redirect('calculator:home')
     
     # Save calculation result
-    calculation_result = CalculationResult.objects.create(
-        user=request.user,
+    calculation_result = CalculationResult(
+        user=user,
         name=f"Calculation {energy_profile.name}",
         energy_profile=energy_profile,
         pv_system=pv_system,
@@ -201,9 +265,12 @@ def detailed_calculator(request):
     # Store detailed results as JSON
     calculation_result.set_monthly_results(results['monthly_results'])
     calculation_result.set_annual_results(results['financial_results'])
-    calculation_result.save()
+    start, series = results.pop('interval_series')
+    calculation_result.set_interval_results(series, 60, start)
+    with timed('orm'):
+        await calculation_result.asave()
     
-    return render(request, 'calculator/detailed_calculator.html', {
+    return await _arender(request, 'calculator/detailed_calculator.html', {
         'results': results,
         'energy_profile': energy_profile,
         'pv_system': pv_system,
@@ -222,24 +289,36 @@ def help_page(request):
     return render(request, 'calculator/help.html')
 
 
-@csrf_exempt
-@require_http_methods(["POST"])
-def ajax_file_upload(request):
+@async_csrf_exempt
+async def ajax_file_upload(request):
     """AJAX endpoint for file upload processing"""
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    
     try:
-        if 'file' not in request.FILES:
+        post, files = await sync_to_async(_read_post, thread_sensitive=False)(request)
+        if 'file' not in files:
+            rejection = upload_rejection(request, 'file')
+            if rejection:
+                return JsonResponse({'success': False, 'error': rejection}, status=400)
             return JsonResponse({'error': 'No file uploaded'}, status=400)
         
-        uploaded_file = request.FILES['file']
-        parsed_data = parse_energy_data_file(uploaded_file)
+        uploaded_file = files['file']
+        # Stores the parsed columns, so the form submission that follows reuses them
+        _, parsed_data = await sync_to_async(parse_upload, thread_sensitive=False)(
+            uploaded_file, streamed_upload(request, 'file'))
         
         if parsed_data:
             monthly_consumption = get_most_recent_12_months(parsed_data)
+            load_shape = load_shape_from_parsed(parsed_data)
             return JsonResponse({
                 'success': True,
                 'monthly_data': monthly_consumption,
-                'total_records': len(parsed_data['dates']),
-                'message': f"Successfully parsed {len(parsed_data['dates'])} data points"
+                'peak_demand': _measured_peak(load_shape),
+                'load_shape': load_shape.to_dict() if load_shape is not None else None,
+                'total_records': len(parsed_data['values']),
+                'data_quality': parsed_data.get('quality'),
+                'message': f"Successfully parsed {len(parsed_data['values'])} data points"
             })
         else:
             return JsonResponse({
@@ -257,14 +336,19 @@ def ajax_file_upload(request):
 @login_required
 def my_calculations(request):
     """View user's calculation history"""
-    calculations = CalculationResult.objects.filter(user=request.user).order_by('-created_at')
+    calculations = (
+        CalculationResult.objects.filter(user=request.user)
+        .select_related('energy_profile', 'pv_system', 'bess_system', 'financial_params')
+        .defer('interval_results', 'energy_profile__load_shape')
+        .order_by('-created_at')
+    )
     return render(request, 'calculator/my_calculations.html', {
         'calculations': calculations
     })
 
 
-@csrf_exempt
-def api_calculate(request):
+@async_csrf_exempt
+async def api_calculate(request):
     """API endpoint for calculations"""
     if request.method == 'POST':
         try:
@@ -278,8 +362,8 @@ def api_calculate(request):
             pv_cost_per_kw = data.get('pv_cost_per_kw', 2000)
             battery_cost_per_kwh = data.get('battery_cost_per_kwh', 500)
             
-            # Run calculation
-            results = quick_calculation(
+            # Run calculation on a worker thread, off the event loop
+            results = await sync_to_async(quick_calculation, thread_sensitive=False)(
                 annual_consumption=annual_consumption,
                 system_size=system_size,
                 battery_capacity=battery_capacity,
@@ -307,4 +391,185 @@ def api_calculate(request):
     return JsonResponse({
         'success': False,
         'error': 'Only POST method allowed'
-    }, status=405) 
\ No newline at end of file
+    }, status=405) 
+
+
+@login_required
+def chart_data(request, pk):
+    """Downsampled chart series for a saved calculation"""
+    result = get_object_or_404(
+        CalculationResult.objects.defer('interval_results'), pk=pk, user=request.user
+    )
+    
+    try:
+        width = int(request.GET.get('width', 800))
+        start = request.GET.get('start')
+        end = request.GET.get('end')
+        start = int(start) if start not in (None, '') else None
+        end = int(end) if end not in (None, '') else None
+    except ValueError:
+        return JsonResponse({
+            'success': False,
+            'error': 'width, start and end must be integers'
+        }, status=400)
+    if (width < 1 or (start is not None and start < 0) or (end is not None and end < 0)
+            or (start is not None and end is not None and start > end)):
+        return JsonResponse({
+            'success': False,
+            'error': 'width must be positive and 0 <= start <= end'
+        }, status=400)
+    
+    names = [name for name in request.GET.get('series', '').split(',') if name]
+    data = get_chart_series(result, names or None, width, start, end)
+    return JsonResponse({'success': True, **data})
+
+
+def metrics(request):
+    """
+    Stage and request latency histograms in Prometheus text format, for
+    this web process only. Staff-only unless CALCULATOR_TIMING_PUBLIC.
+    """
+    if not (is_public() or request.user.is_staff):
+        raise Http404
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def _parse_step(value):
+    """'relative:0.1' or 'absolute:100' -> ('relative', 0.1)"""
+    kind, _, amount = value.partition(':')
+    if kind not in ('relative', 'absolute'):
+        raise ValueError(f"Unknown step kind '{kind}'")
+    return kind, float(amount)
+
+
+@async_login_required
+async def sensitivity_analysis(request):
+    """
+    Tornado-chart data for the user's latest inputs.
+    ?default=relative:0.1&step=financial_params.bess_cost_per_kwh:absolute:100
+    """
+    user = await aget_user(request)
+    try:
+        default_step = _parse_step(request.GET.get('default', 'relative:0.1'))
+        steps = {}
+        for value in request.GET.getlist('step'):
+            field, _, step = value.partition(':')
+            steps[field] = _parse_step(step)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    try:
+        with timed('orm'):
+            energy_profile, pv_system, bess_system, financial_params = await aget_latest_inputs(user)
+    except (EnergyProfile.DoesNotExist, PVSystem.DoesNotExist,
+            BESSSystem.DoesNotExist, FinancialParameters.DoesNotExist):
+        return JsonResponse({
+            'success': False,
+            'error': 'Please complete all previous steps first.'
+        }, status=400)
+    
+    try:
+        with timed('compute'):
+            results = await compute.arun(run_sensitivity, energy_profile, pv_system,
+                                         bess_system, financial_params, steps, default_step)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except (compute.ComputePoolBusy, compute.ComputeTimeout) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=503)
+    
+    return JsonResponse({'success': True, **results})
+
+
+@async_login_required
+async def sweep_stream(request):
+    """
+    Server-Sent Events stream of a sizing sweep over the user's latest inputs.
+    ?axis=pv_system.system_size_kw:4,6,8&axis=bess_system.capacity_kwh:0:20:5
+    """
+    user = await aget_user(request)
+    axes = request.GET.getlist('axis')
+    if not axes:
+        return JsonResponse({'success': False, 'error': 'Give at least one axis'}, status=400)
+    
+    try:
+        with timed('orm'):
+            energy_profile, pv_system, bess_system, financial_params = await aget_latest_inputs(user)
+    except (EnergyProfile.DoesNotExist, PVSystem.DoesNotExist,
+            BESSSystem.DoesNotExist, FinancialParameters.DoesNotExist):
+        return JsonResponse({
+            'success': False,
+            'error': 'Please complete all previous steps first.'
+        }, status=400)
+    
+    try:
+        sweep = SweepRun(energy_profile, pv_system, bess_system, financial_params,
+                         [parse_axis(axis) for axis in axes], pool=compute.get_pool())
+    except SweepError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    if isinstance(request, ASGIRequest):
+        events = sweep.events(request.scope.get(DISCONNECT_SCOPE_KEY))
+    else:
+        # WSGI: closing the generator on a failed write cancels the rest
+        events = iter(sweep)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+def api_portfolio(request):
+    """
+    Evaluate one design across every stored energy profile (staff only).
+    POST {"pv_system": id, "bess_system": id, "financial_params": id,
+          "max_payback_years": 8, "top": 50}; ids default to the caller's latest inputs.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Staff access required'}, status=403)
+    
+    try:
+        data = json.loads(request.body or '{}')
+        max_payback_years = data.get('max_payback_years')
+        max_payback_years = float(max_payback_years) if max_payback_years is not None else None
+        top = int(data.get('top', 50))
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Invalid JSON data'}, status=400)
+    
+    try:
+        with timed('orm'):
+            if all(data.get(key) for key in ('pv_system', 'bess_system', 'financial_params')):
+                pv_system = PVSystem.objects.get(pk=data['pv_system'])
+                bess_system = BESSSystem.objects.get(pk=data['bess_system'])
+                financial_params = FinancialParameters.objects.get(pk=data['financial_params'])
+            else:
+                _, pv_system, bess_system, financial_params = get_latest_inputs(request.user)
+    except (EnergyProfile.DoesNotExist, PVSystem.DoesNotExist,
+            BESSSystem.DoesNotExist, FinancialParameters.DoesNotExist) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    try:
+        with timed('compute'):
+            run = run_portfolio(pv_system, bess_system, financial_params,
+                                name=data.get('name') or f'Portfolio {pv_system.name} + {bess_system.name}',
+                                user=request.user, max_payback_years=max_payback_years,
+                                pool=compute.get_pool(),
+                                max_profiles=max_request_profiles())
+    except PortfolioTooLarge as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=413)
+    except compute.ComputePoolBusy as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=503)
+    
+    results = run.results.values('rank', 'energy_profile_id', 'annual_savings',
+                                 'payback_period_years', 'npv_25_years')[:top]
+    return JsonResponse({
+        'success': True,
+        'run': run.pk,
+        'profile_count': run.profile_count,
+        'qualifying_count': run.qualifying_count,
+        'duration_seconds': run.duration_seconds,
+        'results': list(results),
+    })
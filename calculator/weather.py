@@ -0,0 +1,346 @@
+"""
+Local typical-meteorological-year (TMY) weather library.
+
+Drop TMY CSVs into CALCULATOR_WEATHER_DIR, in either of the two usual
+layouts:
+
+* TMY3: a ``USAF,Name,State,TZ,latitude,longitude,elevation`` line, then a
+  header row with ``Date (MM/DD/YYYY)``, ``Time (HH:MM)``, ``GHI (W/m^2)``,
+  ``DNI (W/m^2)`` and ``DHI (W/m^2)`` columns (hour-ending times);
+* NSRDB PSM3: a names line and a values line with Latitude, Longitude and
+  Time Zone, then ``Year,Month,Day,Hour,Minute,...,GHI,DNI,DHI`` rows.
+
+The first use in a process reads only each file's header lines and builds
+a KD-tree over the station coordinates, taken as points on the unit sphere
+so the straight-line nearest station is also the great-circle nearest.
+Resolving a PVSystem's latitude/longitude is then a few comparisons.
+
+A station's irradiance is parsed once and cached next to its file as a
+small float32 ``.npy`` (month, hour, GHI, DNI, DHI, the sun's declination
+and hour angle, and the hours each row covers: PSM3 downloads may be
+half-hourly), which later processes memory-map. PV per kW
+for a (station, tilt, azimuth) is a handful of vector operations over the
+year, memoized, so a weather-based estimate costs about as much as the
+latitude-band table it replaces. Without a station within
+CALCULATOR_WEATHER_MAX_DISTANCE_KM the engines keep the table.
+
+Several files at the same coordinates (e.g. one PSM3 download per year)
+are weather years of one site: single-year estimates use the first by
+file name, and calculator.ensemble runs across all of them.
+"""
+import csv
+import functools
+import math
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .loadshape import HOURS, MONTHS
+
+
+EARTH_RADIUS_KM = 6371.0
+DEFAULT_MAX_DISTANCE_KM = 250.0
+GROUND_ALBEDO = 0.2
+CACHE_DIR_NAME = '.cache'
+# Rows of a station's cached array
+MONTH, HOUR, GHI, DNI, DHI, DECLINATION, HOUR_ANGLE, DURATION = range(8)
+_DAYS_BEFORE_MONTH = np.concatenate(([0], np.cumsum([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30])))
+
+
+class Station(NamedTuple):
+    path: Path
+    name: str
+    latitude: float
+    longitude: float
+    timezone: float  # hours from UTC, standard time
+    layout: str  # 'tmy3' or 'psm3'
+
+
+def _unit_vector(latitude: float, longitude: float) -> Tuple[float, float, float]:
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+class KDTree:
+    """
+    Static 3-d tree for nearest-neighbour queries. The tree is implicit in a
+    permutation of the points: the median of each slice is its node, the
+    halves on either side its subtrees.
+    """
+
+    def __init__(self, points):
+        points = np.asarray(points, dtype=np.float64)
+        points = points.reshape(len(points), -1) if len(points) else np.zeros((0, 3))
+        self.order = np.arange(len(points))
+        self.axes = np.zeros(len(points), dtype=np.int64)
+        self._build(points, 0, len(points))
+        # Queries walk a handful of nodes, where Python floats beat array indexing
+        self.nodes = [(tuple(points[i]), int(i)) for i in self.order]
+        self.node_axes = self.axes.tolist()
+
+    def _build(self, points, lo: int, hi: int):
+        if hi - lo <= 1:
+            return
+        index = self.order[lo:hi]
+        axis = int(np.argmax(np.ptp(points[index], axis=0)))
+        mid = (lo + hi) // 2
+        self.order[lo:hi] = index[np.argpartition(points[index, axis], mid - lo)]
+        self.axes[mid] = axis
+        self._build(points, lo, mid)
+        self._build(points, mid + 1, hi)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def nearest(self, query) -> Tuple[int, float]:
+        """(index of the nearest point, squared distance to it); (-1, inf) if empty"""
+        best_index, best = -1, math.inf
+        stack = [(0, len(self.nodes), 0.0)]
+        while stack:
+            lo, hi, bound = stack.pop()
+            if lo >= hi or bound >= best:
+                continue
+            mid = (lo + hi) // 2
+            point, index = self.nodes[mid]
+            distance = ((point[0] - query[0]) ** 2 + (point[1] - query[1]) ** 2
+                        + (point[2] - query[2]) ** 2)
+            if distance < best:
+                best_index, best = index, distance
+            axis = self.node_axes[mid]
+            offset = query[axis] - point[axis]
+            near, far = ((lo, mid), (mid + 1, hi)) if offset < 0 else ((mid + 1, hi), (lo, mid))
+            # Visit the near side first; the far one only while it could still be closer
+            stack.append((*far, offset * offset))
+            stack.append((*near, 0.0))
+        return best_index, best
+
+
+def _site_key(station: Station) -> Tuple[float, float]:
+    return round(station.latitude, 3), round(station.longitude, 3)
+
+
+def _read_header(path: Path) -> Optional[Station]:
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        reader = csv.reader(handle)
+        first = next(reader, None)
+        second = next(reader, None)
+    if not first or not second:
+        return None
+    try:
+        if first[0].strip().lower() == 'source':
+            fields = {name.strip().lower(): value for name, value in zip(first, second)}
+            return Station(path, fields.get('city') or fields.get('location id') or path.stem,
+                           float(fields['latitude']), float(fields['longitude']),
+                           float(fields['time zone']), 'psm3')
+        # TMY3: USAF, name, state, TZ, latitude, longitude, elevation
+        return Station(path, first[1].strip(), float(first[4]), float(first[5]),
+                       float(first[3]), 'tmy3')
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def _column(headers: List[str], name: str) -> int:
+    for i, header in enumerate(headers):
+        if header.strip().lower().split(' (')[0] == name:
+            return i
+    raise ValueError(f'no {name} column')
+
+
+def _time_step(month: np.ndarray, day: np.ndarray, clock: np.ndarray) -> float:
+    """Hours between rows: the median gap between consecutive labels"""
+    hours = (_DAYS_BEFORE_MONTH[month - 1] + day) * 24 + clock
+    steps = np.diff(hours)
+    steps = steps[steps > 0]
+    return float(np.median(steps)) if steps.size else 1.0
+
+
+def _parse_irradiance(station: Station) -> np.ndarray:
+    """
+    (8, rows) float32: month 0-11, hour 0-23, GHI, DNI, DHI, declination,
+    hour angle and the hours a row covers
+    """
+    with open(station.path, newline='', encoding='utf-8-sig') as handle:
+        reader = csv.reader(handle)
+        skip = 2 if station.layout == 'psm3' else 1
+        for _ in range(skip):
+            next(reader)
+        headers = next(reader)
+        rows = [row for row in reader if row]
+
+    ghi, dni, dhi = (_column(headers, name) for name in ('ghi', 'dni', 'dhi'))
+    irradiance = np.array([[row[ghi], row[dni], row[dhi]] for row in rows], dtype=np.float64)
+    if station.layout == 'psm3':
+        columns = [_column(headers, name) for name in ('month', 'day', 'hour', 'minute')]
+        fields = np.array([[row[i] for i in columns] for row in rows], dtype=np.float64)
+        month, day = fields[:, 0].astype(np.int64), fields[:, 1].astype(np.int64)
+        minute = fields[:, 3]
+        start = fields[:, 2] + minute / 60
+        duration = _time_step(month, day, start)
+        if duration < 1:
+            # Interval-beginning labels
+            clock = start + duration / 2
+        else:
+            # Hour-beginning labels; a 0 minute means the value covers the whole hour
+            clock = fields[:, 2] + np.where(minute == 0, 30.0, minute) / 60
+    else:
+        date, time = _column(headers, 'date'), _column(headers, 'time')
+        month = np.array([int(row[date][:2]) for row in rows])
+        day = np.array([int(row[date][3:5]) for row in rows])
+        # Hour-ending labels ("01:00" is midnight to 1am)
+        clock = np.array([int(row[time][:2]) for row in rows], dtype=np.float64) - 0.5
+        duration = 1.0
+
+    # Solar position at the middle of each interval (Spencer's series)
+    day_of_year = _DAYS_BEFORE_MONTH[month - 1] + day
+    b = 2 * np.pi * (day_of_year - 1) / 365
+    declination = (0.006918 - 0.399912 * np.cos(b) + 0.070257 * np.sin(b)
+                   - 0.006758 * np.cos(2 * b) + 0.000907 * np.sin(2 * b)
+                   - 0.002697 * np.cos(3 * b) + 0.00148 * np.sin(3 * b))
+    equation_of_time = 229.18 * (0.000075 + 0.001868 * np.cos(b) - 0.032077 * np.sin(b)
+                                 - 0.014615 * np.cos(2 * b) - 0.040849 * np.sin(2 * b))
+    solar_time = clock + (4 * (station.longitude - 15 * station.timezone) + equation_of_time) / 60
+    hour_angle = np.radians(15 * (solar_time - 12))
+
+    return np.vstack([month - 1, np.floor(clock), irradiance.T, declination, hour_angle,
+                      np.full(len(rows), duration)]).astype(np.float32)
+
+
+class WeatherLibrary:
+    """The stations in one directory, with their KD-tree"""
+
+    def __init__(self, directory: Path, max_distance_km: float = DEFAULT_MAX_DISTANCE_KM):
+        self.directory = Path(directory)
+        self.max_distance_km = max_distance_km
+        paths = sorted(self.directory.glob('*.csv')) if self.directory.is_dir() else []
+        self.stations = [station for station in map(_read_header, paths) if station is not None]
+        # Files at the same coordinates are weather years of one site
+        self.sites: Dict[Tuple[float, float], List[Station]] = {}
+        for station in self.stations:
+            self.sites.setdefault(_site_key(station), []).append(station)
+        self.tree = KDTree([_unit_vector(s.latitude, s.longitude) for s in self.stations])
+        self._resolved = {}
+        self._irradiance: Dict[Station, np.ndarray] = {}
+
+    def __len__(self):
+        return len(self.stations)
+
+    def nearest(self, latitude: float, longitude: float) -> Optional[Station]:
+        """Closest station within max_distance_km, or None"""
+        key = (latitude, longitude)
+        if key not in self._resolved:
+            index, squared = self.tree.nearest(_unit_vector(latitude, longitude))
+            station = None
+            if index >= 0:
+                distance_km = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(squared) / 2))
+                if distance_km <= self.max_distance_km:
+                    # The site's first file, whichever of its years the tree found
+                    station = self.sites[_site_key(self.stations[index])][0]
+            # PV systems share a few sites, so this stays small
+            self._resolved[key] = station
+        return self._resolved[key]
+
+    def site_years(self, station: Station) -> List[Station]:
+        """Every weather file for the station's site, in file name order"""
+        return self.sites.get(_site_key(station), [station])
+
+    def irradiance(self, station: Station) -> np.ndarray:
+        """The station's cached (8, rows) array, parsed on first use"""
+        if station not in self._irradiance:
+            self._irradiance[station] = self._load_irradiance(station)
+        return self._irradiance[station]
+
+    def _load_irradiance(self, station: Station) -> np.ndarray:
+        stat = station.path.stat()
+        cache = station.path.parent / CACHE_DIR_NAME / f'{station.path.stem}-{stat.st_size}-{stat.st_mtime_ns}.npy'
+        if cache.exists():
+            try:
+                return np.load(cache, mmap_mode='r', allow_pickle=False)
+            except (OSError, ValueError):
+                pass
+        array = _parse_irradiance(station)
+        try:
+            cache.parent.mkdir(exist_ok=True)
+            temporary = cache.with_suffix(f'.{id(array)}.tmp')
+            with open(temporary, 'wb') as handle:
+                np.save(handle, array, allow_pickle=False)
+            temporary.replace(cache)
+        except OSError:
+            pass  # read-only weather directory: parse again next process
+        return array
+
+
+@functools.lru_cache(maxsize=None)
+def library() -> WeatherLibrary:
+    """The configured library, built once per process"""
+    return WeatherLibrary(
+        getattr(settings, 'CALCULATOR_WEATHER_DIR', Path(settings.BASE_DIR) / 'weather'),
+        getattr(settings, 'CALCULATOR_WEATHER_MAX_DISTANCE_KM', DEFAULT_MAX_DISTANCE_KM),
+    )
+
+
+class PVProfile(NamedTuple):
+    station: str
+    label: str  # the weather file it came from
+    monthly_kwh: np.ndarray  # (12,) per kW of panels at 100% system efficiency
+    month_hour_kw: np.ndarray  # (12, 24) mean output on a typical day, same basis
+
+
+@functools.lru_cache(maxsize=4096)
+def _profile(station: Station, tilt_angle: float, azimuth: float) -> PVProfile:
+    data = library().irradiance(station)
+    month = data[MONTH].astype(np.int64)
+    hour = data[HOUR].astype(np.int64)
+    ghi, dni, dhi = (data[row].astype(np.float64) for row in (GHI, DNI, DHI))
+    declination = data[DECLINATION].astype(np.float64)
+    hour_angle = data[HOUR_ANGLE].astype(np.float64)
+    duration = data[DURATION].astype(np.float64)
+
+    # Angle of incidence on the array (Duffie & Beckman); surface azimuth from south, west positive
+    latitude, tilt, surface = (math.radians(station.latitude), math.radians(tilt_angle),
+                               math.radians(azimuth - 180))
+    sin_d, cos_d = np.sin(declination), np.cos(declination)
+    cos_w = np.cos(hour_angle)
+    cos_incidence = (sin_d * (math.sin(latitude) * math.cos(tilt)
+                              - math.cos(latitude) * math.sin(tilt) * math.cos(surface))
+                     + cos_d * cos_w * (math.cos(latitude) * math.cos(tilt)
+                                        + math.sin(latitude) * math.sin(tilt) * math.cos(surface))
+                     + cos_d * np.sin(hour_angle) * math.sin(tilt) * math.sin(surface))
+    cos_zenith = sin_d * math.sin(latitude) + cos_d * cos_w * math.cos(latitude)
+    beam = np.where(cos_zenith > 0, dni * np.maximum(cos_incidence, 0.0), 0.0)
+    # Isotropic sky diffuse plus ground reflection
+    plane_of_array = (beam + dhi * (1 + math.cos(tilt)) / 2
+                      + ghi * GROUND_ALBEDO * (1 - math.cos(tilt)) / 2)
+    kwh = plane_of_array / 1000 * duration
+
+    monthly = np.bincount(month, weights=kwh, minlength=MONTHS)
+    sums = np.bincount(month * HOURS + hour, weights=kwh, minlength=MONTHS * HOURS)
+    days = np.bincount(month, weights=duration, minlength=MONTHS) / HOURS
+    with np.errstate(invalid='ignore', divide='ignore'):
+        month_hour = np.where(days[:, None] > 0, sums.reshape(MONTHS, HOURS) / days[:, None], 0.0)
+    return PVProfile(station.name, station.path.stem, monthly, month_hour)
+
+
+def pv_profile(latitude: float, longitude: float, tilt_angle: float = 30,
+               azimuth: float = 180) -> Optional[PVProfile]:
+    """Per-kW PV from the nearest station's weather, or None without one"""
+    weather = library()
+    if not len(weather):
+        return None
+    station = weather.nearest(float(latitude), float(longitude))
+    if station is None:
+        return None
+    return _profile(station, float(tilt_angle), float(azimuth))
+
+
+def pv_profiles(latitude: float, longitude: float, tilt_angle: float = 30,
+                azimuth: float = 180) -> List[PVProfile]:
+    """Per-kW PV for every weather year of the nearest site; empty without one"""
+    weather = library()
+    if not len(weather):
+        return []
+    station = weather.nearest(float(latitude), float(longitude))
+    if station is None:
+        return []
+    return [_profile(year, float(tilt_angle), float(azimuth)) for year in weather.site_years(station)]
@@ -0,0 +1,30 @@
+"""
+ASGI config for pv_bess_calculator project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with e.g. ``gunicorn pv_bess_calculator.asgi:application -k uvicorn.workers.UvicornWorker --preload``;
+loading this module builds the calculator's shared tables (calculator.preload),
+and --preload loads it once in the master so every worker shares them.
+DisconnectMiddleware lets streaming responses (the sizing sweep) stop when
+the client goes away. Every middleware in settings.MIDDLEWARE is
+async-capable, so requests stay on the event loop; static files go through
+calculator.middleware.StaticFilesMiddleware rather than WhiteNoise's
+sync-only middleware.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pv_bess_calculator.settings')
+
+application = get_asgi_application()
+
+from calculator.middleware import DisconnectMiddleware  # noqa: E402 (needs settings)
+from calculator.preload import preload_server  # noqa: E402
+
+application = DisconnectMiddleware(application)
+preload_server()
\ No newline at end of file
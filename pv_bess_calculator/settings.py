@@ -44,8 +44,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'calculator.middleware.ServerTimingMiddleware',
+    'calculator.middleware.MemoryProfileMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'calculator.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -73,6 +75,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'pv_bess_calculator.wsgi.application'
+ASGI_APPLICATION = 'pv_bess_calculator.asgi.application'
 
 
 # Database
@@ -130,6 +133,24 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Parsed uploads, as memory-mapped columns under MEDIA_ROOT (calculator.intervalstore)
+CALCULATOR_INTERVAL_STORE_DIR = 'intervals'
+
+# Energy data files are parsed while the multipart body is read (calculator.uploads;
+# under WSGI that overlaps the transfer); the default handlers that follow
+# still build the UploadedFile
+FILE_UPLOAD_HANDLERS = [
+    'calculator.uploads.EnergyDataUploadHandler',
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+CALCULATOR_MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
+# Typical-meteorological-year CSVs (TMY3 or NSRDB PSM3) used for PV
+# estimates near their stations (calculator.weather)
+CALCULATOR_WEATHER_DIR = BASE_DIR / 'weather'
+CALCULATOR_WEATHER_MAX_DISTANCE_KM = 250
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -143,4 +164,53 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Login URL
-LOGIN_URL = '/admin/login/' 
\ No newline at end of file
+LOGIN_URL = '/admin/login/' 
+
+# Compute pool for detailed calculations (see calculator/compute.py).
+# WORKERS = 0 runs calculations inline in the request thread.
+CALCULATOR_COMPUTE_POOL = {
+    'WORKERS': int(os.environ.get('CALCULATOR_COMPUTE_WORKERS', 0)),
+    'MAX_PENDING': None,
+    'QUEUE_WAIT': 2.0,
+    'TIMEOUT': 30.0,
+    'RETIRE_GRACE': 30.0,
+}
+
+# Portfolio runs started from /api/portfolio/ hold the request until their
+# results are stored, so they are capped; bigger ones go through
+# `python manage.py portfolio`
+CALCULATOR_PORTFOLIO_MAX_PROFILES = 5000
+
+# Float precision of the batch engines (calculator.batch.batch_dtype):
+# 'auto' runs batches of at least CALCULATOR_FLOAT32_MIN_ELEMENTS values in
+# float32 and everything smaller, e.g. single calculations, in float64
+CALCULATOR_BATCH_PRECISION = 'auto'
+CALCULATOR_FLOAT32_MIN_ELEMENTS = 1_000_000
+
+# tracemalloc profiles of parsing and calculation stages (calculator.memprofile):
+# False, True for every request, or 'header' for requests sending X-Profile-Memory: 1
+CALCULATOR_MEMORY_PROFILING = False
+
+# Build the read-only solar, weather and PV tables when a server loads the
+# WSGI/ASGI app (calculator.preload); with ``gunicorn --preload`` workers share one copy
+CALCULATOR_PRELOAD = True
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'calculator': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
+# Per-stage timing: Server-Timing response headers and the /metrics endpoint
+CALCULATOR_TIMING_ENABLED = True
+# Who sees the timings: True sends Server-Timing on every response and serves
+# /metrics to anyone; False drops the header and serves /metrics to staff only.
+# The histograms live in each web process, so with several workers a scrape
+# only sees the worker that answered it; run metrics-scraped deployments with
+# one web worker, or scrape every worker's port.
+CALCULATOR_TIMING_PUBLIC = DEBUG
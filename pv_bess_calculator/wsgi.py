@@ -2,6 +2,8 @@
 WSGI config for pv_bess_calculator project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+Loading it builds the calculator's shared tables (calculator.preload), so
+runserver and gunicorn workers don't build them on their first request.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/wsgi/
@@ -13,4 +15,8 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pv_bess_calculator.settings')
 
-application = get_wsgi_application() 
\ No newline at end of file
+application = get_wsgi_application()
+
+from calculator.preload import preload_server  # noqa: E402 (needs settings)
+
+preload_server()